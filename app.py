@@ -1,17 +1,60 @@
 import os
 import datetime
+import gzip
+import hashlib
+import itertools
 from dateutil.relativedelta import relativedelta
 from logzero import logger
-from flask import Flask, request, jsonify, render_template
-from flask_sqlalchemy import SQLAlchemy
+from flask import (
+    Flask,
+    Response,
+    g,
+    json,
+    request,
+    jsonify,
+    render_template,
+    stream_with_context,
+)
+from data.replicas import RoutingSQLAlchemy
 
 
 app = Flask(__name__)
 app.config.from_object(os.environ["APP_SETTINGS"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-db = SQLAlchemy(app)
+# Ids assigned on flush stay readable after commit without a refresh. Reads
+# of GET requests go to the read replicas when there are any.
+db = RoutingSQLAlchemy(app, session_options={"expire_on_commit": False})
+
+# Bytes gathered before a chunk of a streamed response is sent
+STREAM_BUFFER_SIZE = 64 * 1024
+
+from data import constants, crud
+from data.archive import archive_cache
+from data.durations import DurationSketches
+from data.sketch import DDSketch
+from data.lookups import Lookups
+
+
+@app.before_request
+def begin_unit_of_work():
+    # Each POST or PUT is committed in a single transaction once its response
+    # is ready, the crud helpers only flush
+    if request.method in ("POST", "PUT"):
+        crud.begin_unit_of_work()
+
+
+@app.after_request
+def end_unit_of_work(resp):
+    if not g.get("unit_of_work"):
+        return resp
 
-from data import crud
+    if crud.end_unit_of_work(commit=resp.status_code < 400):
+        return resp
+
+    resp = jsonify({"message": "The changes could not be saved"})
+    resp.status_code = 500
+
+    return resp
 
 
 @app.route("/")
@@ -49,13 +92,11 @@ def create_project():
     params = request.get_json(force=True)
     logger.info("/projects/%s", params)
 
-    project_check = crud.Read.project_by_name(params["name"])
+    project_id, created = crud.Create.create_project(params["name"])
 
-    if not project_check:
-        project_id = crud.Create.create_project(params["name"])
+    if created:
         message = "New project added successfully"
     else:
-        project_id = project_check.id
         message = "Project recovered successfully"
 
     data = {"message": message, "id": project_id}
@@ -79,7 +120,9 @@ def get_projects():
                     "project_id": project.id,
                     "name": project.name,
                     "data": project.data,
-                    "project_status": project.project_status.name,
+                    "project_status": Lookups.name(
+                        "project_status", project.project_status_id
+                    ),
                 }
             )
     else:
@@ -102,7 +145,7 @@ def get_project(project_id):
             "project_id": result.id,
             "name": result.name,
             "data": result.data,
-            "project_status": result.project_status.name,
+            "project_status": Lookups.name("project_status", result.project_status_id),
         }
     else:
         data = {"message": "No project with the id provided was found"}
@@ -118,12 +161,7 @@ def create_launch():
     params = request.get_json(force=True)
     logger.info("/launches/%s", params)
 
-    project_check = crud.Read.project_by_name(params["project"])
-
-    if not project_check:
-        project_id = crud.Create.create_project(params["project"])
-    else:
-        project_id = project_check.id
+    project_id, _ = crud.Create.create_project(params["project"])
 
     launch_id = crud.Create.create_launch(
         params["name"], params.get("data"), project_id
@@ -169,7 +207,7 @@ def get_launch(launch_id):
             "name": result.name,
             "data": result.data,
             "project": result.project.name,
-            "launch_status": result.launch_status.name,
+            "launch_status": Lookups.name("launch_status", result.launch_status_id),
         }
     else:
         data = {"message": "No launch with the id provided was found"}
@@ -184,12 +222,16 @@ def get_launch(launch_id):
 def get_launches_by_project_id(project_id):
     logger.info("/launches_by_project_id/%i", project_id)
 
-    result = crud.Read.launch_by_project_id(project_id)
+    etag = version_etag(crud.Read.project_version(project_id))
+    resp = not_modified(etag)
+    if resp:
+        return resp
+
+    after, limit = page_params()
+    result = crud.Read.launch_by_project_id(project_id, after, limit)
 
     if result:
-        launches = []
-        index = -1
-        launches_index = {}
+        launches = {}
         for (
             launch,
             test_run,
@@ -200,21 +242,19 @@ def get_launches_by_project_id(project_id):
             incomplete_count,
             skipped_count,
         ) in result:
-            if launches == [] or launch.id not in list(launches_index.keys()):
-                index = index + 1
-                launches_index[launch.id] = index
-                launches.append(
-                    {
-                        "launch_id": launch.id,
-                        "project_id": launch.project.id,
-                        "name": launch.name,
-                        "data": launch.data,
-                        "project": launch.project.name,
-                        "launch_status": launch.launch_status.name,
-                        "test_run_stats": [],
-                    }
-                )
-            launches[launches_index[launch.id]]["test_run_stats"].append(
+            if launch.id not in launches:
+                launches[launch.id] = {
+                    "launch_id": launch.id,
+                    "project_id": launch.project_id,
+                    "name": launch.name,
+                    "data": launch.data,
+                    "project": launch.project.name,
+                    "launch_status": Lookups.name(
+                        "launch_status", launch.launch_status_id
+                    ),
+                    "test_run_stats": [],
+                }
+            launches[launch.id]["test_run_stats"].append(
                 {
                     "test_run_id": test_run.id,
                     "test_type": test_run.test_type,
@@ -226,14 +266,17 @@ def get_launches_by_project_id(project_id):
                     "tests_skipped": skipped_count if skipped_count else 0,
                 }
             )
-        data = launches
+        launches, next_cursor = split_page(
+            list(launches.values()), limit, lambda launch: launch["launch_id"]
+        )
+        data = paged(launches, next_cursor)
     else:
         data = {"message": "No launch with the project id provided was found"}
 
     resp = jsonify(data)
     resp.status_code = 200
 
-    return resp
+    return with_etag(resp, etag)
 
 
 @app.route("/api/v1/test_run", methods=["POST"])
@@ -280,19 +323,14 @@ def update_test_run():
 def get_test_run(test_run_id):
     logger.info("/test_run/%i", test_run_id)
 
-    result = crud.Read.test_run_by_id(test_run_id)
+    keys = requested_fields(TEST_RUN_KEYS)
+    result = crud.Read.test_run_by_id(test_run_id, field_columns(TEST_RUN_FIELDS, keys))
+    if not result:
+        archived = crud.Read.archived_test_run(test_run_id)
+        result = archived[0] if archived else None
 
     if result:
-        data = {
-            "test_run_id": result.id,
-            "data": result.data,
-            "start_datetime": result.start_datetime,
-            "end_datetime": result.end_datetime,
-            "duration": diff_dates(result.start_datetime, result.end_datetime),
-            "test_type": result.test_type,
-            "test_run_status": result.test_run_status.name,
-            "launch": result.launch.name,
-        }
+        data = serialize(TEST_RUN_FIELDS, keys, result, None)
     else:
         data = {"message": "No test run with the id provided was found"}
 
@@ -306,50 +344,36 @@ def get_test_run(test_run_id):
 def get_test_runs_by_launch_id(launch_id):
     logger.info("/test_run_by_launch_id/%i", launch_id)
 
-    result = crud.Read.test_run_by_launch_id(launch_id)
+    etag = version_etag(crud.Read.launch_version(launch_id))
+    resp = not_modified(etag)
+    if resp:
+        return resp
+
+    after, limit = page_params()
+    keys = requested_fields(LAUNCH_TEST_RUN_KEYS)
+    result = crud.Read.test_run_by_launch_id(
+        launch_id, after, limit, field_columns(TEST_RUN_FIELDS, keys)
+    )
 
     if result:
-        test_runs = []
-        for (
-            test_run,
-            total_count,
-            failed_count,
-            passed_count,
-            running_count,
-            incomplete_count,
-            skipped_count,
-        ) in result:
-            test_runs.append(
-                {
-                    "test_run_id": test_run.id,
-                    "launch_id": test_run.launch.id,
-                    "project_id": test_run.launch.project.id,
-                    "data": test_run.data,
-                    "start_datetime": test_run.start_datetime,
-                    "end_datetime": test_run.end_datetime,
-                    "duration": diff_dates(
-                        test_run.start_datetime, test_run.end_datetime
-                    ),
-                    "test_type": test_run.test_type,
-                    "test_run_status": test_run.test_run_status.name,
-                    "launch_name": test_run.launch.name,
-                    "launch_status": test_run.launch.launch_status.name,
-                    "tests_total": total_count if total_count else 0,
-                    "tests_failed": failed_count if failed_count else 0,
-                    "tests_passed": passed_count if passed_count else 0,
-                    "tests_running": running_count if running_count else 0,
-                    "tests_incomplete": incomplete_count if incomplete_count else 0,
-                    "tests_skipped": skipped_count if skipped_count else 0,
-                }
+        result = list(result)
+        if not result:
+            # Runs of an archived launch are read back from its file
+            result = (
+                crud.Read.archived_test_run_by_launch_id(launch_id, after, limit) or []
             )
-        data = test_runs
+        result, next_cursor = split_page(result, limit, lambda row: row[0].id)
+        test_runs = []
+        for table in result:
+            test_runs.append(serialize(TEST_RUN_FIELDS, keys, table[0], table[1:]))
+        data = paged(test_runs, next_cursor)
     else:
         data = {"message": "No launch with the launch id provided was found"}
 
     resp = jsonify(data)
     resp.status_code = 200
 
-    return resp
+    return with_etag(resp, etag)
 
 
 @app.route("/api/v1/test_suite", methods=["POST"])
@@ -357,24 +381,15 @@ def create_test_suite():
     params = request.get_json(force=True)
     logger.info("/create_test_suite/%s", params)
 
-    project_check = crud.Read.project_by_name(params["project"])
-
-    if not project_check:
-        project_id = crud.Create.create_project(params["project"])
-    else:
-        project_id = project_check.id
+    project_id, _ = crud.Create.create_project(params["project"])
 
-    test_suite_check = crud.Read.test_suite_by_name_project_test_type(
-        params.get("name"), project_id, params.get("test_type")
+    test_suite_id, created = crud.Create.create_test_suite(
+        params.get("name"), project_id, None, params.get("test_type")
     )
 
-    if not test_suite_check:
-        test_suite_id = crud.Create.create_test_suite(
-            params.get("name"), project_id, None, params.get("test_type")
-        )
+    if created:
         message = "New test suite added successfully"
     else:
-        test_suite_id = test_suite_check.id
         message = "Test suite is already present"
 
     data = {"message": message, "test_suite_id": test_suite_id}
@@ -390,24 +405,12 @@ def create_test_suite_history():
     params = request.get_json(force=True)
     logger.info("/create_test_suite_history/%s", params)
 
-    project_check = crud.Read.project_by_name(params["project"])
-
-    if not project_check:
-        project_id = crud.Create.create_project(params["project"])
-    else:
-        project_id = project_check.id
+    project_id, _ = crud.Create.create_project(params["project"])
 
-    test_suite_check = crud.Read.test_suite_by_name_project_test_type(
-        params.get("name"), project_id, params.get("test_type")
+    test_suite_id, _ = crud.Create.create_test_suite(
+        params.get("name"), project_id, None, params.get("test_type")
     )
 
-    if not test_suite_check:
-        test_suite_id = crud.Create.create_test_suite(
-            params.get("name"), project_id, None, params.get("test_type")
-        )
-    else:
-        test_suite_id = test_suite_check.id
-
     test_suite_history_id = crud.Create.create_test_suite_history(
         params.get("data"),
         params.get("start_datetime"),
@@ -474,16 +477,13 @@ def create_test():
     params = request.get_json(force=True)
     logger.info("/create_test/%s", params)
 
-    # TODO(Juan) Check this condition for new tests.
-    test_check = crud.Read.test_by_name(params.get("name"))
+    test_id, created = crud.Create.create_test(
+        params.get("name"), None, params.get("test_suite_id")
+    )
 
-    if not test_check:
-        test_id = crud.Create.create_test(
-            params.get("name"), None, params.get("test_suite_id")
-        )
+    if created:
         message = "New test added successfully"
     else:
-        test_id = test_check.id
         message = "Test is already present"
 
     data = {"message": message, "test_id": test_id}
@@ -499,15 +499,9 @@ def create_test_history():
     params = request.get_json(force=True)
     logger.info("/create_test_history/%s", params)
 
-    # TODO(Juan) Check this condition for new tests.
-    test_check = crud.Read.test_by_name(params.get("name"))
-
-    if not test_check:
-        test_id = crud.Create.create_test(
-            params.get("name"), None, params.get("test_suite_id")
-        )
-    else:
-        test_id = test_check.id
+    test_id, _ = crud.Create.create_test(
+        params.get("name"), None, params.get("test_suite_id")
+    )
 
     test_history_id = crud.Create.create_test_history(
         params.get("start_datetime"),
@@ -528,26 +522,84 @@ def create_test_history():
     return resp
 
 
+@app.route("/api/v1/test_history/bulk", methods=["POST"])
+def create_test_histories():
+    params = request.get_json(force=True)
+    logger.info(
+        "/create_test_histories/%s/%i tests",
+        params.get("test_suite_history_id"),
+        len(params.get("tests") or []),
+    )
+
+    tests = params.get("tests")
+
+    if not isinstance(tests, list) or not all(
+        isinstance(test, dict) and test.get("name") for test in tests
+    ):
+        data = {"message": "A list of tests with a name is required"}
+
+        resp = jsonify(data)
+        resp.status_code = 400
+
+        return resp
+
+    results = crud.Create.create_test_histories(
+        tests,
+        params.get("test_run_id"),
+        params.get("test_suite_history_id"),
+        params.get("test_suite_id"),
+    )
+
+    if results is None:
+        data = {"message": "Test histories could not be added"}
+
+        resp = jsonify(data)
+        resp.status_code = 500
+
+        return resp
+
+    data = {
+        "message": "New test histories added successfully",
+        "test_histories": [
+            {"test_history_id": test_history_id, "test_id": test_id}
+            for test_history_id, test_id in results
+        ],
+    }
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
 @app.route("/api/v1/test_history", methods=["PUT"])
 def update_test_history():
     params = request.get_json(force=True)
     logger.info("/update_test_history/%s", params)
 
-    crud.Update.update_test_history(
-        params.get("test_history_id"),
-        params.get("end_datetime"),
-        params.get("trace"),
-        params.get("file"),
-        params.get("message"),
-        params.get("error_type"),
-        params.get("retries"),
-        params.get("test_status"),
-    )
+    item = {
+        "test_history_id": params.get("test_history_id"),
+        "end_datetime": params.get("end_datetime"),
+        "trace": params.get("trace"),
+        "file": params.get("file"),
+        "message": params.get("message"),
+        "error_type": params.get("error_type"),
+        "retries": params.get("retries"),
+        "test_status": params.get("test_status"),
+    }
 
-    data = {"message": "Test history updated successfully"}
+    # Accepted updates are only held in memory until the next flush, a full
+    # queue falls back to writing the update straight away
+    if app.config["WRITE_BEHIND_ENABLED"] and crud.test_history_writer.submit(item):
+        data = {"message": "Test history update accepted"}
+        status_code = 202
+    else:
+        crud.Update.update_test_history(**item)
+        data = {"message": "Test history updated successfully"}
+        status_code = 200
 
     resp = jsonify(data)
-    resp.status_code = 200
+    resp.status_code = status_code
 
     return resp
 
@@ -557,14 +609,19 @@ def update_test_history_resolution():
     params = request.get_json(force=True)
     logger.info("/update_test_history_resolution/%s", params)
 
-    crud.Update.update_test_history_resolution(
+    test_history_id = crud.Update.update_test_history_resolution(
         params.get("test_history_id"), params.get("test_resolution")
     )
 
-    data = {"message": "Test history resolution updated successfully"}
+    if test_history_id is None:
+        data = {"message": "No test history with the id provided was found"}
+        status_code = 404
+    else:
+        data = {"message": "Test history resolution updated successfully"}
+        status_code = 200
 
     resp = jsonify(data)
-    resp.status_code = 200
+    resp.status_code = status_code
 
     return resp
 
@@ -573,9 +630,11 @@ def update_test_history_resolution():
 def get_tests_suite_history_by_test_run(test_run_id):
     logger.info("/get_tests_suite_history_by_test_run/%i", test_run_id)
 
-    results = crud.Read.test_suite_history_by_test_run(test_run_id)
+    after, limit = page_params()
+    results = crud.Read.test_suite_history_by_test_run(test_run_id, after, limit)
 
-    if results:
+    if results or is_paging():
+        results, next_cursor = split_page(results, limit, lambda row: row[1].id)
         test_suites_history = []
 
         for table in results:
@@ -583,18 +642,20 @@ def get_tests_suite_history_by_test_run(test_run_id):
             test_suites_history.append(
                 {
                     "test_suite_history_id": test_suite_history.id,
-                    "test_suite_id": test_suite_history.test_suite.id,
+                    "test_suite_id": test_suite_history.test_suite_id,
                     "name": test_suite_history.test_suite.name,
                     "start_datetime": test_suite_history.start_datetime,
                     "end_datetime": test_suite_history.end_datetime,
-                    "duration": diff_dates(
+                    **durations(
                         test_suite_history.start_datetime,
                         test_suite_history.end_datetime,
                     ),
-                    "test_suite_status": test_suite_history.test_suite_status.name,
+                    "test_suite_status": Lookups.name(
+                        "test_suite_status", test_suite_history.test_suite_status_id
+                    ),
                 }
             )
-        data = test_suites_history
+        data = paged(test_suites_history, next_cursor)
     else:
         data = {"message": "No tests suites were found"}
     resp = jsonify(data)
@@ -616,11 +677,13 @@ def get_tests_suite_history_by_test_status_and_test_run_id(
         test_run_id,
     )
 
+    after, limit = page_params()
     results = crud.Read.test_suite_history_by_test_status_and_test_run_id(
-        test_suite_status_id, test_run_id
+        test_suite_status_id, test_run_id, after, limit
     )
 
-    if results:
+    if results or is_paging():
+        results, next_cursor = split_page(results, limit, lambda row: row[1].id)
         test_suites_history = []
 
         for table in results:
@@ -628,18 +691,20 @@ def get_tests_suite_history_by_test_status_and_test_run_id(
             test_suites_history.append(
                 {
                     "test_suite_history_id": test_suite_history.id,
-                    "test_suite_id": test_suite_history.test_suite.id,
+                    "test_suite_id": test_suite_history.test_suite_id,
                     "name": test_suite_history.test_suite.name,
                     "start_datetime": test_suite_history.start_datetime,
                     "end_datetime": test_suite_history.end_datetime,
-                    "duration": diff_dates(
+                    **durations(
                         test_suite_history.start_datetime,
                         test_suite_history.end_datetime,
                     ),
-                    "test_suite_status": test_suite_history.test_suite_status.name,
+                    "test_suite_status": Lookups.name(
+                        "test_suite_status", test_suite_history.test_suite_status_id
+                    ),
                 }
             )
-        data = test_suites_history
+        data = paged(test_suites_history, next_cursor)
     else:
         data = {"message": "No tests suites were found"}
     resp = jsonify(data)
@@ -652,84 +717,173 @@ def get_tests_suite_history_by_test_status_and_test_run_id(
 def get_tests_history_by_test_run(test_run_id):
     logger.info("/get_tests_history_by_test_run/%i", test_run_id)
 
-    results = crud.Read.test_history_by_test_run(test_run_id)
+    etag = version_etag(crud.Read.test_run_version(test_run_id))
+    resp = not_modified(etag)
+    if resp:
+        return resp
+
+    # The snapshot holds the default representation only
+    snapshot_eligible = not set(request.args) - {"stream"}
+    if snapshot_eligible:
+        snapshot = crud.Read.test_run_snapshot(test_run_id)
+        if snapshot:
+            return with_etag(snapshot_response(snapshot.payload), etag)
+
+    if request.args.get("stream") == "true":
+        return with_etag(stream_tests_history_by_test_run(test_run_id), etag)
+
+    keys = requested_fields(TEST_HISTORY_TREE_KEYS)
+    columns = field_columns(TEST_HISTORY_FIELDS, keys)
+    results = crud.Read.test_history_by_test_run(test_run_id, columns)
+
+    # Snapshots are kept until the run is written again, so one is never
+    # built from a replica that may lag: the run is read again from the
+    # primary, as is the rest of the request
+    if snapshot_eligible and results and is_finished(results[0][0]):
+        if db.replicas.reading():
+            db.replicas.pin()
+            results = crud.Read.test_history_by_test_run(test_run_id, columns)
 
     if results:
-        test_suites = []
-        test_suites_index = {}
-        index = -1
-
-        test_run = {
-            "test_run_id": results[0][0].id,
-            "launch_id": results[0][0].launch.id,
-            "project_id": results[0][0].launch.project.id,
-            "launch": results[0][0].launch.name,
-            "test_type": results[0][0].test_type,
-            "start_datetime": results[0][0].start_datetime,
-            "end_datetime": results[0][0].end_datetime,
-            "duration": diff_dates(
-                results[0][0].start_datetime, results[0][0].end_datetime
-            ),
-            "test_run_status": results[0][0].test_run_status.name,
-        }
-        for table in results:
-            test_suite_history = table[1]
-            test_history = table[2]
-            total_count = table[3]
-            failed_count = table[4]
-            passed_count = table[5]
-            running_count = table[6]
-            incomplete_count = table[7]
-            skipped_count = table[8]
-            if test_suites == [] or test_suite_history.id not in list(
-                test_suites_index.keys()
-            ):
-                index = index + 1
-                test_suites_index[test_suite_history.id] = index
-                test_suites.append(
-                    {
-                        "test_suite_history_id": test_suite_history.id,
-                        "test_suite_id": test_suite_history.test_suite.id,
-                        "name": test_suite_history.test_suite.name,
-                        "start_datetime": test_suite_history.start_datetime,
-                        "end_datetime": test_suite_history.end_datetime,
-                        "duration": diff_dates(
-                            test_suite_history.start_datetime,
-                            test_suite_history.end_datetime,
-                        ),
-                        "test_suite_status": test_suite_history.test_suite_status.name,
-                        "tests_total": total_count if total_count else 0,
-                        "tests_failed": failed_count if failed_count else 0,
-                        "tests_passed": passed_count if passed_count else 0,
-                        "tests_running": running_count if running_count else 0,
-                        "tests_incomplete": incomplete_count if incomplete_count else 0,
-                        "tests_skipped": skipped_count if skipped_count else 0,
-                        "tests": [],
-                    }
-                )
-            test_suites[test_suites_index.get(test_suite_history.id)]["tests"].append(
-                {
-                    "test_history_id": test_history.id,
-                    "test_id": test_history.test.id,
-                    "name": test_history.test.name,
-                    "trace": test_history.trace,
-                    "file": test_history.file,
-                    "message": test_history.message,
-                    "error_type": test_history.error_type,
-                    "retries": test_history.retries,
-                    "start_datetime": test_history.start_datetime,
-                    "end_datetime": test_history.end_datetime,
-                    "duration": diff_dates(
-                        test_history.start_datetime, test_history.end_datetime
-                    ),
-                    "status": test_history.test_status.name,
-                    "resolution": test_history.test_resolution.name,
-                }
+        texts = test_history_texts((table[2] for table in results), keys)
+        data = [test_run_history_tree(results, texts, keys)]
+
+        if snapshot_eligible and is_finished(results[0][0]):
+            payload = gzip.compress(json.dumps(data).encode("utf-8"))
+            crud.Create.create_test_run_snapshot(test_run_id, payload)
+            return with_etag(snapshot_response(payload), etag)
+    else:
+        data = archived_tests_history(test_run_id, keys)
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return with_etag(resp, etag)
+
+
+def test_run_history_tree(results, texts, keys):
+    test_suites = {}
+
+    test_run = test_run_tree(results[0][0])
+    for table in results:
+        test_suite_history = table[1]
+        if test_suite_history.id not in test_suites:
+            test_suites[test_suite_history.id] = test_suite_history_tree(
+                test_suite_history, table[3:]
             )
-        test_run["test_suites"] = test_suites
-        data = [test_run]
+        test_suites[test_suite_history.id]["tests"].append(
+            test_history_tree(table[2], texts, keys)
+        )
+    test_run["test_suites"] = list(test_suites.values())
+
+    return test_run
+
+
+def archived_tests_history(test_run_id, keys):
+    # Runs moved to the archive are read back from their launch's file, in
+    # full as the file is read whole anyway
+    archived = crud.Read.archived_test_run(test_run_id)
+    if not archived or not archived[1]:
+        return {"message": "No tests were found"}
+
+    _, results, texts = archived
+
+    return [test_run_history_tree(results, texts, keys)]
+
+
+def is_finished(test_run):
+    # Once both the run and its launch are closed the report only changes
+    # through writes that invalidate the snapshot
+    return (
+        test_run.test_run_status_id != constants.Constants.test_run_status["Running"]
+        and test_run.launch.launch_status_id
+        != constants.Constants.launch_status["In Process"]
+    )
+
+
+def snapshot_response(payload):
+    if "gzip" in request.accept_encodings:
+        resp = Response(payload, mimetype="application/json")
+        resp.headers["Content-Encoding"] = "gzip"
     else:
-        data = {"message": "No tests were found"}
+        resp = Response(gzip.decompress(payload), mimetype="application/json")
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.status_code = 200
+
+    return resp
+
+
+def stream_tests_history_by_test_run(test_run_id):
+    # Rows come ordered by test suite history from a server side cursor and
+    # are written out as soon as they are read, so memory is bounded by the
+    # cursor batch rather than by the size of the test run
+    keys = requested_fields(TEST_HISTORY_TREE_KEYS)
+    results = iter(
+        crud.Read.test_history_by_test_run_stream(
+            test_run_id, field_columns(TEST_HISTORY_FIELDS, keys)
+        )
+    )
+    first = next(results, None)
+
+    if first is None:
+        resp = jsonify(archived_tests_history(test_run_id, keys))
+        resp.status_code = 200
+
+        return resp
+
+    def generate():
+        buffer = []
+        buffered = 0
+        test_suite_history_id = None
+
+        test_run = json.dumps(test_run_tree(first[0]))
+        chunk = "[" + test_run[:-1] + ', "test_suites": ['
+
+        for table, texts in with_texts(itertools.chain([first], results), keys):
+            test_suite_history = table[1]
+            if test_suite_history.id != test_suite_history_id:
+                test_suite = test_suite_history_tree(test_suite_history, table[3:])
+                del test_suite["tests"]
+                chunk += "" if test_suite_history_id is None else "]}, "
+                chunk += json.dumps(test_suite)[:-1] + ', "tests": ['
+                test_suite_history_id = test_suite_history.id
+            else:
+                chunk += ", "
+            chunk += json.dumps(test_history_tree(table[2], texts, keys))
+
+            buffer.append(chunk)
+            buffered += len(chunk)
+            chunk = ""
+            if buffered >= STREAM_BUFFER_SIZE:
+                yield "".join(buffer)
+                buffer = []
+                buffered = 0
+
+        buffer.append("]}]}]")
+        yield "".join(buffer)
+
+    resp = Response(stream_with_context(generate()), mimetype="application/json")
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/test_history/<int:test_history_id>/trace", methods=["GET"])
+def get_test_history_trace(test_history_id):
+    logger.info("/test_history/%i/trace", test_history_id)
+
+    result = crud.Read.test_history_by_id(test_history_id)
+
+    if result:
+        texts = test_history_texts([result])
+        data = {
+            "test_history_id": result.id,
+            "trace": texts.get(result.trace_hash),
+            "message": texts.get(result.message_hash),
+            "error_type": result.error_type,
+        }
+    else:
+        data = {"message": "No test history with the id provided was found"}
+
     resp = jsonify(data)
     resp.status_code = 200
 
@@ -767,31 +921,25 @@ def get_tests_history_by_test_status_and_test_run_id(test_status_id, test_run_id
         "/tests_history/test_status/%i/test_run/%i/", test_status_id, test_run_id
     )
 
+    after, limit = page_params()
+    keys = requested_fields(TEST_HISTORY_DETAIL_KEYS)
     tests_history = crud.Read.test_history_by_test_status_and_test_run_id(
-        test_status_id=test_status_id, test_run_id=test_run_id
+        test_status_id=test_status_id,
+        test_run_id=test_run_id,
+        after=after,
+        limit=limit,
+        columns=field_columns(TEST_HISTORY_FIELDS, keys),
     )
 
-    if tests_history:
+    if tests_history or is_paging():
+        tests_history, next_cursor = split_page(
+            tests_history, limit, lambda row: row.id
+        )
+        texts = test_history_texts(tests_history, keys)
         data = []
         for test_history in tests_history:
-            data.append(
-                {
-                    "test_history_id": test_history.id,
-                    "name": test_history.test.name,
-                    "start_datetime": test_history.start_datetime,
-                    "end_datetime": test_history.end_datetime,
-                    "duration": diff_dates(
-                        test_history.start_datetime, test_history.end_datetime
-                    ),
-                    "test_status": test_history.test_status.name,
-                    "test_resolution": test_history.test_resolution.name,
-                    "trace": test_history.trace,
-                    "file": test_history.file,
-                    "message": test_history.message,
-                    "error_type": test_history.error_type,
-                    "retries": test_history.retries,
-                }
-            )
+            data.append(serialize(TEST_HISTORY_FIELDS, keys, test_history, texts))
+        data = paged(data, next_cursor)
     else:
         data = {"message": "No tests were found"}
 
@@ -805,24 +953,20 @@ def get_tests_history_by_test_status_and_test_run_id(test_status_id, test_run_id
 def get_tests_history_by_test_status_id(test_status_id):
     logger.info("/tests_history_by_test_status_id/%i", test_status_id)
 
-    tests_history = crud.Read.test_history_by_test_status_id(test_status_id)
+    after, limit = page_params()
+    keys = requested_fields(TEST_HISTORY_SUMMARY_KEYS)
+    tests_history = crud.Read.test_history_by_test_status_id(
+        test_status_id, after, limit, field_columns(TEST_HISTORY_FIELDS, keys)
+    )
 
-    if tests_history:
+    if tests_history or is_paging():
+        tests_history, next_cursor = split_page(
+            tests_history, limit, lambda row: row.id
+        )
         data = []
         for test_history in tests_history:
-            data.append(
-                {
-                    "test_history_id": test_history.id,
-                    "name": test_history.test.name,
-                    "start_datetime": test_history.start_datetime,
-                    "end_datetime": test_history.end_datetime,
-                    "duration": diff_dates(
-                        test_history.start_datetime, test_history.end_datetime
-                    ),
-                    "test_status": test_history.test_status.name,
-                    "test_resolution": test_history.test_resolution.name,
-                }
-            )
+            data.append(serialize(TEST_HISTORY_FIELDS, keys, test_history, {}))
+        data = paged(data, next_cursor)
     else:
         data = {"message": "No tests were found"}
 
@@ -838,24 +982,20 @@ def get_tests_history_by_test_status_id(test_status_id):
 def get_tests_history_by_test_resolution_id(test_resolution_id):
     logger.info("/tests_history_by_test_resolution_id/%i", test_resolution_id)
 
-    tests_history = crud.Read.test_history_by_test_resolution_id(test_resolution_id)
+    after, limit = page_params()
+    keys = requested_fields(TEST_HISTORY_SUMMARY_KEYS)
+    tests_history = crud.Read.test_history_by_test_resolution_id(
+        test_resolution_id, after, limit, field_columns(TEST_HISTORY_FIELDS, keys)
+    )
 
-    if tests_history:
+    if tests_history or is_paging():
+        tests_history, next_cursor = split_page(
+            tests_history, limit, lambda row: row.id
+        )
         data = []
         for test_history in tests_history:
-            data.append(
-                {
-                    "test_history_id": test_history.id,
-                    "name": test_history.test.name,
-                    "start_datetime": test_history.start_datetime,
-                    "end_datetime": test_history.end_datetime,
-                    "duration": diff_dates(
-                        test_history.start_datetime, test_history.end_datetime
-                    ),
-                    "test_status": test_history.test_status.name,
-                    "test_resolution": test_history.test_resolution.name,
-                }
-            )
+            data.append(serialize(TEST_HISTORY_FIELDS, keys, test_history, {}))
+        data = paged(data, next_cursor)
     else:
         data = {"message": "No tests were found"}
 
@@ -869,29 +1009,129 @@ def get_tests_history_by_test_resolution_id(test_resolution_id):
 def get_tests_history_by_test_suite_id(test_suite_id):
     logger.info("/tests_history_by_test_suite_id/%i", test_suite_id)
 
-    results = crud.Read.test_history_by_test_suite_id(test_suite_id)
+    after, limit = page_params()
+    keys = requested_fields(TEST_HISTORY_SUMMARY_KEYS + ("test_suite", "test_type"))
+    results = crud.Read.test_history_by_test_suite_id(
+        test_suite_id, after, limit, field_columns(TEST_HISTORY_FIELDS, keys)
+    )
 
-    if results:
+    if results or is_paging():
+        results, next_cursor = split_page(results, limit, lambda row: row[0].id)
         data = []
         for table in results:
             test_history = table[0]
-            test = table[1]
             test_suite = table[2]
+            item = serialize(TEST_HISTORY_FIELDS, keys, test_history, {})
+            if "test_suite" in keys:
+                item["test_suite"] = test_suite.name
+            if "test_type" in keys:
+                item["test_type"] = test_suite.name
+            data.append(item)
+        data = paged(data, next_cursor)
+    else:
+        data = {"message": "No tests were found"}
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/failure_clusters/test_run/<int:test_run_id>", methods=["GET"])
+def get_failure_clusters_by_test_run_id(test_run_id):
+    logger.info("/failure_clusters/test_run/%i", test_run_id)
+
+    results = crud.Read.failure_clusters_by_test_run_id(test_run_id)
+
+    if results:
+        texts = failure_cluster_texts(table[0] for table in results)
+        data = [
+            failure_cluster_tree(table[0], texts, failures=table[1], tests=table[2])
+            for table in results
+        ]
+    else:
+        data = {"message": "No failures were found"}
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/failure_clusters/launch/<int:launch_id>", methods=["GET"])
+def get_failure_clusters_by_launch_id(launch_id):
+    logger.info("/failure_clusters/launch/%i", launch_id)
+
+    results = crud.Read.failure_clusters_by_launch_id(launch_id)
+
+    if results:
+        texts = failure_cluster_texts(table[0] for table in results)
+        data = [
+            failure_cluster_tree(table[0], texts, failures=table[1], tests=table[2])
+            for table in results
+        ]
+    else:
+        data = {"message": "No failures were found"}
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/failure_clusters/project/<int:project_id>", methods=["GET"])
+def get_failure_clusters_by_project_id(project_id):
+    logger.info("/failure_clusters/project/%i", project_id)
+
+    after, limit = page_params()
+    results = crud.Read.failure_clusters_by_project_id(project_id, after, limit)
+
+    if results or is_paging():
+        results, next_cursor = split_page(results, limit, lambda row: row.id)
+        texts = failure_cluster_texts(results)
+        data = []
+        for failure_cluster in results:
             data.append(
                 {
-                    "test_history_id": test_history.id,
-                    "name": test.name,
-                    "start_datetime": test_history.start_datetime,
-                    "end_datetime": test_history.end_datetime,
-                    "duration": diff_dates(
-                        test_history.start_datetime, test_history.end_datetime
+                    **failure_cluster_tree(
+                        failure_cluster,
+                        texts,
+                        failures=failure_cluster.failures,
+                        tests=failure_cluster.tests,
                     ),
-                    "test_status": test_history.test_status.name,
-                    "test_resolution": test_history.test_resolution.name,
-                    "test_suite": test_suite.name,
-                    "test_type": test_suite.name,
+                    "first_seen": failure_cluster.first_seen,
+                    "last_seen": failure_cluster.last_seen,
                 }
             )
+        data = paged(data, next_cursor)
+    else:
+        data = {"message": "No failures were found"}
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/failure_cluster/<int:failure_cluster_id>/tests", methods=["GET"])
+def get_failure_cluster_tests(failure_cluster_id):
+    logger.info("/failure_cluster/%i/tests", failure_cluster_id)
+
+    after, limit = page_params()
+    results = crud.Read.failure_cluster_tests(failure_cluster_id, after, limit)
+
+    if results or is_paging():
+        results, next_cursor = split_page(results, limit, lambda row: row.id)
+        data = []
+        for test in results:
+            data.append(
+                {
+                    "test_id": test.id,
+                    "name": test.name,
+                    "test_suite_id": test.test_suite_id,
+                }
+            )
+        data = paged(data, next_cursor)
     else:
         data = {"message": "No tests were found"}
 
@@ -901,6 +1141,184 @@ def get_tests_history_by_test_suite_id(test_suite_id):
     return resp
 
 
+@app.route("/api/v1/flaky_tests/project/<int:project_id>", methods=["GET"])
+def get_flaky_tests_by_project_id(project_id):
+    logger.info("/flaky_tests/project/%i", project_id)
+
+    limit = request.args.get("limit", app.config["FLAKY_TESTS_LIMIT"], type=int)
+    limit = min(max(limit, 1), app.config["PAGE_SIZE_MAX"])
+    results = crud.Read.flaky_tests_by_project_id(project_id, limit)
+
+    if results:
+        data = []
+        for test_flaky_stats, test in results:
+            data.append(
+                {
+                    "test_id": test.id,
+                    "name": test.name,
+                    "test_suite_id": test.test_suite_id,
+                    "flakiness": test_flaky_stats.flakiness,
+                    "flips": test_flaky_stats.flips,
+                    "runs": test_flaky_stats.runs,
+                    "failures": bin(test_flaky_stats.outcomes).count("1"),
+                    "retried": bin(test_flaky_stats.retried).count("1"),
+                    "last_failed": bool(test_flaky_stats.outcomes & 1),
+                    "updated_datetime": test_flaky_stats.updated_datetime,
+                }
+            )
+    else:
+        data = {"message": "No flaky tests were found"}
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/test/<int:test_id>/durations", methods=["GET"])
+def get_test_durations(test_id):
+    logger.info("/test/%i/durations", test_id)
+
+    result = crud.Read.duration_sketch_by_test_id(test_id)
+
+    if result and result.sketch:
+        data = {
+            "test_id": result.test_id,
+            **sketch_percentiles(DDSketch.from_bytes(result.sketch)),
+        }
+    else:
+        data = {"message": "No durations were found for the test"}
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/test_suite/<int:test_suite_id>/durations", methods=["GET"])
+def get_test_suite_durations(test_suite_id):
+    logger.info("/test_suite/%i/durations", test_suite_id)
+
+    results = crud.Read.duration_sketches_by_test_suite_id(test_suite_id)
+    sketch = DurationSketches.merged(results or [])
+
+    if sketch.count:
+        data = {"test_suite_id": test_suite_id, **sketch_percentiles(sketch)}
+    else:
+        data = {"message": "No durations were found for the test suite"}
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/slowest_tests/project/<int:project_id>", methods=["GET"])
+def get_slowest_tests_by_project_id(project_id):
+    logger.info("/slowest_tests/project/%i", project_id)
+
+    limit = request.args.get("limit", app.config["SLOWEST_TESTS_LIMIT"], type=int)
+    limit = min(max(limit, 1), app.config["PAGE_SIZE_MAX"])
+    results = crud.Read.slowest_tests_by_project_id(project_id, limit)
+
+    if results:
+        data = []
+        for test_duration_sketch, test in results:
+            data.append(
+                {
+                    "test_id": test.id,
+                    "name": test.name,
+                    "test_suite_id": test.test_suite_id,
+                    "count": test_duration_sketch.count,
+                    "p50_ms": test_duration_sketch.p50,
+                    "p95_ms": test_duration_sketch.p95,
+                    "p99_ms": test_duration_sketch.p99,
+                }
+            )
+    else:
+        data = {"message": "No test durations were found"}
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/analytics/project/<int:project_id>/trend", methods=["GET"])
+def get_project_trend(project_id):
+    logger.info("/analytics/project/%i/trend", project_id)
+
+    # from=YYYY-MM-DD and to=YYYY-MM-DD select the launches started within
+    # the range, both days included, otherwise the latest launches=N are sent
+    start = request.args.get("from", type=parse_date)
+    end = request.args.get("to", type=parse_date)
+    launches = None
+    if start is None and end is None:
+        launches = request.args.get("launches", app.config["TREND_LAUNCHES"], type=int)
+        launches = min(max(launches, 1), app.config["PAGE_SIZE_MAX"])
+    result = crud.Read.project_trend(project_id, launches, start, end)
+
+    if result and result[0]:
+        launch_rows, day_rows = result
+        data = {
+            "project_id": project_id,
+            "window": app.config["TREND_WINDOW"],
+            "launches": [trend_tree(row, ("day",)) for row in launch_rows],
+            "days": [
+                {"date": str(row.day), **trend_tree(row, ("launch_id", "name", "day"))}
+                for row in day_rows
+            ],
+        }
+    else:
+        data = {"message": "No launches were found for the project"}
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/cache/stats", methods=["GET"])
+def get_cache_stats():
+    logger.info("/cache/stats")
+
+    data = {
+        "catalog": crud.catalog_cache.stats(),
+        "trend": crud.trend_cache.stats(),
+        "archive": archive_cache.stats(),
+    }
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/write_behind/stats", methods=["GET"])
+def get_write_behind_stats():
+    logger.info("/write_behind/stats")
+
+    data = crud.test_history_writer.stats()
+    data["enabled"] = app.config["WRITE_BEHIND_ENABLED"]
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
+@app.route("/api/v1/replicas/stats", methods=["GET"])
+def get_replicas_stats():
+    logger.info("/replicas/stats")
+
+    data = db.replicas.stats(app)
+
+    resp = jsonify(data)
+    resp.status_code = 200
+
+    return resp
+
+
 @app.errorhandler(404)
 def notfound(error):
     data = {"message": "The endpoint requested was not found"}
@@ -911,11 +1329,452 @@ def notfound(error):
     return resp
 
 
+# Keys of the test run and test history representations, with the columns
+# each is computed from and how. The KEYS tuples list what an endpoint sends
+# by default, in order, and what fields= can narrow it down to.
+TEST_RUN_FIELDS = {
+    "test_run_id": ((), lambda test_run, counts: test_run.id),
+    "launch_id": (("launch_id",), lambda test_run, counts: test_run.launch_id),
+    "project_id": (
+        ("launch_id", "launch"),
+        lambda test_run, counts: test_run.launch.project_id,
+    ),
+    "launch": (("launch_id", "launch"), lambda test_run, counts: test_run.launch.name),
+    "launch_name": (
+        ("launch_id", "launch"),
+        lambda test_run, counts: test_run.launch.name,
+    ),
+    "launch_status": (
+        ("launch_id", "launch"),
+        lambda test_run, counts: Lookups.name(
+            "launch_status", test_run.launch.launch_status_id
+        ),
+    ),
+    "data": (("data",), lambda test_run, counts: test_run.data),
+    "start_datetime": (
+        ("start_datetime",),
+        lambda test_run, counts: test_run.start_datetime,
+    ),
+    "end_datetime": (("end_datetime",), lambda test_run, counts: test_run.end_datetime),
+    "duration": (
+        ("start_datetime", "end_datetime"),
+        lambda test_run, counts: diff_dates(
+            test_run.start_datetime, test_run.end_datetime
+        ),
+    ),
+    "duration_ms": (
+        ("start_datetime", "end_datetime"),
+        lambda test_run, counts: duration_ms(
+            test_run.start_datetime, test_run.end_datetime
+        ),
+    ),
+    "test_type": (("test_type",), lambda test_run, counts: test_run.test_type),
+    "test_run_status": (
+        ("test_run_status_id",),
+        lambda test_run, counts: Lookups.name(
+            "test_run_status", test_run.test_run_status_id
+        ),
+    ),
+    "tests_total": ((), lambda test_run, counts: counts[0] or 0),
+    "tests_failed": ((), lambda test_run, counts: counts[1] or 0),
+    "tests_passed": ((), lambda test_run, counts: counts[2] or 0),
+    "tests_running": ((), lambda test_run, counts: counts[3] or 0),
+    "tests_incomplete": ((), lambda test_run, counts: counts[4] or 0),
+    "tests_skipped": ((), lambda test_run, counts: counts[5] or 0),
+}
+
+TEST_RUN_KEYS = (
+    "test_run_id",
+    "data",
+    "start_datetime",
+    "end_datetime",
+    "duration",
+    "duration_ms",
+    "test_type",
+    "test_run_status",
+    "launch",
+)
+
+LAUNCH_TEST_RUN_KEYS = (
+    "test_run_id",
+    "launch_id",
+    "project_id",
+    "data",
+    "start_datetime",
+    "end_datetime",
+    "duration",
+    "duration_ms",
+    "test_type",
+    "test_run_status",
+    "launch_name",
+    "launch_status",
+    "tests_total",
+    "tests_failed",
+    "tests_passed",
+    "tests_running",
+    "tests_incomplete",
+    "tests_skipped",
+)
+
+TEST_HISTORY_FIELDS = {
+    "test_history_id": ((), lambda test_history, texts: test_history.id),
+    "test_id": (("test_id",), lambda test_history, texts: test_history.test_id),
+    "name": (("test_id", "test"), lambda test_history, texts: test_history.test.name),
+    "trace": (
+        ("trace_hash",),
+        lambda test_history, texts: texts.get(test_history.trace_hash),
+    ),
+    "file": (("file",), lambda test_history, texts: test_history.file),
+    "message": (
+        ("message_hash",),
+        lambda test_history, texts: texts.get(test_history.message_hash),
+    ),
+    "error_type": (
+        ("error_type",),
+        lambda test_history, texts: test_history.error_type,
+    ),
+    "retries": (("retries",), lambda test_history, texts: test_history.retries),
+    "start_datetime": (
+        ("start_datetime",),
+        lambda test_history, texts: test_history.start_datetime,
+    ),
+    "end_datetime": (
+        ("end_datetime",),
+        lambda test_history, texts: test_history.end_datetime,
+    ),
+    "duration": (
+        ("start_datetime", "end_datetime"),
+        lambda test_history, texts: diff_dates(
+            test_history.start_datetime, test_history.end_datetime
+        ),
+    ),
+    "duration_ms": (
+        ("start_datetime", "end_datetime"),
+        lambda test_history, texts: duration_ms(
+            test_history.start_datetime, test_history.end_datetime
+        ),
+    ),
+    "test_status": (
+        ("test_status_id",),
+        lambda test_history, texts: Lookups.name(
+            "test_status", test_history.test_status_id
+        ),
+    ),
+    "status": (
+        ("test_status_id",),
+        lambda test_history, texts: Lookups.name(
+            "test_status", test_history.test_status_id
+        ),
+    ),
+    "test_resolution": (
+        ("test_resolution_id",),
+        lambda test_history, texts: Lookups.name(
+            "test_resolution", test_history.test_resolution_id
+        ),
+    ),
+    "resolution": (
+        ("test_resolution_id",),
+        lambda test_history, texts: Lookups.name(
+            "test_resolution", test_history.test_resolution_id
+        ),
+    ),
+}
+
+TEST_HISTORY_SUMMARY_KEYS = (
+    "test_history_id",
+    "name",
+    "start_datetime",
+    "end_datetime",
+    "duration",
+    "duration_ms",
+    "test_status",
+    "test_resolution",
+)
+
+TEST_HISTORY_DETAIL_KEYS = TEST_HISTORY_SUMMARY_KEYS + (
+    "trace",
+    "file",
+    "message",
+    "error_type",
+    "retries",
+)
+
+TEST_HISTORY_TREE_KEYS = (
+    "test_history_id",
+    "test_id",
+    "name",
+    "trace",
+    "file",
+    "message",
+    "error_type",
+    "retries",
+    "start_datetime",
+    "end_datetime",
+    "duration",
+    "duration_ms",
+    "status",
+    "resolution",
+)
+
+
+def test_run_tree(test_run):
+    return {
+        "test_run_id": test_run.id,
+        "launch_id": test_run.launch_id,
+        "project_id": test_run.launch.project_id,
+        "launch": test_run.launch.name,
+        "test_type": test_run.test_type,
+        "start_datetime": test_run.start_datetime,
+        "end_datetime": test_run.end_datetime,
+        **durations(test_run.start_datetime, test_run.end_datetime),
+        "test_run_status": Lookups.name("test_run_status", test_run.test_run_status_id),
+    }
+
+
+def test_suite_history_tree(test_suite_history, counts):
+    (
+        total_count,
+        failed_count,
+        passed_count,
+        running_count,
+        incomplete_count,
+        skipped_count,
+    ) = counts
+
+    return {
+        "test_suite_history_id": test_suite_history.id,
+        "test_suite_id": test_suite_history.test_suite_id,
+        "name": test_suite_history.test_suite.name,
+        "start_datetime": test_suite_history.start_datetime,
+        "end_datetime": test_suite_history.end_datetime,
+        **durations(test_suite_history.start_datetime, test_suite_history.end_datetime),
+        "test_suite_status": Lookups.name(
+            "test_suite_status", test_suite_history.test_suite_status_id
+        ),
+        "tests_total": total_count if total_count else 0,
+        "tests_failed": failed_count if failed_count else 0,
+        "tests_passed": passed_count if passed_count else 0,
+        "tests_running": running_count if running_count else 0,
+        "tests_incomplete": incomplete_count if incomplete_count else 0,
+        "tests_skipped": skipped_count if skipped_count else 0,
+        "tests": [],
+    }
+
+
+def test_history_tree(test_history, texts, keys):
+    return serialize(TEST_HISTORY_FIELDS, keys, test_history, texts)
+
+
+def failure_cluster_tree(failure_cluster, texts, failures, tests):
+    return {
+        "failure_cluster_id": failure_cluster.id,
+        "fingerprint": failure_cluster.fingerprint,
+        "error_type": failure_cluster.error_type,
+        "message": texts.get(failure_cluster.message_hash),
+        "failures": failures,
+        "tests": tests,
+    }
+
+
+def failure_cluster_texts(failure_clusters):
+    # Messages of the first failure of each cluster, read all at once
+    return crud.Read.blob_texts(
+        failure_cluster.message_hash for failure_cluster in failure_clusters
+    )
+
+
+def sketch_percentiles(sketch):
+    # Percentiles are within SKETCH_RELATIVE_ACCURACY of an actual duration
+    return {
+        "count": sketch.count,
+        "min_ms": sketch.min,
+        "max_ms": sketch.max,
+        "p50_ms": sketch.quantile(0.5),
+        "p95_ms": sketch.quantile(0.95),
+        "p99_ms": sketch.quantile(0.99),
+        "relative_accuracy": sketch.relative_accuracy,
+    }
+
+
+def trend_tree(row, skip=()):
+    return {
+        key: value
+        for key, value in row._asdict().items()
+        if key != "kind" and key not in skip
+    }
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d")
+
+
+def version_etag(version):
+    # The version is read before the data, so a write landing in between only
+    # makes the ETag older than the body and the next poll fetches it again.
+    # Durations of entities still running are as of their last write.
+    if version is None:
+        return None
+
+    key = "{}|{}".format(request.full_path, "|".join(str(part) for part in version))
+
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def not_modified(etag):
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+
+    resp = Response(status=304)
+    resp.set_etag(etag, weak=True)
+
+    return resp
+
+
+def with_etag(resp, etag):
+    # Weak, as the same representation may be sent gzip encoded or not
+    if etag is not None:
+        resp.set_etag(etag, weak=True)
+
+    return resp
+
+
+def test_history_texts(test_histories, keys=("trace", "message")):
+    # Traces and messages are stored apart from test history, a response
+    # reads all the ones it needs at once
+    columns = [
+        column
+        for key, column in (("trace", "trace_hash"), ("message", "message_hash"))
+        if key in keys
+    ]
+
+    return crud.Read.blob_texts(
+        getattr(test_history, column)
+        for test_history in test_histories
+        for column in columns
+    )
+
+
+def with_texts(results, keys):
+    # Streamed rows get their traces and messages one cursor batch at a time
+    results = iter(results)
+    while True:
+        batch = list(itertools.islice(results, crud.STREAM_BATCH_SIZE))
+        if not batch:
+            return
+
+        texts = test_history_texts((table[2] for table in batch), keys)
+        for table in batch:
+            yield table, texts
+
+
+def requested_fields(keys):
+    # fields=a,b,c narrows a response down to those of its keys. The first
+    # key, the id, is always sent and durations follow the duration parameter.
+    keys = [
+        key
+        for key in keys
+        if key not in ("duration", "duration_ms") or key in duration_keys()
+    ]
+    if not request.args.get("fields"):
+        return keys
+
+    wanted = {name.strip() for name in request.args["fields"].split(",")}
+
+    return [key for index, key in enumerate(keys) if index == 0 or key in wanted]
+
+
+def field_columns(fields, keys):
+    # Columns the keys are computed from, None to load them all when the
+    # response is not narrowed down
+    if not request.args.get("fields"):
+        return None
+
+    return sorted(
+        {column for key in keys if key in fields for column in fields[key][0]}
+    )
+
+
+def serialize(fields, keys, *args):
+    return {key: fields[key][1](*args) for key in keys if key in fields}
+
+
+def is_paging():
+    return "limit" in request.args or "after" in request.args
+
+
+def page_params():
+    limit = request.args.get("limit", type=int)
+    after = request.args.get("after", type=int)
+
+    if limit is not None:
+        limit = min(max(limit, 1), app.config["PAGE_SIZE_MAX"])
+
+    return after, limit
+
+
+def split_page(rows, limit, cursor):
+    if limit is None or len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+
+    return rows, cursor(rows[-1])
+
+
+def paged(data, next_cursor):
+    # Endpoints keep returning a plain list unless the client asks for a page
+    if not is_paging():
+        return data
+
+    return {"data": data, "next_cursor": next_cursor}
+
+
+def request_now():
+    # Everything still running in a response is measured against the same time
+    if "now" not in g:
+        g.now = datetime.datetime.now()
+
+    return g.now
+
+
+def duration_keys():
+    # duration=legacy (default) sends the relativedelta breakdown, duration=ms
+    # only the elapsed milliseconds and duration=both the two of them
+    mode = request.args.get("duration", "legacy")
+    keys = []
+    if mode != "ms":
+        keys.append("duration")
+    if mode in ("ms", "both"):
+        keys.append("duration_ms")
+
+    return keys
+
+
+def durations(date1, date2):
+    fields = {}
+    for key in duration_keys():
+        if key == "duration":
+            fields[key] = diff_dates(date1, date2)
+        else:
+            fields[key] = duration_ms(date1, date2)
+
+    return fields
+
+
+def duration_ms(date1, date2):
+    if not date1:
+        return None
+    if not date2:
+        date2 = request_now()
+
+    return int((date2 - date1).total_seconds() * 1000)
+
+
 def diff_dates(date1, date2):
     if not date1:
         return None
     if not date2:
-        date2 = datetime.datetime.now()
+        date2 = request_now()
 
     diff = relativedelta(date2, date1)
 
@@ -0,0 +1,45 @@
+"""Time reporting the tests of a suite one POST /api/v1/test_history per test
+against a single POST /api/v1/test_history/bulk.
+
+Runs against the migrated and initialised database of DATABASE_URL and leaves
+the rows it creates there, so point it at a scratch database:
+
+    APP_SETTINGS=config.DevelopmentConfig DATABASE_URL=postgresql://... \\
+        python benchmarks/bulk_ingestion.py --tests 2000
+"""
+import argparse
+from common import bulk_tests, client, post, test_suite_history, timed
+
+
+def per_row(client, ids, tests):
+    for index in range(tests):
+        post(
+            client,
+            "/api/v1/test_history",
+            {
+                "name": "test {}".format(index),
+                "test_run_id": ids["test_run_id"],
+                "test_suite_history_id": ids["test_suite_history_id"],
+                "test_suite_id": ids["test_suite_id"],
+            },
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--tests", type=int, default=2000)
+    args = parser.parse_args()
+
+    with client() as c:
+        # Both paths create their tests, each in a suite of its own
+        for label, ingest in (("per row", per_row), ("bulk", bulk_tests)):
+            seconds = timed(ingest, c, test_suite_history(c), args.tests)
+            print(
+                "{:8} {} tests in {:.2f}s, {:.0f} tests/s".format(
+                    label, args.tests, seconds, args.tests / seconds
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
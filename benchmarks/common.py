@@ -0,0 +1,80 @@
+import datetime
+import logging
+import logzero
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+
+# Request logs would drown the results
+logzero.loglevel(logging.WARNING)
+
+PROJECT = "benchmark"
+
+
+def post(client, url, body):
+    resp = client.post(url, json=body)
+    if resp.status_code != 200:
+        raise RuntimeError(
+            "{} answered {}: {}".format(url, resp.status_code, resp.data)
+        )
+
+    return resp.get_json()
+
+
+def test_suite_history(client):
+    # A launch with one test run and one test suite history of fresh names
+    now = datetime.datetime.now().isoformat()
+    name = uuid.uuid4().hex
+    launch_id = post(client, "/api/v1/launch", {"name": name, "project": PROJECT})["id"]
+    test_run_id = post(
+        client,
+        "/api/v1/test_run",
+        {"launch_id": launch_id, "test_type": "benchmark", "start_datetime": now},
+    )["id"]
+    suite = post(
+        client,
+        "/api/v1/test_suite_history",
+        {
+            "name": name,
+            "project": PROJECT,
+            "test_type": "benchmark",
+            "test_run_id": test_run_id,
+            "start_datetime": now,
+        },
+    )
+
+    return {
+        "launch_id": launch_id,
+        "test_run_id": test_run_id,
+        "test_suite_history_id": suite["test_suite_history_id"],
+        "test_suite_id": suite["test_suite_id"],
+    }
+
+
+def bulk_tests(client, ids, tests):
+    post(
+        client,
+        "/api/v1/test_history/bulk",
+        {
+            "test_run_id": ids["test_run_id"],
+            "test_suite_history_id": ids["test_suite_history_id"],
+            "test_suite_id": ids["test_suite_id"],
+            "tests": [{"name": "test {}".format(index)} for index in range(tests)],
+        },
+    )
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+
+    return time.perf_counter() - start
+
+
+def client():
+    return app.test_client()
@@ -0,0 +1,64 @@
+"""Time reading the test counts of one launch as its run and the rest of the
+test history grow.
+
+The counts of GET /api/v1/test_run/launch/<id> are read for the runs returned
+only, so their cost should not grow with the unrelated history.
+
+Runs against the migrated and initialised database of DATABASE_URL and leaves
+the rows it creates there, so point it at a scratch database:
+
+    APP_SETTINGS=config.DevelopmentConfig DATABASE_URL=postgresql://... \\
+        python benchmarks/test_counts.py --runs 100 1000 10000 \\
+        --history 0 50000
+"""
+import argparse
+from common import bulk_tests, client, test_suite_history, timed
+
+# Reads timed per measure, the median is reported
+REPEATS = 21
+
+
+def read_counts(client, launch_id):
+    resp = client.get("/api/v1/test_run/launch/{}".format(launch_id))
+    if resp.status_code != 200:
+        raise RuntimeError("Counts read answered {}".format(resp.status_code))
+
+
+def median_read(client, launch_id):
+    seconds = sorted(timed(read_counts, client, launch_id) for _ in range(REPEATS))
+
+    return seconds[REPEATS // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 50000])
+    args = parser.parse_args()
+
+    with client() as c:
+        launches = {}
+        for tests in args.runs:
+            ids = test_suite_history(c)
+            bulk_tests(c, ids, tests)
+            launches[tests] = ids["launch_id"]
+
+        # History of other runs is added between measures, in runs of at most
+        # 10000 tests
+        added = 0
+        for history in sorted(args.history):
+            while added < history:
+                tests = min(history - added, 10000)
+                bulk_tests(c, test_suite_history(c), tests)
+                added += tests
+
+            for tests, launch_id in launches.items():
+                print(
+                    "run of {:>6} tests, {:>7} other tests: {:.2f}ms".format(
+                        tests, added, median_read(c, launch_id) * 1000
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,39 @@ class Config(object):
     CSRF_ENABLED = True
     SECRET_KEY = "alpha-beta-delta-epsilon-lambda-gamma-omega"
     SQLALCHEMY_DATABASE_URI = os.environ["DATABASE_URL"]
+    # Comma separated read replicas of the database, bound as replica_<n>
+    DATABASE_REPLICA_URLS = [
+        url.strip()
+        for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",")
+        if url.strip()
+    ]
+    SQLALCHEMY_BINDS = {
+        "replica_{}".format(index): url
+        for index, url in enumerate(DATABASE_REPLICA_URLS)
+    }
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 5))
+    REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", 1))
+    # Holds the test ids of several runs of 20000 tests, a run of more
+    # distinct tests than that evicts its own ids before they are read again
+    CATALOG_CACHE_SIZE = int(os.environ.get("CATALOG_CACHE_SIZE", 100000))
+    CATALOG_CACHE_TTL = int(os.environ.get("CATALOG_CACHE_TTL", 300))
+    PAGE_SIZE_MAX = int(os.environ.get("PAGE_SIZE_MAX", 1000))
+    FLAKY_TESTS_LIMIT = int(os.environ.get("FLAKY_TESTS_LIMIT", 50))
+    SLOWEST_TESTS_LIMIT = int(os.environ.get("SLOWEST_TESTS_LIMIT", 50))
+    TEST_HISTORY_DATE_SLACK_HOURS = int(
+        os.environ.get("TEST_HISTORY_DATE_SLACK_HOURS", 24)
+    )
+    TREND_LAUNCHES = int(os.environ.get("TREND_LAUNCHES", 30))
+    TREND_WINDOW = int(os.environ.get("TREND_WINDOW", 7))
+    TREND_CACHE_SIZE = int(os.environ.get("TREND_CACHE_SIZE", 1000))
+    TREND_CACHE_TTL = int(os.environ.get("TREND_CACHE_TTL", 300))
+    ARCHIVE_PATH = os.environ.get("ARCHIVE_PATH", os.path.join(basedir, "archive"))
+    ARCHIVE_CACHE_SIZE = int(os.environ.get("ARCHIVE_CACHE_SIZE", 16))
+    ARCHIVE_CACHE_TTL = int(os.environ.get("ARCHIVE_CACHE_TTL", 300))
+    WRITE_BEHIND_ENABLED = os.environ.get("WRITE_BEHIND_ENABLED", "false") == "true"
+    WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get("WRITE_BEHIND_QUEUE_SIZE", 10000))
+    WRITE_BEHIND_INTERVAL_MS = int(os.environ.get("WRITE_BEHIND_INTERVAL_MS", 50))
+    WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", 500))
 
 
 class ProductionConfig(Config):
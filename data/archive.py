@@ -0,0 +1,459 @@
+import datetime
+import gzip
+import json
+import os
+import models
+from app import app, db
+from data import constants
+from data.blobs import Blobs
+from data.cache import LRUCache
+from data.clusters import FailureClusters
+from data.counters import Counters
+from logzero import logger
+from sqlalchemy import exc
+from sqlalchemy.sql import case, func
+from types import SimpleNamespace
+
+ARCHIVE_FORMAT = 1
+
+# Rows deleted per statement and transaction once their launch is archived
+ARCHIVE_BATCH_SIZE = 1000
+
+# Tables of a launch kept in its archive, test and test suite names are
+# archived along so the archive reads on its own
+ARCHIVED_MODELS = (
+    models.Launch,
+    models.TestRun,
+    models.TestSuiteHistory,
+    models.TestHistory,
+)
+
+# Counter columns archived with each test suite history, and the status they
+# count, None counting every test
+ARCHIVED_COUNTS = (
+    ("tests_count", None),
+    ("failed_tests_count", "Failed"),
+    ("passed_tests_count", "Passed"),
+    ("running_tests_count", "Running"),
+    ("incomplete_tests_count", "Incomplete"),
+    ("skipped_tests_count", "Skipped"),
+)
+
+# Decoded archives by launch id. An archive never changes once written.
+archive_cache = LRUCache(
+    app.config["ARCHIVE_CACHE_SIZE"], app.config["ARCHIVE_CACHE_TTL"]
+)
+
+
+def encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+
+    raise TypeError("{!r} cannot be archived".format(value))
+
+
+def columnar(rows, names):
+    return {name: [row[name] for row in rows] for name in names}
+
+
+def from_columnar(columns):
+    names = list(columns)
+
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+class Archive:
+
+    # Finished launches are moved out of the database into one gzip
+    # compressed JSON file each, holding every archived table column by
+    # column. The archived_test_run table tells which runs were moved and to
+    # which file, reads of those runs are answered from it.
+
+    @staticmethod
+    def path(launch_id):
+        return os.path.join(app.config["ARCHIVE_PATH"], "{}.json.gz".format(launch_id))
+
+    @staticmethod
+    def _rows(model, *criterion):
+        table = model.__table__
+
+        return [
+            dict(row) for row in db.session.execute(table.select().where(*criterion))
+        ]
+
+    @staticmethod
+    def _lock(launch_id):
+        # Held until the runs are recorded as archived so no write is lost
+        # from the file: test histories cannot be added to a locked run, and
+        # every other write to the launch either updates a locked row or
+        # waits on the counter rows of its run. A write to the launch once it
+        # is recorded is left out of the file and deleted with its rows, the
+        # launch having finished long before.
+        db.session.query(models.Launch.id).filter(
+            models.Launch.id == launch_id
+        ).with_for_update().all()
+        test_run_ids = (
+            db.session.query(models.TestRun.id)
+            .filter(models.TestRun.launch_id == launch_id)
+            .order_by(models.TestRun.id)
+            .with_for_update()
+            .all()
+        )
+        db.session.query(models.TestRunCounts.test_run_id).filter(
+            models.TestRunCounts.test_run_id.in_([id_ for id_, in test_run_ids])
+        ).order_by(
+            models.TestRunCounts.test_run_id, models.TestRunCounts.slot
+        ).with_for_update().all()
+
+    @staticmethod
+    def _export(launch_id):
+        launches = Archive._rows(models.Launch, models.Launch.id == launch_id)
+        test_runs = Archive._rows(models.TestRun, models.TestRun.launch_id == launch_id)
+        test_run_ids = [test_run["id"] for test_run in test_runs]
+        test_suite_histories = Archive._rows(
+            models.TestSuiteHistory,
+            models.TestSuiteHistory.test_run_id.in_(test_run_ids),
+        )
+        test_histories = Archive._rows(
+            models.TestHistory, models.TestHistory.test_run_id.in_(test_run_ids)
+        )
+
+        counts = {
+            test_suite_history["id"]: dict.fromkeys(
+                (column for column, _ in ARCHIVED_COUNTS), 0
+            )
+            for test_suite_history in test_suite_histories
+        }
+        for test_history in test_histories:
+            for column, status in ARCHIVED_COUNTS:
+                if status is None or (
+                    test_history["test_status_id"]
+                    == constants.Constants.test_status[status]
+                ):
+                    counts[test_history["test_suite_history_id"]][column] += 1
+        for test_suite_history in test_suite_histories:
+            test_suite_history.update(counts[test_suite_history["id"]])
+
+        test_suite_ids = {row["test_suite_id"] for row in test_suite_histories}
+        test_ids = {row["test_id"] for row in test_histories}
+        test_suites = [
+            {"id": test_suite_id, "name": name}
+            for test_suite_id, name in db.session.query(
+                models.TestSuite.id, models.TestSuite.name
+            ).filter(models.TestSuite.id.in_(test_suite_ids))
+        ]
+        tests = []
+        test_ids = sorted(test_ids)
+        for index in range(0, len(test_ids), ARCHIVE_BATCH_SIZE):
+            tests.extend(
+                {"id": test_id, "name": name}
+                for test_id, name in db.session.query(
+                    models.Test.id, models.Test.name
+                ).filter(
+                    models.Test.id.in_(test_ids[index : index + ARCHIVE_BATCH_SIZE])
+                )
+            )
+        texts = Blobs.load(
+            key
+            for test_history in test_histories
+            for key in (test_history["trace_hash"], test_history["message_hash"])
+        )
+
+        tables = {
+            "format": ARCHIVE_FORMAT,
+            "test_suite": columnar(test_suites, ("id", "name")),
+            "test": columnar(tests, ("id", "name")),
+            "blob": {"hash": list(texts), "text": list(texts.values())},
+        }
+        for model, rows in zip(
+            ARCHIVED_MODELS,
+            (launches, test_runs, test_suite_histories, test_histories),
+        ):
+            names = [column.name for column in model.__table__.columns]
+            if model is models.TestSuiteHistory:
+                names += [column for column, _ in ARCHIVED_COUNTS]
+            tables[model.__tablename__] = columnar(rows, names)
+
+        # Written under a temporary name first, so a file at the final path
+        # is always complete
+        path = Archive.path(launch_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as archive:
+            json.dump(tables, archive, default=encode_value)
+        os.replace(path + ".tmp", path)
+
+        return test_run_ids
+
+    @staticmethod
+    def load(launch_id):
+        # Rows of each archived table as dicts, with their dates parsed back
+        archive = archive_cache.get(launch_id)
+        if archive is not None:
+            return archive
+
+        with gzip.open(Archive.path(launch_id), "rt", encoding="utf-8") as file:
+            tables = json.load(file)
+        if tables["format"] != ARCHIVE_FORMAT:
+            raise ValueError("Unknown archive format {}".format(tables["format"]))
+
+        archive = {
+            "test_suite": {
+                row["id"]: row for row in from_columnar(tables["test_suite"])
+            },
+            "test": {row["id"]: row for row in from_columnar(tables["test"])},
+            "blob": dict(zip(tables["blob"]["hash"], tables["blob"]["text"])),
+        }
+        for model in ARCHIVED_MODELS:
+            rows = from_columnar(tables[model.__tablename__])
+            for column in model.__table__.columns:
+                if isinstance(column.type, db.DateTime):
+                    for row in rows:
+                        if row[column.name] is not None:
+                            row[column.name] = datetime.datetime.fromisoformat(
+                                row[column.name]
+                            )
+            archive[model.__tablename__] = rows
+
+        archive_cache.set(launch_id, archive)
+
+        return archive
+
+    @staticmethod
+    def test_run(test_run_id):
+        # The archived run as (test_run, rows, texts), rows having the shape
+        # of the rows of crud.Read.test_history_by_test_run. None when the
+        # run was not archived.
+        launch_id = (
+            db.session.query(models.ArchivedTestRun.launch_id)
+            .filter(models.ArchivedTestRun.test_run_id == test_run_id)
+            .scalar()
+        )
+        if launch_id is None:
+            return None
+
+        archive = Archive.load(launch_id)
+        launch = SimpleNamespace(**archive["launch"][0])
+        test_run = next(
+            SimpleNamespace(**row, launch=launch)
+            for row in archive["test_run"]
+            if row["id"] == test_run_id
+        )
+        test_suite_histories = {
+            row["id"]: SimpleNamespace(
+                **row,
+                test_suite=SimpleNamespace(
+                    **archive["test_suite"][row["test_suite_id"]]
+                )
+            )
+            for row in archive["test_suite_history"]
+            if row["test_run_id"] == test_run_id
+        }
+
+        rows = []
+        for row in sorted(
+            (
+                row
+                for row in archive["test_history"]
+                if row["test_run_id"] == test_run_id
+            ),
+            key=lambda row: (row["test_suite_history_id"], row["id"]),
+        ):
+            test_suite_history = test_suite_histories[row["test_suite_history_id"]]
+            test_history = SimpleNamespace(
+                **row, test=SimpleNamespace(**archive["test"][row["test_id"]])
+            )
+            rows.append(
+                (test_run, test_suite_history, test_history)
+                + tuple(
+                    getattr(test_suite_history, column) for column, _ in ARCHIVED_COUNTS
+                )
+            )
+
+        return test_run, rows, archive["blob"]
+
+    @staticmethod
+    def test_runs(launch_id):
+        # The archived runs of a launch as rows of (test_run, *counts), in the
+        # shape of the rows of crud.Read.test_run_by_launch_id, counts
+        # summed from the test suite histories of each run
+        archive = Archive.load(launch_id)
+        launch = SimpleNamespace(**archive["launch"][0])
+
+        counts = {row["id"]: [0] * len(ARCHIVED_COUNTS) for row in archive["test_run"]}
+        for row in archive["test_suite_history"]:
+            for index, (column, _) in enumerate(ARCHIVED_COUNTS):
+                counts[row["test_run_id"]][index] += row[column]
+
+        return [
+            (SimpleNamespace(**row, launch=launch),) + tuple(counts[row["id"]])
+            for row in sorted(archive["test_run"], key=lambda row: row["id"])
+        ]
+
+    @staticmethod
+    def _delete_test_histories(launch_id):
+        # Test histories are deleted as they were archived, in batches bounded
+        # by the start of the batch so only its partitions are scanned, then
+        # the test suite histories. Each batch is committed on its own, the
+        # rows of an archived launch being read from its file already.
+        archive = Archive.load(launch_id)
+
+        test_histories = sorted(
+            archive["test_history"], key=lambda row: row["start_datetime"]
+        )
+        for index in range(0, len(test_histories), ARCHIVE_BATCH_SIZE):
+            batch = test_histories[index : index + ARCHIVE_BATCH_SIZE]
+            db.session.query(models.TestHistory).filter(
+                models.TestHistory.id.in_([row["id"] for row in batch])
+            ).filter(
+                models.TestHistory.start_datetime.between(
+                    batch[0]["start_datetime"], batch[-1]["start_datetime"]
+                )
+            ).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+
+        test_suite_history_ids = [row["id"] for row in archive["test_suite_history"]]
+        for model, column in (
+            (
+                models.TestSuiteHistoryCounts,
+                models.TestSuiteHistoryCounts.test_suite_history_id,
+            ),
+            (models.TestSuiteHistory, models.TestSuiteHistory.id),
+        ):
+            for index in range(0, len(test_suite_history_ids), ARCHIVE_BATCH_SIZE):
+                db.session.query(model).filter(
+                    column.in_(
+                        test_suite_history_ids[index : index + ARCHIVE_BATCH_SIZE]
+                    )
+                ).delete(synchronize_session=False)
+                db.session.commit()
+
+    @staticmethod
+    def _delete_test_runs(launch_id):
+        # The runs go last, in one transaction: until then the launch is
+        # listed from their counters, and an archived run still in the
+        # database marks a deletion to finish
+        archive = Archive.load(launch_id)
+
+        test_run_ids = [row["id"] for row in archive["test_run"]]
+        for model, column in (
+            (models.TestRunCounts, models.TestRunCounts.test_run_id),
+            (models.TestRunSnapshot, models.TestRunSnapshot.test_run_id),
+            (models.TestRun, models.TestRun.id),
+        ):
+            for index in range(0, len(test_run_ids), ARCHIVE_BATCH_SIZE):
+                db.session.query(model).filter(
+                    column.in_(test_run_ids[index : index + ARCHIVE_BATCH_SIZE])
+                ).delete(synchronize_session=False)
+
+        # Readers of the launch and its project see the runs move
+        db.session.query(models.Launch).filter(models.Launch.id == launch_id).update(
+            {models.Launch.version: models.Launch.version + 1},
+            synchronize_session=False,
+        )
+        Counters.touch_project(archive["launch"][0]["project_id"], launch_id)
+        db.session.commit()
+
+    @staticmethod
+    def _finished(before, launch_id=None):
+        # Ids of the launches that finished before the given time, a launch
+        # being finished once it and every one of its runs are closed
+        in_process = constants.Constants.launch_status["In Process"]
+        running = constants.Constants.test_run_status["Running"]
+        launch_ids = (
+            db.session.query(models.TestRun.launch_id)
+            .filter(models.TestRun.launch_id == models.Launch.id)
+            .filter(models.Launch.launch_status_id != in_process)
+            .filter(
+                ~models.TestRun.launch_id.in_(
+                    db.session.query(models.ArchivedTestRun.launch_id)
+                )
+            )
+            .group_by(models.TestRun.launch_id)
+            .having(func.count() == func.count(models.TestRun.end_datetime))
+            .having(
+                func.sum(
+                    case([(models.TestRun.test_run_status_id == running, 1)], else_=0)
+                )
+                == 0
+            )
+            .having(func.max(models.TestRun.end_datetime) < before)
+            .order_by(models.TestRun.launch_id)
+        )
+        if launch_id is not None:
+            launch_ids = launch_ids.filter(models.TestRun.launch_id == launch_id)
+
+        return launch_ids
+
+    @staticmethod
+    def archive(before):
+        # Launches that finished before the given time are archived one at a
+        # time. The rows of a launch are locked while its file is written and
+        # its runs are recorded as archived, from then on they are read from
+        # the file. A launch whose transaction fails, for instance when a
+        # writer of the launch deadlocks with it, is left for the next run.
+        # The rows of the archived launches are then deleted in batches of
+        # their own transactions, their failures leaving the failure clusters
+        # of their projects. Launches whose deletion was interrupted are
+        # finished along, the recorded runs still in the database telling
+        # which they are.
+        archived = []
+        for (launch_id,) in Archive._finished(before).all():
+            try:
+                # The launch may have been reopened before it was locked
+                Archive._lock(launch_id)
+                if not Archive._finished(before, launch_id).all():
+                    db.session.rollback()
+                    continue
+
+                test_run_ids = Archive._export(launch_id)
+                archive_cache.invalidate(launch_id)
+                now = datetime.datetime.now()
+                db.session.execute(
+                    models.ArchivedTestRun.__table__.insert(),
+                    [
+                        {
+                            "test_run_id": test_run_id,
+                            "launch_id": launch_id,
+                            "archived_datetime": now,
+                        }
+                        for test_run_id in test_run_ids
+                    ],
+                )
+                db.session.commit()
+            except exc.SQLAlchemyError as e:
+                logger.error(e)
+                db.session.rollback()
+                archive_cache.invalidate(launch_id)
+                continue
+
+            logger.info(
+                "Archived launch %i, %i test runs", launch_id, len(test_run_ids)
+            )
+            archived.append(launch_id)
+
+        deleted = (
+            db.session.query(models.ArchivedTestRun.launch_id, models.Launch.project_id)
+            .filter(models.ArchivedTestRun.test_run_id == models.TestRun.id)
+            .filter(models.ArchivedTestRun.launch_id == models.Launch.id)
+            .distinct()
+            .order_by(models.ArchivedTestRun.launch_id)
+            .all()
+        )
+        try:
+            for launch_id, _ in deleted:
+                Archive._delete_test_histories(launch_id)
+
+            # Rebuilt before the runs are deleted, so a rebuild that does not
+            # happen is retried along with the deletion
+            for project_id in sorted({project_id for _, project_id in deleted}):
+                FailureClusters.rebuild(project_id)
+
+            for launch_id, _ in deleted:
+                Archive._delete_test_runs(launch_id)
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+
+        return archived
@@ -0,0 +1,63 @@
+import hashlib
+import zlib
+import models
+from app import db
+from sqlalchemy.dialects.postgresql import insert
+
+# Upper bound of blobs sent or read in a single statement
+BLOB_CHUNK_SIZE = 500
+
+
+class Blobs:
+
+    # Long texts reported with test results, such as failure traces, stored
+    # once per distinct content: zlib compressed and keyed by the SHA-256 of
+    # their UTF-8 encoding. Blobs are immutable, so writers only ever insert
+    # the ones that are not there yet.
+
+    @staticmethod
+    def store(texts):
+        # Returns the key of each text, None for None. New blobs are inserted
+        # sorted by key so concurrent writers lock them in the same order.
+        keys = []
+        rows = {}
+        for text in texts:
+            if text is None:
+                keys.append(None)
+                continue
+            data = text.encode("utf-8")
+            key = hashlib.sha256(data).hexdigest()
+            rows[key] = data
+            keys.append(key)
+
+        new_keys = sorted(rows)
+        for index in range(0, len(new_keys), BLOB_CHUNK_SIZE):
+            db.session.execute(
+                insert(models.Blob.__table__)
+                .values(
+                    [
+                        {
+                            "hash": key,
+                            "payload": zlib.compress(rows[key]),
+                            "size": len(rows[key]),
+                        }
+                        for key in new_keys[index : index + BLOB_CHUNK_SIZE]
+                    ]
+                )
+                .on_conflict_do_nothing(index_elements=["hash"])
+            )
+
+        return keys
+
+    @staticmethod
+    def load(keys):
+        # Texts by key, each distinct blob is read and decompressed once
+        keys = sorted({key for key in keys if key is not None})
+        texts = {}
+        for index in range(0, len(keys), BLOB_CHUNK_SIZE):
+            for key, payload in db.session.query(
+                models.Blob.hash, models.Blob.payload
+            ).filter(models.Blob.hash.in_(keys[index : index + BLOB_CHUNK_SIZE])):
+                texts[key] = zlib.decompress(payload).decode("utf-8")
+
+        return texts
@@ -0,0 +1,266 @@
+import datetime
+import models
+from app import db
+from data import constants
+from data.blobs import Blobs
+from data.fingerprint import Fingerprint
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import case, func, literal
+
+# Failed test history rows fingerprinted per transaction by rebuild
+REBUILD_BATCH_SIZE = 1000
+
+
+class FailureClusters:
+
+    # Failure clusters of a project are kept up to date by the writers, so
+    # listing them reads one row per cluster instead of grouping the history
+
+    @staticmethod
+    def apply(changes):
+        # Each change is a tuple of (project_id, test_id, old_fingerprint,
+        # new_fingerprint, seen, error_type, message_hash) for a test history
+        # whose fingerprint changed, None meaning it has no fingerprint
+        clusters = {}
+        tests = set()
+        for (
+            project_id,
+            test_id,
+            old_fingerprint,
+            new_fingerprint,
+            seen,
+            error_type,
+            message_hash,
+        ) in changes:
+            if old_fingerprint is not None:
+                cluster = clusters.setdefault(
+                    (project_id, old_fingerprint),
+                    {"failures": 0, "first_seen": seen, "last_seen": seen},
+                )
+                cluster["failures"] -= 1
+            if new_fingerprint is not None:
+                cluster = clusters.setdefault(
+                    (project_id, new_fingerprint),
+                    {"failures": 0, "first_seen": seen, "last_seen": seen},
+                )
+                cluster["failures"] += 1
+                cluster["first_seen"] = min(cluster["first_seen"], seen)
+                cluster["last_seen"] = max(cluster["last_seen"], seen)
+                cluster.setdefault("error_type", error_type)
+                cluster.setdefault("message_hash", message_hash)
+                tests.add((project_id, new_fingerprint, test_id))
+
+        if not clusters:
+            return
+
+        # Rows are sent sorted by key so concurrent batches lock clusters in
+        # the same order and cannot deadlock each other
+        table = models.FailureCluster.__table__
+        statement = insert(table).values(
+            [
+                {
+                    "project_id": project_id,
+                    "fingerprint": fingerprint,
+                    "error_type": cluster.get("error_type"),
+                    "message_hash": cluster.get("message_hash"),
+                    "failures": cluster["failures"],
+                    "tests": 0,
+                    "first_seen": cluster["first_seen"],
+                    "last_seen": cluster["last_seen"],
+                }
+                for (project_id, fingerprint), cluster in sorted(clusters.items())
+            ]
+        )
+        ids = {
+            (row.project_id, row.fingerprint): row.id
+            for row in db.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["project_id", "fingerprint"],
+                    set_={
+                        "failures": table.c.failures + statement.excluded.failures,
+                        "first_seen": case(
+                            [
+                                (
+                                    statement.excluded.first_seen < table.c.first_seen,
+                                    statement.excluded.first_seen,
+                                )
+                            ],
+                            else_=table.c.first_seen,
+                        ),
+                        "last_seen": case(
+                            [
+                                (
+                                    statement.excluded.last_seen > table.c.last_seen,
+                                    statement.excluded.last_seen,
+                                )
+                            ],
+                            else_=table.c.last_seen,
+                        ),
+                    },
+                ).returning(table.c.id, table.c.project_id, table.c.fingerprint)
+            )
+        }
+
+        if not tests:
+            return
+
+        # Only tests new to a cluster add to the amount of tests it affects
+        test_table = models.FailureClusterTest.__table__
+        rows = sorted(
+            (ids[(project_id, fingerprint)], test_id)
+            for project_id, fingerprint, test_id in tests
+        )
+        added = {}
+        for row in db.session.execute(
+            insert(test_table)
+            .values(
+                [
+                    {"failure_cluster_id": failure_cluster_id, "test_id": test_id}
+                    for failure_cluster_id, test_id in rows
+                ]
+            )
+            .on_conflict_do_nothing()
+            .returning(test_table.c.failure_cluster_id)
+        ):
+            added[row.failure_cluster_id] = added.get(row.failure_cluster_id, 0) + 1
+
+        for failure_cluster_id, amount in sorted(added.items()):
+            db.session.query(models.FailureCluster).filter(
+                models.FailureCluster.id == failure_cluster_id
+            ).update(
+                {models.FailureCluster.tests: models.FailureCluster.tests + amount},
+                synchronize_session=False,
+            )
+
+    @staticmethod
+    def _fingerprint_failures(project_id):
+        # Failures recorded before fingerprinting existed, or under older
+        # normalization rules, get the fingerprint a writer would give them
+        query = db.session.query(
+            models.TestHistory.id,
+            models.TestHistory.fingerprint,
+            models.TestHistory.error_type,
+            models.TestHistory.message_hash,
+            models.TestHistory.trace_hash,
+        ).filter(
+            models.TestHistory.test_status_id
+            == constants.Constants.test_status["Failed"]
+        )
+        if project_id is not None:
+            query = query.filter(
+                models.TestHistory.test_run_id.in_(
+                    db.session.query(models.TestRun.id)
+                    .filter(models.TestRun.launch_id == models.Launch.id)
+                    .filter(models.Launch.project_id == project_id)
+                )
+            )
+
+        last_id = 0
+        while True:
+            rows = (
+                query.filter(models.TestHistory.id > last_id)
+                .order_by(models.TestHistory.id)
+                .limit(REBUILD_BATCH_SIZE)
+                .all()
+            )
+            if not rows:
+                return
+
+            texts = Blobs.load(
+                key for row in rows for key in (row.message_hash, row.trace_hash)
+            )
+            updates = []
+            for row in rows:
+                fingerprint = Fingerprint.of(
+                    row.error_type,
+                    texts.get(row.message_hash),
+                    texts.get(row.trace_hash),
+                )
+                if fingerprint != row.fingerprint:
+                    updates.append({"b_id": row.id, "b_fingerprint": fingerprint})
+            if updates:
+                table = models.TestHistory.__table__
+                db.session.execute(
+                    table.update()
+                    .where(table.c.id == bindparam("b_id"))
+                    .values(fingerprint=bindparam("b_fingerprint")),
+                    updates,
+                )
+            db.session.commit()
+            last_id = rows[-1].id
+
+    @staticmethod
+    def rebuild(project_id=None):
+        FailureClusters._fingerprint_failures(project_id)
+
+        # Writers are blocked on the cluster tables while they are recomputed
+        # so no failure is lost or counted twice
+        db.session.execute(
+            "LOCK TABLE failure_cluster, failure_cluster_test IN EXCLUSIVE MODE"
+        )
+
+        stale_clusters = db.session.query(models.FailureCluster.id)
+        if project_id is not None:
+            stale_clusters = stale_clusters.filter(
+                models.FailureCluster.project_id == project_id
+            )
+        db.session.query(models.FailureClusterTest).filter(
+            models.FailureClusterTest.failure_cluster_id.in_(stale_clusters)
+        ).delete(synchronize_session=False)
+        db.session.query(models.FailureCluster).filter(
+            models.FailureCluster.id.in_(stale_clusters)
+        ).delete(synchronize_session=False)
+
+        def fingerprinted(*columns):
+            query = (
+                db.session.query(*columns)
+                .filter(models.TestHistory.test_run_id == models.TestRun.id)
+                .filter(models.TestRun.launch_id == models.Launch.id)
+                .filter(models.TestHistory.fingerprint.isnot(None))
+            )
+            if project_id is not None:
+                query = query.filter(models.Launch.project_id == project_id)
+
+            return query
+
+        now = datetime.datetime.now()
+        clusters = fingerprinted(
+            models.Launch.project_id,
+            models.TestHistory.fingerprint,
+            func.min(models.TestHistory.error_type),
+            func.min(models.TestHistory.message_hash),
+            func.count(),
+            func.count(models.TestHistory.test_id.distinct()),
+            func.coalesce(func.min(models.TestHistory.end_datetime), literal(now)),
+            func.coalesce(func.max(models.TestHistory.end_datetime), literal(now)),
+        ).group_by(models.Launch.project_id, models.TestHistory.fingerprint)
+        db.session.execute(
+            models.FailureCluster.__table__.insert().from_select(
+                [
+                    "project_id",
+                    "fingerprint",
+                    "error_type",
+                    "message_hash",
+                    "failures",
+                    "tests",
+                    "first_seen",
+                    "last_seen",
+                ],
+                clusters.statement,
+            )
+        )
+
+        cluster_tests = (
+            fingerprinted(models.FailureCluster.id, models.TestHistory.test_id)
+            .filter(models.FailureCluster.project_id == models.Launch.project_id)
+            .filter(models.FailureCluster.fingerprint == models.TestHistory.fingerprint)
+            .distinct()
+        )
+        db.session.execute(
+            models.FailureClusterTest.__table__.insert().from_select(
+                ["failure_cluster_id", "test_id"], cluster_tests.statement
+            )
+        )
+
+        db.session.commit()
@@ -0,0 +1,252 @@
+import models
+from app import db
+from data import constants
+from data.subqueries import COUNT_COLUMNS, TestCounts
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func, literal, select, union_all
+
+# Every test history row always updates the same one of these slots, so
+# parallel reporters writing to one test run spread over several counter rows
+# instead of queueing on a single one. Readers sum the slots.
+COUNTER_SLOTS = 16
+
+STATUS_COLUMNS = {
+    constants.Constants.test_status["Failed"]: "failed_tests_count",
+    constants.Constants.test_status["Passed"]: "passed_tests_count",
+    constants.Constants.test_status["Running"]: "running_tests_count",
+    constants.Constants.test_status["Incomplete"]: "incomplete_tests_count",
+    constants.Constants.test_status["Skipped"]: "skipped_tests_count",
+}
+
+# Counted writes of a test run, kept in its counter slots next to the test
+# counts. They back the ETags of the run and its launch.
+VERSION_COLUMN = "version"
+
+
+class Counters:
+    @staticmethod
+    def _upsert(counters, key, deltas, columns):
+        # Rows are sent sorted by key so concurrent batches lock slots in the
+        # same order and cannot deadlock each other. Rows that change nothing
+        # are left out.
+        rows = []
+        for (key_id, slot), delta in sorted(deltas.items()):
+            row = {column: delta.get(column, 0) for column in columns}
+            if not any(row.values()):
+                continue
+            row.update({key: key_id, "slot": slot})
+            rows.append(row)
+
+        if not rows:
+            return
+
+        table = counters.__table__
+        statement = insert(table).values(rows)
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[key, "slot"],
+                set_={
+                    column: table.c[column] + statement.excluded[column]
+                    for column in columns
+                },
+            )
+        )
+
+    @staticmethod
+    def _bump_projects(test_run_deltas):
+        # Project versions are slotted the same way, each test run slot
+        # bumping the slot of its project in one INSERT ... SELECT
+        bumps = [
+            select(
+                [
+                    literal(test_run_id).label("test_run_id"),
+                    literal(slot).label("slot"),
+                    literal(delta[VERSION_COLUMN]).label(VERSION_COLUMN),
+                ]
+            )
+            for (test_run_id, slot), delta in sorted(test_run_deltas.items())
+            if delta.get(VERSION_COLUMN)
+        ]
+        if not bumps:
+            return
+
+        bumps = union_all(*bumps).alias("bumps")
+        table = models.ProjectVersion.__table__
+        statement = insert(table).from_select(
+            ["project_id", "slot", VERSION_COLUMN],
+            select([models.Launch.project_id, bumps.c.slot, func.sum(bumps.c.version)])
+            .where(models.TestRun.id == bumps.c.test_run_id)
+            .where(models.TestRun.launch_id == models.Launch.id)
+            .group_by(models.Launch.project_id, bumps.c.slot)
+            .order_by(models.Launch.project_id, bumps.c.slot),
+        )
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["project_id", "slot"],
+                set_={VERSION_COLUMN: table.c.version + statement.excluded.version},
+            )
+        )
+
+    @staticmethod
+    def apply(changes):
+        # Each change is a tuple of (test_history_id, test_run_id,
+        # test_suite_history_id, old_test_status_id, new_test_status_id), an
+        # old status of None meaning the test history has just been created.
+        # Every change bumps the version of its run, also when its status
+        # stays the same.
+        test_run_deltas = {}
+        test_suite_history_deltas = {}
+
+        for (
+            test_history_id,
+            test_run_id,
+            test_suite_history_id,
+            old_test_status_id,
+            new_test_status_id,
+        ) in changes:
+            delta = {}
+            if old_test_status_id is None:
+                delta["tests_count"] = 1
+            elif old_test_status_id in STATUS_COLUMNS:
+                delta[STATUS_COLUMNS[old_test_status_id]] = -1
+            if new_test_status_id in STATUS_COLUMNS:
+                column = STATUS_COLUMNS[new_test_status_id]
+                delta[column] = delta.get(column, 0) + 1
+
+            slot = test_history_id % COUNTER_SLOTS
+            for deltas, key_id, key_delta in (
+                (test_run_deltas, test_run_id, {**delta, VERSION_COLUMN: 1}),
+                (test_suite_history_deltas, test_suite_history_id, delta),
+            ):
+                totals = deltas.setdefault((key_id, slot), {})
+                for column, value in key_delta.items():
+                    totals[column] = totals.get(column, 0) + value
+
+        Counters._upsert(
+            models.TestRunCounts,
+            "test_run_id",
+            test_run_deltas,
+            COUNT_COLUMNS + (VERSION_COLUMN,),
+        )
+        Counters._upsert(
+            models.TestSuiteHistoryCounts,
+            "test_suite_history_id",
+            test_suite_history_deltas,
+            COUNT_COLUMNS,
+        )
+        Counters._bump_projects(test_run_deltas)
+
+    @staticmethod
+    def touch(keys):
+        # Bumps the version of test runs for writes that leave their counts
+        # as they are. Each key is a tuple of (test_run_id, key_id), the id of
+        # the row written picking the slot.
+        test_run_deltas = {}
+        for test_run_id, key_id in keys:
+            delta = test_run_deltas.setdefault(
+                (test_run_id, key_id % COUNTER_SLOTS), {}
+            )
+            delta[VERSION_COLUMN] = delta.get(VERSION_COLUMN, 0) + 1
+
+        Counters._upsert(
+            models.TestRunCounts, "test_run_id", test_run_deltas, (VERSION_COLUMN,)
+        )
+        Counters._bump_projects(test_run_deltas)
+
+    @staticmethod
+    def touch_project(project_id, key_id):
+        # Bumps the version of a project for writes to its launches
+        Counters._upsert(
+            models.ProjectVersion,
+            "project_id",
+            {(project_id, key_id % COUNTER_SLOTS): {VERSION_COLUMN: 1}},
+            (VERSION_COLUMN,),
+        )
+
+    @staticmethod
+    def rebuild(test_run_id=None):
+        # Writers are blocked on the counter tables while they are recomputed
+        # so no increment is lost or counted twice. Counts are zeroed rather
+        # than deleted so test run versions keep growing.
+        db.session.execute(
+            "LOCK TABLE test_run_counts, test_suite_history_counts IN EXCLUSIVE MODE"
+        )
+
+        test_suite_history_ids = db.session.query(models.TestSuiteHistory.id).filter(
+            models.TestSuiteHistory.test_run_id == test_run_id
+        )
+
+        for counters, key, key_column, scope, bumped in (
+            (
+                models.TestRunCounts,
+                "test_run_id",
+                models.TestHistory.test_run_id,
+                models.TestRunCounts.test_run_id == test_run_id,
+                (VERSION_COLUMN,),
+            ),
+            (
+                models.TestSuiteHistoryCounts,
+                "test_suite_history_id",
+                models.TestHistory.test_suite_history_id,
+                models.TestSuiteHistoryCounts.test_suite_history_id.in_(
+                    test_suite_history_ids
+                ),
+                (),
+            ),
+        ):
+            history_counts = db.session.query(
+                key_column,
+                literal(0),
+                *TestCounts.history_columns(),
+                *[literal(1) for _ in bumped]
+            ).group_by(key_column)
+            stale_counts = db.session.query(counters)
+
+            if test_run_id is not None:
+                history_counts = history_counts.filter(
+                    models.TestHistory.test_run_id == test_run_id
+                )
+                stale_counts = stale_counts.filter(scope)
+
+            stale_counts.update(
+                {
+                    **{getattr(counters, column): 0 for column in COUNT_COLUMNS},
+                    **{
+                        getattr(counters, column): getattr(counters, column) + 1
+                        for column in bumped
+                    },
+                },
+                synchronize_session=False,
+            )
+            columns = COUNT_COLUMNS + bumped
+            statement = insert(counters.__table__).from_select(
+                [key, "slot"] + list(columns), history_counts.statement
+            )
+            db.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[key, "slot"],
+                    set_={
+                        column: counters.__table__.c[column]
+                        + statement.excluded[column]
+                        for column in columns
+                    },
+                )
+            )
+
+        # Projects showing the recomputed counts get a new version too
+        if test_run_id is not None:
+            Counters.touch([(test_run_id, test_run_id)])
+        else:
+            table = models.ProjectVersion.__table__
+            statement = insert(table).from_select(
+                ["project_id", "slot", VERSION_COLUMN],
+                db.session.query(models.Project.id, literal(0), literal(1)).statement,
+            )
+            db.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["project_id", "slot"],
+                    set_={VERSION_COLUMN: table.c.version + 1},
+                )
+            )
+
+        db.session.commit()
@@ -1,18 +1,217 @@
+import datetime
+import hashlib
 import models
-from app import db
+from app import app, db
 from data import constants
+from flask import g, has_app_context
 from logzero import logger
-from sqlalchemy import exc
-from sqlalchemy.sql import func
+from sqlalchemy import event, exc, exists, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Load, defer, joinedload
+from sqlalchemy.sql import func, or_
+from data.archive import Archive
+from data.blobs import Blobs
+from data.cache import LRUCache
+from data.clusters import FailureClusters
+from data.counters import Counters
+from data.durations import DurationSketches
+from data.fingerprint import Fingerprint
+from data.flaky import FINAL_STATUSES, FlakyStats
 from data.subqueries import TestCounts
+from data.trends import Trends
+from data.writebehind import WriteBehind
+
+# Upper bound of rows sent in a single multi-row statement
+BULK_CHUNK_SIZE = 1000
+
+# Rows fetched per round trip when streaming large results
+STREAM_BATCH_SIZE = 1000
+
+# Columns set when a test history completes, with the types its VALUES list
+# is cast to
+TEST_HISTORY_COMPLETION = (
+    ("id", "INTEGER"),
+    ("end_datetime", "TIMESTAMP"),
+    ("trace_hash", "VARCHAR"),
+    ("file", "VARCHAR"),
+    ("message_hash", "VARCHAR"),
+    ("error_type", "VARCHAR"),
+    ("retries", "INTEGER"),
+    ("test_status_id", "INTEGER"),
+    ("fingerprint", "VARCHAR"),
+)
+
+
+def chunks(items, size=BULK_CHUNK_SIZE):
+    for index in range(0, len(items), size):
+        yield items[index : index + size]
+
+
+def test_name_hash(name):
+    # Fixed width key of a test name within its suite, the same value as
+    # md5(name) in PostgreSQL
+    return hashlib.md5(name.encode("utf-8")).hexdigest()
+
+
+# Project, test suite and test ids by their natural keys. Catalog rows are
+# never renamed or deleted, so a cached id stays valid until it expires.
+catalog_cache = LRUCache(
+    app.config["CATALOG_CACHE_SIZE"], app.config["CATALOG_CACHE_TTL"]
+)
+
+# Trends by project id, each entry holding the version of the project they
+# were read at and the trends read for the project by their parameters. Every
+# write to a project changes its version, so a trend cached by any process
+# is only served while it is current.
+trend_cache = LRUCache(app.config["TREND_CACHE_SIZE"], app.config["TREND_CACHE_TTL"])
+
+
+def paginate(query, column, after=None, limit=None, descending=False):
+    # Keyset pagination: pages start after the last id seen by the client, so
+    # reading a deep page costs the same as reading the first one. One extra
+    # row is fetched to know whether there is a next page.
+    if descending:
+        if after is not None:
+            query = query.filter(column < after)
+        query = query.order_by(column.desc())
+    else:
+        if after is not None:
+            query = query.filter(column > after)
+        query = query.order_by(column)
+    if limit is not None:
+        query = query.limit(limit + 1)
+
+    return query
+
+
+def load_fields(model, columns=None, **relationships):
+    # Loader options reading only the given columns of model, and only the
+    # relationships whose name is among them. None reads everything.
+    if columns is None:
+        return list(relationships.values())
+
+    return [
+        Load(model).load_only(
+            *[column for column in columns if column in model.__table__.columns]
+        )
+    ] + [option for name, option in relationships.items() if name in columns]
+
+
+def invalidate_snapshots(*test_run_ids):
+    # Runs only get a snapshot once finished, so for runs still being written
+    # this deletes nothing
+    db.session.query(models.TestRunSnapshot).filter(
+        models.TestRunSnapshot.test_run_id.in_(test_run_ids)
+    ).delete(synchronize_session=False)
+
+
+def bump_versions(model, *ids):
+    # Versions back the ETags of the read endpoints. Bumping is left for last
+    # so the row lock is only held until the commit that follows.
+    db.session.query(model).filter(model.id.in_(ids)).update(
+        {model.version: model.version + 1}, synchronize_session=False
+    )
+
+
+def touch_test_run(test_run_id, key_id):
+    # Test run versions live in the counter slots, the id of the row written
+    # picks the slot so parallel writers of one run do not queue on one row.
+    # Test history writes bump them along with the counts.
+    invalidate_snapshots(test_run_id)
+    Counters.touch([(test_run_id, key_id)])
+
+
+def upsert(model, values, index_elements):
+    # INSERT ... ON CONFLICT DO NOTHING returns the id of the rows it
+    # inserts only. A row that was already there, or that a concurrent
+    # reporter inserted first, is read back instead, which leaves it
+    # untouched and unlocked.
+    statement = (
+        insert(model.__table__)
+        .values(**values)
+        .on_conflict_do_nothing(index_elements=index_elements)
+        .returning(model.id)
+    )
+
+    try:
+        row = db.session.execute(statement).first()
+        created = row is not None
+        if not created:
+            row = (
+                db.session.query(model.id)
+                .filter_by(**{column: values[column] for column in index_elements})
+                .one()
+            )
+    except exc.SQLAlchemyError as e:
+        logger.error(e)
+        db.session.rollback()
+        return None, False
+
+    if not session_commit():
+        return None, False
+
+    return row.id, created
+
+
+def in_unit_of_work():
+    return has_app_context() and g.get("unit_of_work", False)
+
+
+def begin_unit_of_work():
+    # Writes made from here on are only flushed by session_commit and
+    # committed together by end_unit_of_work
+    g.unit_of_work = True
+    g.unit_of_work_failed = False
+    g.after_commit = []
+
+
+def end_unit_of_work(commit=True):
+    failed = g.unit_of_work_failed
+    callbacks = g.after_commit
+    g.unit_of_work = False
+
+    if failed or not commit:
+        db.session.rollback()
+        return not failed
+
+    if not session_commit():
+        return False
+
+    for callback in callbacks:
+        callback()
+
+    return True
+
+
+def after_commit(callback):
+    # Side effects of a write, such as caching the id of a new row, must not
+    # outlive a unit of work that is eventually rolled back
+    if in_unit_of_work():
+        g.after_commit.append(callback)
+    else:
+        callback()
+
+
+@event.listens_for(db.session, "after_rollback")
+def abort_unit_of_work(session):
+    # A rollback discards everything flushed so far, so the rest of the unit
+    # of work must not be committed on its own
+    if in_unit_of_work():
+        g.unit_of_work_failed = True
 
 
 def session_commit():
     try:
-        db.session.commit()
+        if in_unit_of_work():
+            db.session.flush()
+        else:
+            db.session.commit()
     except exc.SQLAlchemyError as e:
         logger.error(e)
         db.session.rollback()
+        return False
+
+    return True
 
 
 class Create:
@@ -47,13 +246,22 @@ class Create:
 
     @staticmethod
     def create_project(name):
-        project = models.Project(
-            name=name, project_status_id=constants.Constants.project_status["Active"]
+        key = ("project", name)
+        project_id = catalog_cache.get(key)
+        if project_id is not None:
+            return project_id, False
+
+        project_id, created = upsert(
+            models.Project,
+            {
+                "name": name,
+                "project_status_id": constants.Constants.project_status["Active"],
+            },
+            ["name"],
         )
-        db.session.add(project)
-        session_commit()
+        after_commit(lambda: catalog_cache.set(key, project_id))
 
-        return project.id
+        return project_id, created
 
     @staticmethod
     def create_launch(name, data, project_id):
@@ -64,6 +272,8 @@ class Create:
             project_id=project_id,
         )
         db.session.add(launch)
+        db.session.flush()
+        Counters.touch_project(project_id, launch.id)
         session_commit()
 
         return launch.id
@@ -78,19 +288,32 @@ class Create:
             launch_id=launch_id,
         )
         db.session.add(test_run)
+        db.session.flush()
+        touch_test_run(test_run.id, test_run.id)
         session_commit()
 
         return test_run.id
 
     @staticmethod
     def create_test_suite(name, project_id, data, test_type):
-        test_suite = models.TestSuite(
-            name=name, project_id=project_id, data=data, test_type=test_type
+        key = ("test_suite", name, project_id, test_type)
+        test_suite_id = catalog_cache.get(key)
+        if test_suite_id is not None:
+            return test_suite_id, False
+
+        test_suite_id, created = upsert(
+            models.TestSuite,
+            {
+                "name": name,
+                "project_id": project_id,
+                "data": data,
+                "test_type": test_type,
+            },
+            ["name", "project_id", "test_type"],
         )
-        db.session.add(test_suite)
-        session_commit()
+        after_commit(lambda: catalog_cache.set(key, test_suite_id))
 
-        return test_suite.id
+        return test_suite_id, created
 
     @staticmethod
     def create_test_suite_history(data, start_datetime, test_run_id, test_suite_id):
@@ -102,24 +325,41 @@ class Create:
             test_suite_id=test_suite_id,
         )
         db.session.add(test_suite_history)
+        db.session.flush()
+        touch_test_run(test_run_id, test_suite_history.id)
         session_commit()
 
         return test_suite_history.id
 
     @staticmethod
     def create_test(name, data, test_suite_id):
-        test = models.Test(name=name, data=data, test_suite_id=test_suite_id)
-        db.session.add(test)
-        session_commit()
+        name_hash = test_name_hash(name)
+        key = ("test", test_suite_id, name_hash)
+        test_id = catalog_cache.get(key)
+        if test_id is not None:
+            return test_id, False
+
+        test_id, created = upsert(
+            models.Test,
+            {
+                "name": name,
+                "name_hash": name_hash,
+                "data": data,
+                "test_suite_id": test_suite_id,
+            },
+            ["test_suite_id", "name_hash"],
+        )
+        after_commit(lambda: catalog_cache.set(key, test_id))
 
-        return test.id
+        return test_id, created
 
     @staticmethod
     def create_test_history(
         start_datetime, test_id, test_run_id, test_suite_history_id
     ):
+        # Test history is partitioned on its start, so one is always set
         test_history = models.TestHistory(
-            start_datetime=start_datetime,
+            start_datetime=start_datetime or datetime.datetime.now(),
             test_id=test_id,
             test_status_id=constants.Constants.test_status["Running"],
             test_resolution_id=constants.Constants.test_resolution["Not set"],
@@ -127,10 +367,177 @@ class Create:
             test_suite_history_id=test_suite_history_id,
         )
         db.session.add(test_history)
+        db.session.flush()
+        Counters.apply(
+            [
+                (
+                    test_history.id,
+                    test_run_id,
+                    test_suite_history_id,
+                    None,
+                    test_history.test_status_id,
+                )
+            ]
+        )
+        invalidate_snapshots(test_run_id)
         session_commit()
 
         return test_history.id
 
+    @staticmethod
+    def create_test_histories(tests, test_run_id, test_suite_history_id, test_suite_id):
+        test_table = models.Test.__table__
+        test_history_table = models.TestHistory.__table__
+        name_hashes = {test["name"]: test_name_hash(test["name"]) for test in tests}
+        names = list(name_hashes)
+
+        test_ids = {}
+        for name in names:
+            test_id = catalog_cache.get(("test", test_suite_id, name_hashes[name]))
+            if test_id is not None:
+                test_ids[name] = test_id
+        uncached = [name for name in names if name not in test_ids]
+
+        try:
+            for names_chunk in chunks(uncached):
+                for test_id, name in (
+                    db.session.query(models.Test.id, models.Test.name)
+                    .filter(models.Test.test_suite_id == test_suite_id)
+                    .filter(
+                        models.Test.name_hash.in_(
+                            [name_hashes[name] for name in names_chunk]
+                        )
+                    )
+                ):
+                    test_ids[name] = test_id
+
+            # Tests created by a concurrent reporter since the lookup above
+            # are skipped by the insert and read back instead of failing the
+            # batch
+            missing = [name for name in names if name not in test_ids]
+            for names_chunk in chunks(missing):
+                rows = db.session.execute(
+                    insert(test_table)
+                    .values(
+                        [
+                            {
+                                "name": name,
+                                "name_hash": name_hashes[name],
+                                "test_suite_id": test_suite_id,
+                            }
+                            for name in names_chunk
+                        ]
+                    )
+                    .on_conflict_do_nothing(
+                        index_elements=["test_suite_id", "name_hash"]
+                    )
+                    .returning(test_table.c.id, test_table.c.name)
+                )
+                test_ids.update({name: test_id for test_id, name in rows})
+
+                raced = [name for name in names_chunk if name not in test_ids]
+                if raced:
+                    test_ids.update(
+                        {
+                            name: test_id
+                            for test_id, name in db.session.query(
+                                models.Test.id, models.Test.name
+                            )
+                            .filter(models.Test.test_suite_id == test_suite_id)
+                            .filter(
+                                models.Test.name_hash.in_(
+                                    [name_hashes[name] for name in raced]
+                                )
+                            )
+                        }
+                    )
+
+            # PostgreSQL does not guarantee the order of the rows RETURNING
+            # sends back, so ids are matched to the tests by their test id. A
+            # test repeated in a batch gets its ids in ascending order.
+            test_status_id = constants.Constants.test_status["Running"]
+            test_resolution_id = constants.Constants.test_resolution["Not set"]
+            now = datetime.datetime.now()
+            test_history_ids = []
+            for tests_chunk in chunks(tests):
+                rows = db.session.execute(
+                    test_history_table.insert()
+                    .values(
+                        [
+                            {
+                                "start_datetime": test.get("start_datetime") or now,
+                                "test_id": test_ids[test["name"]],
+                                "test_status_id": test_status_id,
+                                "test_resolution_id": test_resolution_id,
+                                "test_run_id": test_run_id,
+                                "test_suite_history_id": test_suite_history_id,
+                            }
+                            for test in tests_chunk
+                        ]
+                    )
+                    .returning(test_history_table.c.id, test_history_table.c.test_id)
+                )
+                ids_by_test = {}
+                for row in sorted(rows, key=lambda row: row.id):
+                    ids_by_test.setdefault(row.test_id, []).append(row.id)
+                test_history_ids.extend(
+                    ids_by_test[test_ids[test["name"]]].pop(0) for test in tests_chunk
+                )
+
+            Counters.apply(
+                [
+                    (
+                        test_history_id,
+                        test_run_id,
+                        test_suite_history_id,
+                        None,
+                        test_status_id,
+                    )
+                    for test_history_id in test_history_ids
+                ]
+            )
+            invalidate_snapshots(test_run_id)
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            return None
+
+        if not session_commit():
+            return None
+
+        def cache_test_ids():
+            for name, test_id in test_ids.items():
+                catalog_cache.set(("test", test_suite_id, name_hashes[name]), test_id)
+
+        after_commit(cache_test_ids)
+
+        return [
+            (test_history_id, test_ids[test["name"]])
+            for test_history_id, test in zip(test_history_ids, tests)
+        ]
+
+    @staticmethod
+    def create_test_run_snapshot(test_run_id, payload):
+        # Two readers may build the same snapshot concurrently, the first wins
+        try:
+            db.session.execute(
+                insert(models.TestRunSnapshot.__table__)
+                .values(
+                    test_run_id=test_run_id,
+                    payload=payload,
+                    created_datetime=datetime.datetime.utcnow(),
+                )
+                .on_conflict_do_nothing(index_elements=["test_run_id"])
+            )
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            return None
+
+        session_commit()
+
+        return test_run_id
+
 
 class Read:
     @staticmethod
@@ -169,7 +576,11 @@ class Read:
     @staticmethod
     def launch_by_id(launch_id):
         try:
-            launch = models.Launch.query.filter_by(id=launch_id).first()
+            launch = (
+                models.Launch.query.options(joinedload(models.Launch.project))
+                .filter_by(id=launch_id)
+                .first()
+            )
         except exc.SQLAlchemyError as e:
             logger.error(e)
             db.session.rollback()
@@ -178,58 +589,100 @@ class Read:
         return launch
 
     @staticmethod
-    def launch_by_project_id(project_id):
+    def project_version(project_id):
+        # Bumped by every write to a launch or test run of the project, read
+        # from its handful of version slots
+        try:
+            version = (
+                db.session.query(
+                    func.coalesce(func.sum(models.ProjectVersion.version), 0)
+                )
+                .filter(models.ProjectVersion.project_id == project_id)
+                .one()
+            )
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            version = None
 
-        t_counts = TestCounts()
+        return version
 
+    @staticmethod
+    def launch_version(launch_id):
         try:
-            launch = (
+            version = (
                 db.session.query(
-                    models.Launch,
-                    models.TestRun,
-                    t_counts.total_tests_by_test_run_id.c.tests_count,
-                    t_counts.failed_tests_by_test_run_id.c.failed_tests_count,
-                    t_counts.passed_tests_by_test_run_id.c.passed_tests_count,
-                    t_counts.running_tests_by_test_run_id.c.running_tests_count,
-                    t_counts.incomplete_tests_by_test_run_id.c.incomplete_tests_count,
-                    t_counts.skipped_tests_by_test_run_id.c.skipped_tests_count,
+                    models.Launch.version,
+                    func.coalesce(func.sum(models.TestRunCounts.version), 0),
                 )
+                .outerjoin(models.TestRun, models.TestRun.launch_id == models.Launch.id)
                 .outerjoin(
-                    t_counts.total_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.total_tests_by_test_run_id.c.test_run_id,
+                    models.TestRunCounts,
+                    models.TestRunCounts.test_run_id == models.TestRun.id,
                 )
-                .outerjoin(
-                    t_counts.failed_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.failed_tests_by_test_run_id.c.test_run_id,
-                )
-                .outerjoin(
-                    t_counts.passed_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.passed_tests_by_test_run_id.c.test_run_id,
-                )
-                .outerjoin(
-                    t_counts.running_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.running_tests_by_test_run_id.c.test_run_id,
-                )
-                .outerjoin(
-                    t_counts.incomplete_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.incomplete_tests_by_test_run_id.c.test_run_id,
+                .filter(models.Launch.id == launch_id)
+                .group_by(models.Launch.id)
+                .first()
+            )
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            version = None
+
+        return version
+
+    @staticmethod
+    def launch_by_project_id(project_id, after=None, limit=None):
+
+        # Newest launches first, the page of launches is picked before their
+        # test runs and counts are read. Runs of archived launches are read
+        # back from their launch's file.
+        has_test_runs = exists().where(models.TestRun.launch_id == models.Launch.id)
+        launch_ids = (
+            db.session.query(models.Launch.id)
+            .filter(models.Launch.project_id == project_id)
+            .filter(
+                or_(
+                    has_test_runs,
+                    exists().where(
+                        models.ArchivedTestRun.launch_id == models.Launch.id
+                    ),
                 )
-                .outerjoin(
-                    t_counts.skipped_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.skipped_tests_by_test_run_id.c.test_run_id,
+            )
+        )
+        launch_ids = paginate(
+            launch_ids, models.Launch.id, after, limit, descending=True
+        ).subquery()
+        test_run_ids = db.session.query(models.TestRun.id).filter(
+            models.TestRun.launch_id.in_(db.session.query(launch_ids.c.id))
+        )
+        t_counts = TestCounts.by_test_run_id(test_run_ids)
+
+        try:
+            launch = (
+                db.session.query(
+                    models.Launch, models.TestRun, *TestCounts.columns(t_counts)
                 )
+                .outerjoin(t_counts, models.TestRun.id == t_counts.c.test_run_id)
+                .options(joinedload(models.Launch.project))
                 .filter(models.TestRun.launch_id == models.Launch.id)
-                .filter(models.Launch.project_id == project_id)
-                .order_by(models.Launch.id.desc())
+                .filter(models.Launch.id.in_(db.session.query(launch_ids.c.id)))
+                .order_by(models.Launch.id.desc(), models.TestRun.id)
                 .all()
             )
-        except exc.SQLAlchemyError as e:
+            archived_launches = (
+                models.Launch.query.options(joinedload(models.Launch.project))
+                .filter(models.Launch.id.in_(db.session.query(launch_ids.c.id)))
+                .filter(~has_test_runs)
+                .all()
+            )
+            for archived_launch in archived_launches:
+                launch.extend(
+                    (archived_launch,) + row
+                    for row in Archive.test_runs(archived_launch.id)
+                )
+            launch.sort(key=lambda row: (-row[0].id, row[1].id))
+        except (exc.SQLAlchemyError, OSError, ValueError) as e:
             logger.error(e)
             db.session.rollback()
             launch = None
@@ -237,9 +690,19 @@ class Read:
         return launch
 
     @staticmethod
-    def test_run_by_id(test_run_id):
+    def test_run_by_id(test_run_id, columns=None):
         try:
-            test_run = models.TestRun.query.filter_by(id=test_run_id).first()
+            test_run = (
+                models.TestRun.query.options(
+                    *load_fields(
+                        models.TestRun,
+                        columns,
+                        launch=joinedload(models.TestRun.launch),
+                    )
+                )
+                .filter_by(id=test_run_id)
+                .first()
+            )
         except exc.SQLAlchemyError as e:
             logger.error(e)
             db.session.rollback()
@@ -248,54 +711,52 @@ class Read:
         return test_run
 
     @staticmethod
-    def test_run_by_launch_id(launch_id):
+    def test_run_version(test_run_id):
+        try:
+            test_run_version = (
+                db.session.query(
+                    func.coalesce(func.sum(models.TestRunCounts.version), 0)
+                )
+                .filter(models.TestRunCounts.test_run_id == test_run_id)
+                .as_scalar()
+            )
+            version = (
+                db.session.query(test_run_version, models.Launch.version)
+                .filter(models.TestRun.launch_id == models.Launch.id)
+                .filter(models.TestRun.id == test_run_id)
+                .first()
+            )
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            version = None
+
+        return version
+
+    @staticmethod
+    def test_run_by_launch_id(launch_id, after=None, limit=None, columns=None):
 
-        t_counts = TestCounts()
+        test_run_ids = db.session.query(models.TestRun.id).filter(
+            models.TestRun.launch_id == launch_id
+        )
+        t_counts = TestCounts.by_test_run_id(test_run_ids)
 
         try:
             test_run = (
-                db.session.query(
-                    models.TestRun,
-                    t_counts.total_tests_by_test_run_id.c.tests_count,
-                    t_counts.failed_tests_by_test_run_id.c.failed_tests_count,
-                    t_counts.passed_tests_by_test_run_id.c.passed_tests_count,
-                    t_counts.running_tests_by_test_run_id.c.running_tests_count,
-                    t_counts.incomplete_tests_by_test_run_id.c.incomplete_tests_count,
-                    t_counts.skipped_tests_by_test_run_id.c.skipped_tests_count,
-                )
-                .outerjoin(
-                    t_counts.total_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.total_tests_by_test_run_id.c.test_run_id,
-                )
-                .outerjoin(
-                    t_counts.failed_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.failed_tests_by_test_run_id.c.test_run_id,
-                )
-                .outerjoin(
-                    t_counts.passed_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.passed_tests_by_test_run_id.c.test_run_id,
-                )
-                .outerjoin(
-                    t_counts.running_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.running_tests_by_test_run_id.c.test_run_id,
-                )
-                .outerjoin(
-                    t_counts.incomplete_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.incomplete_tests_by_test_run_id.c.test_run_id,
-                )
-                .outerjoin(
-                    t_counts.skipped_tests_by_test_run_id,
-                    models.TestRun.id
-                    == t_counts.skipped_tests_by_test_run_id.c.test_run_id,
+                db.session.query(models.TestRun, *TestCounts.columns(t_counts))
+                .outerjoin(t_counts, models.TestRun.id == t_counts.c.test_run_id)
+                .options(
+                    *load_fields(
+                        models.TestRun,
+                        columns,
+                        launch=joinedload(models.TestRun.launch).joinedload(
+                            models.Launch.project
+                        ),
+                    )
                 )
                 .filter(models.TestRun.launch_id == launch_id)
-                .order_by(models.TestRun.id)
             )
+            test_run = paginate(test_run, models.TestRun.id, after, limit)
         except exc.SQLAlchemyError as e:
             logger.error(e)
             db.session.rollback()
@@ -303,6 +764,54 @@ class Read:
 
         return test_run
 
+    @staticmethod
+    def test_run_snapshot(test_run_id):
+        try:
+            snapshot = models.TestRunSnapshot.query.filter_by(
+                test_run_id=test_run_id
+            ).first()
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            snapshot = None
+
+        return snapshot
+
+    @staticmethod
+    def archived_test_run(test_run_id):
+        try:
+            archived = Archive.test_run(test_run_id)
+        except (exc.SQLAlchemyError, OSError, ValueError) as e:
+            logger.error(e)
+            db.session.rollback()
+            archived = None
+
+        return archived
+
+    @staticmethod
+    def archived_test_run_by_launch_id(launch_id, after=None, limit=None):
+        # Rows of test_run_by_launch_id for an archived launch, None when the
+        # launch was not archived
+        try:
+            archived = (
+                db.session.query(models.ArchivedTestRun.test_run_id)
+                .filter(models.ArchivedTestRun.launch_id == launch_id)
+                .first()
+            )
+            test_runs = Archive.test_runs(launch_id) if archived else None
+        except (exc.SQLAlchemyError, OSError, ValueError) as e:
+            logger.error(e)
+            db.session.rollback()
+            test_runs = None
+
+        if test_runs is not None:
+            if after is not None:
+                test_runs = [row for row in test_runs if row[0].id > after]
+            if limit is not None:
+                test_runs = test_runs[: limit + 1]
+
+        return test_runs
+
     @staticmethod
     def test_runs_failed_by_launch_id(launch_id):
         try:
@@ -342,9 +851,13 @@ class Read:
         return test_suite
 
     @staticmethod
-    def test_by_name(test_name):
+    def test_by_name(test_name, test_suite_id):
         try:
-            test = models.Test.query.filter_by(name=test_name).first()
+            test = models.Test.query.filter_by(
+                test_suite_id=test_suite_id,
+                name_hash=test_name_hash(test_name),
+                name=test_name,
+            ).first()
         except exc.SQLAlchemyError as e:
             logger.error(e)
             db.session.rollback()
@@ -364,14 +877,41 @@ class Read:
         return test
 
     @staticmethod
-    def test_suite_history_by_test_run(test_run_id):
+    def test_history_by_id(test_history_id):
+        try:
+            test_history = models.TestHistory.query.filter_by(
+                id=test_history_id
+            ).first()
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            test_history = None
+
+        return test_history
+
+    @staticmethod
+    def blob_texts(keys):
+        try:
+            texts = Blobs.load(keys)
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            texts = {}
+
+        return texts
+
+    @staticmethod
+    def test_suite_history_by_test_run(test_run_id, after=None, limit=None):
         try:
             test_suite_history = (
                 db.session.query(models.TestRun, models.TestSuiteHistory)
+                .options(joinedload(models.TestSuiteHistory.test_suite))
                 .filter(models.TestRun.id == models.TestSuiteHistory.test_run_id)
                 .filter(models.TestRun.id == test_run_id)
-                .all()
             )
+            test_suite_history = paginate(
+                test_suite_history, models.TestSuiteHistory.id, after, limit
+            ).all()
         except exc.SQLAlchemyError as e:
             logger.error(e)
             db.session.rollback()
@@ -381,18 +921,21 @@ class Read:
 
     @staticmethod
     def test_suite_history_by_test_status_and_test_run_id(
-        test_suite_status_id, test_run_id
+        test_suite_status_id, test_run_id, after=None, limit=None
     ):
         try:
             test_suite_history = (
                 db.session.query(models.TestRun, models.TestSuiteHistory)
+                .options(joinedload(models.TestSuiteHistory.test_suite))
                 .filter(models.TestRun.id == models.TestSuiteHistory.test_run_id)
                 .filter(models.TestRun.id == test_run_id)
                 .filter(
                     models.TestSuiteHistory.test_suite_status_id == test_suite_status_id
                 )
-                .all()
             )
+            test_suite_history = paginate(
+                test_suite_history, models.TestSuiteHistory.id, after, limit
+            ).all()
         except exc.SQLAlchemyError as e:
             logger.error(e)
             db.session.rollback()
@@ -401,65 +944,79 @@ class Read:
         return test_suite_history
 
     @staticmethod
-    def test_history_by_test_run(test_run_id):
+    def _test_history_date_bounds(test_run_ids):
+        # Test history is partitioned by month of its start. Tests start
+        # while their run does, so bounding the start by the runs' lets the
+        # planner skip the partitions they cannot be in. The slack covers
+        # clock differences between reporters.
+        runs, started, finished, first_start, last_end = (
+            db.session.query(
+                func.count(),
+                func.count(models.TestRun.start_datetime),
+                func.count(models.TestRun.end_datetime),
+                func.min(models.TestRun.start_datetime),
+                func.max(models.TestRun.end_datetime),
+            )
+            .filter(models.TestRun.id.in_(test_run_ids))
+            .one()
+        )
+        slack = datetime.timedelta(hours=app.config["TEST_HISTORY_DATE_SLACK_HOURS"])
 
-        t_counts = TestCounts()
+        bounds = []
+        if runs and started == runs:
+            bounds.append(models.TestHistory.start_datetime >= first_start - slack)
+        if runs and finished == runs:
+            bounds.append(models.TestHistory.start_datetime < last_end + slack)
 
-        try:
-            test_history = (
-                db.session.query(
-                    models.TestRun,
-                    models.TestSuiteHistory,
+        return bounds
+
+    @staticmethod
+    def _test_history_by_test_run_query(test_run_id, columns=None):
+
+        t_counts = TestCounts.by_test_suite_history_id(test_run_id)
+
+        return (
+            db.session.query(
+                models.TestRun,
+                models.TestSuiteHistory,
+                models.TestHistory,
+                *TestCounts.columns(t_counts)
+            )
+            .outerjoin(
+                t_counts,
+                models.TestSuiteHistory.id == t_counts.c.test_suite_history_id,
+            )
+            .options(
+                joinedload(models.TestRun.launch).joinedload(models.Launch.project),
+                joinedload(models.TestSuiteHistory.test_suite),
+                *load_fields(
                     models.TestHistory,
-                    t_counts.total_tests_by_test_suite_history_id.c.tests_count,
-                    t_counts.failed_tests_by_test_suite_history_id.c.failed_tests_count,
-                    t_counts.passed_tests_by_test_suite_history_id.c.passed_tests_count,
-                    t_counts.running_tests_by_test_suite_history_id.c.running_tests_count,
-                    t_counts.incomplete_tests_by_test_suite_history_id.c.incomplete_tests_count,
-                    t_counts.skipped_tests_by_test_suite_history_id.c.skipped_tests_count,
-                )
-                .outerjoin(
-                    t_counts.total_tests_by_test_suite_history_id,
-                    models.TestSuiteHistory.id
-                    == t_counts.total_tests_by_test_suite_history_id.c.test_suite_history_id,
-                )
-                .outerjoin(
-                    t_counts.failed_tests_by_test_suite_history_id,
-                    models.TestSuiteHistory.id
-                    == t_counts.failed_tests_by_test_suite_history_id.c.test_suite_history_id,
-                )
-                .outerjoin(
-                    t_counts.passed_tests_by_test_suite_history_id,
-                    models.TestSuiteHistory.id
-                    == t_counts.passed_tests_by_test_suite_history_id.c.test_suite_history_id,
-                )
-                .outerjoin(
-                    t_counts.running_tests_by_test_suite_history_id,
-                    models.TestSuiteHistory.id
-                    == t_counts.running_tests_by_test_suite_history_id.c.test_suite_history_id,
-                )
-                .outerjoin(
-                    t_counts.incomplete_tests_by_test_suite_history_id,
-                    models.TestSuiteHistory.id
-                    == t_counts.incomplete_tests_by_test_suite_history_id.c.test_suite_history_id,
+                    columns,
+                    test=joinedload(models.TestHistory.test),
                 )
-                .outerjoin(
-                    t_counts.skipped_tests_by_test_suite_history_id,
-                    models.TestSuiteHistory.id
-                    == t_counts.skipped_tests_by_test_suite_history_id.c.test_suite_history_id,
-                )
-                .filter(models.TestRun.id == models.TestSuiteHistory.test_run_id)
-                .filter(
-                    models.TestSuiteHistory.test_run_id
-                    == models.TestHistory.test_run_id
-                )
-                .filter(
-                    models.TestSuiteHistory.id
-                    == models.TestHistory.test_suite_history_id
-                )
-                .filter(models.TestRun.id == test_run_id)
-                .all()
             )
+            .filter(models.TestRun.id == models.TestSuiteHistory.test_run_id)
+            .filter(
+                models.TestSuiteHistory.test_run_id == models.TestHistory.test_run_id
+            )
+            .filter(
+                models.TestSuiteHistory.id == models.TestHistory.test_suite_history_id
+            )
+            .filter(models.TestRun.id == test_run_id)
+            .filter(*Read._test_history_date_bounds([test_run_id]))
+            # A run is read back from its archive as soon as it is recorded
+            # as archived, while its rows are still being deleted
+            .filter(
+                ~exists().where(models.ArchivedTestRun.test_run_id == models.TestRun.id)
+            )
+        )
+
+    @staticmethod
+    def test_history_by_test_run(test_run_id, columns=None):
+        try:
+            test_history = Read._test_history_by_test_run_query(
+                test_run_id, columns
+            ).all()
         except exc.SQLAlchemyError as e:
             logger.error(e)
             db.session.rollback()
@@ -468,10 +1025,33 @@ class Read:
         return test_history
 
     @staticmethod
-    def test_history_by_test_status_and_test_run_id(test_status_id, test_run_id):
+    def test_history_by_test_run_stream(test_run_id, columns=None):
+        # Rows are fetched lazily through a server side cursor, grouped by
+        # test suite history
+        return (
+            Read._test_history_by_test_run_query(test_run_id, columns)
+            .order_by(models.TestSuiteHistory.id, models.TestHistory.id)
+            .yield_per(STREAM_BATCH_SIZE)
+        )
+
+    @staticmethod
+    def test_history_by_test_status_and_test_run_id(
+        test_status_id, test_run_id, after=None, limit=None, columns=None
+    ):
         try:
-            test_history = models.TestHistory.query.filter_by(
-                test_status_id=test_status_id, test_run_id=test_run_id
+            test_history = (
+                models.TestHistory.query.options(
+                    *load_fields(
+                        models.TestHistory,
+                        columns,
+                        test=joinedload(models.TestHistory.test),
+                    )
+                )
+                .filter_by(test_status_id=test_status_id, test_run_id=test_run_id)
+                .filter(*Read._test_history_date_bounds([test_run_id]))
+            )
+            test_history = paginate(
+                test_history, models.TestHistory.id, after, limit
             ).all()
         except exc.SQLAlchemyError as e:
             logger.error(e)
@@ -481,10 +1061,19 @@ class Read:
         return test_history
 
     @staticmethod
-    def test_history_by_test_status_id(test_status_id):
+    def test_history_by_test_status_id(
+        test_status_id, after=None, limit=None, columns=None
+    ):
         try:
-            test_history = models.TestHistory.query.filter_by(
-                test_status_id=test_status_id
+            test_history = models.TestHistory.query.options(
+                *load_fields(
+                    models.TestHistory,
+                    columns,
+                    test=joinedload(models.TestHistory.test),
+                )
+            ).filter_by(test_status_id=test_status_id)
+            test_history = paginate(
+                test_history, models.TestHistory.id, after, limit
             ).all()
         except exc.SQLAlchemyError as e:
             logger.error(e)
@@ -494,10 +1083,19 @@ class Read:
         return test_history
 
     @staticmethod
-    def test_history_by_test_resolution_id(test_resolution_id):
+    def test_history_by_test_resolution_id(
+        test_resolution_id, after=None, limit=None, columns=None
+    ):
         try:
-            test_history = models.TestHistory.query.filter_by(
-                test_resolution_id=test_resolution_id
+            test_history = models.TestHistory.query.options(
+                *load_fields(
+                    models.TestHistory,
+                    columns,
+                    test=joinedload(models.TestHistory.test),
+                )
+            ).filter_by(test_resolution_id=test_resolution_id)
+            test_history = paginate(
+                test_history, models.TestHistory.id, after, limit
             ).all()
         except exc.SQLAlchemyError as e:
             logger.error(e)
@@ -507,15 +1105,20 @@ class Read:
         return test_history
 
     @staticmethod
-    def test_history_by_test_suite_id(test_suite_id):
+    def test_history_by_test_suite_id(
+        test_suite_id, after=None, limit=None, columns=None
+    ):
         try:
             test_history = (
                 db.session.query(models.TestHistory, models.Test, models.TestSuite)
+                .options(*load_fields(models.TestHistory, columns))
                 .filter(models.Test.test_suite_id == models.TestSuite.id)
                 .filter(models.TestHistory.test_id == models.Test.id)
                 .filter(models.Test.test_suite_id == test_suite_id)
-                .all()
             )
+            test_history = paginate(
+                test_history, models.TestHistory.id, after, limit
+            ).all()
         except exc.SQLAlchemyError as e:
             logger.error(e)
             db.session.rollback()
@@ -523,6 +1126,198 @@ class Read:
 
         return test_history
 
+    @staticmethod
+    def _failure_clusters_by_test_run_ids(test_run_ids, project_id):
+        # Failures of the runs grouped by fingerprint, read from the partial
+        # index on fingerprinted test history alone
+        try:
+            failures = (
+                db.session.query(
+                    models.TestHistory.fingerprint,
+                    func.count().label("failures"),
+                    func.count(models.TestHistory.test_id.distinct()).label("tests"),
+                )
+                .filter(models.TestHistory.test_run_id.in_(test_run_ids))
+                .filter(models.TestHistory.fingerprint.isnot(None))
+                .filter(*Read._test_history_date_bounds(test_run_ids))
+                .group_by(models.TestHistory.fingerprint)
+                .subquery()
+            )
+            clusters = (
+                db.session.query(
+                    models.FailureCluster, failures.c.failures, failures.c.tests
+                )
+                .join(
+                    failures,
+                    models.FailureCluster.fingerprint == failures.c.fingerprint,
+                )
+                .filter(models.FailureCluster.project_id == project_id)
+                .order_by(failures.c.failures.desc(), models.FailureCluster.id)
+                .all()
+            )
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            clusters = None
+
+        return clusters
+
+    @staticmethod
+    def failure_clusters_by_test_run_id(test_run_id):
+        project_id = (
+            db.session.query(models.Launch.project_id)
+            .filter(models.Launch.id == models.TestRun.launch_id)
+            .filter(models.TestRun.id == test_run_id)
+            .as_scalar()
+        )
+
+        return Read._failure_clusters_by_test_run_ids([test_run_id], project_id)
+
+    @staticmethod
+    def failure_clusters_by_launch_id(launch_id):
+        test_run_ids = db.session.query(models.TestRun.id).filter(
+            models.TestRun.launch_id == launch_id
+        )
+        project_id = (
+            db.session.query(models.Launch.project_id)
+            .filter(models.Launch.id == launch_id)
+            .as_scalar()
+        )
+
+        return Read._failure_clusters_by_test_run_ids(test_run_ids, project_id)
+
+    @staticmethod
+    def failure_clusters_by_project_id(project_id, after=None, limit=None):
+        try:
+            clusters = models.FailureCluster.query.filter(
+                models.FailureCluster.project_id == project_id
+            ).filter(models.FailureCluster.failures > 0)
+            clusters = paginate(
+                clusters, models.FailureCluster.id, after, limit, descending=True
+            ).all()
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            clusters = None
+
+        return clusters
+
+    @staticmethod
+    def failure_cluster_tests(failure_cluster_id, after=None, limit=None):
+        try:
+            tests = (
+                db.session.query(models.Test)
+                .filter(models.Test.id == models.FailureClusterTest.test_id)
+                .filter(
+                    models.FailureClusterTest.failure_cluster_id == failure_cluster_id
+                )
+            )
+            tests = paginate(tests, models.Test.id, after, limit).all()
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            tests = None
+
+        return tests
+
+    @staticmethod
+    def flaky_tests_by_project_id(project_id, limit):
+        # Ranked from the index on the stored flakiness of each test
+        try:
+            tests = (
+                db.session.query(models.TestFlakyStats, models.Test)
+                .filter(models.TestFlakyStats.test_id == models.Test.id)
+                .filter(models.TestFlakyStats.project_id == project_id)
+                .filter(models.TestFlakyStats.flakiness > 0)
+                .order_by(
+                    models.TestFlakyStats.flakiness.desc(),
+                    models.TestFlakyStats.test_id,
+                )
+                .limit(limit)
+                .all()
+            )
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            tests = None
+
+        return tests
+
+    @staticmethod
+    def duration_sketch_by_test_id(test_id):
+        try:
+            sketch = models.TestDurationSketch.query.filter_by(test_id=test_id).first()
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            sketch = None
+
+        return sketch
+
+    @staticmethod
+    def duration_sketches_by_test_suite_id(test_suite_id):
+        try:
+            sketches = [
+                row.sketch
+                for row in db.session.query(models.TestDurationSketch.sketch).filter(
+                    models.TestDurationSketch.test_suite_id == test_suite_id
+                )
+            ]
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            sketches = None
+
+        return sketches
+
+    @staticmethod
+    def slowest_tests_by_project_id(project_id, limit):
+        # Ranked from the index on the stored p95 of each test
+        try:
+            tests = (
+                db.session.query(models.TestDurationSketch, models.Test)
+                .options(defer(models.TestDurationSketch.sketch))
+                .filter(models.TestDurationSketch.test_id == models.Test.id)
+                .filter(models.TestDurationSketch.project_id == project_id)
+                .filter(models.TestDurationSketch.p95.isnot(None))
+                .order_by(
+                    models.TestDurationSketch.p95.desc(),
+                    models.TestDurationSketch.test_id,
+                )
+                .limit(limit)
+                .all()
+            )
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            tests = None
+
+        return tests
+
+    @staticmethod
+    def project_trend(project_id, launches=None, start=None, end=None):
+        # The version is read first, so a write landing before the trend is
+        # read only makes the next read compute it again
+        version = Read.project_version(project_id)
+        key = (launches, start, end)
+        cached_version, trends = trend_cache.get(project_id) or (None, {})
+        if version is None or cached_version != version:
+            trends = {}
+        if key in trends:
+            return trends[key]
+
+        try:
+            trend = Trends.of(project_id, launches, start, end)
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            return None
+
+        if version is not None:
+            trend_cache.set(project_id, (version, {**trends, key: trend}))
+
+        return trend
+
 
 class Update:
     @staticmethod
@@ -536,26 +1331,215 @@ class Update:
         retries,
         test_status,
     ):
-        test_history = db.session.query(models.TestHistory).get(test_history_id)
-        test_history.end_datetime = end_datetime
-        test_history.trace = trace
-        test_history.file = file
-        test_history.message = message
-        test_history.error_type = error_type
-        test_history.retries = retries
-        test_history.test_status_id = constants.Constants.test_status.get(test_status)
+        updated = Update.update_test_histories(
+            [
+                {
+                    "test_history_id": test_history_id,
+                    "end_datetime": end_datetime,
+                    "trace": trace,
+                    "file": file,
+                    "message": message,
+                    "error_type": error_type,
+                    "retries": retries,
+                    "test_status": test_status,
+                }
+            ]
+        )
 
-        session_commit()
+        return test_history_id if updated else None
 
-        return test_history.id
+    @staticmethod
+    def update_test_histories(items):
+        # Items with the same test history id are applied last one wins
+        completions = {item["test_history_id"]: item for item in items}
+
+        try:
+            # Rows are locked in id order so concurrent batches cannot deadlock
+            current = []
+            for ids_chunk in chunks(sorted(completions)):
+                current.extend(
+                    db.session.query(
+                        models.TestHistory.id,
+                        models.TestHistory.test_run_id,
+                        models.TestHistory.test_suite_history_id,
+                        models.TestHistory.test_status_id,
+                        models.TestHistory.test_id,
+                        models.TestHistory.fingerprint,
+                    )
+                    .filter(models.TestHistory.id.in_(ids_chunk))
+                    .order_by(models.TestHistory.id)
+                    .with_for_update()
+                    .all()
+                )
+
+            # Every row bumps the version of its run, rows keeping their
+            # status leave the counts as they are
+            changes = []
+            outcomes = []
+            completed = set()
+            for row in current:
+                new = constants.Constants.test_status.get(
+                    completions[row.id]["test_status"]
+                )
+                changes.append(
+                    (
+                        row.id,
+                        row.test_run_id,
+                        row.test_suite_history_id,
+                        row.test_status_id,
+                        new,
+                    )
+                )
+                if new != row.test_status_id:
+                    # A test history adds one outcome, when it first reaches
+                    # a final status
+                    if row.test_status_id not in FINAL_STATUSES:
+                        outcomes.append(
+                            (row.test_id, new, completions[row.id]["retries"])
+                        )
+                        if new in FINAL_STATUSES:
+                            completed.add(row.id)
+            Counters.apply(changes)
+            FlakyStats.apply(outcomes)
+
+            ids = [row.id for row in current]
+            trace_hashes = dict(
+                zip(ids, Blobs.store([completions[id_]["trace"] for id_ in ids]))
+            )
+            message_hashes = dict(
+                zip(ids, Blobs.store([completions[id_]["message"] for id_ in ids]))
+            )
+
+            # Only failures are fingerprinted
+            fingerprints = {}
+            for id_ in ids:
+                item = completions[id_]
+                if item["test_status"] == "Failed":
+                    fingerprints[id_] = Fingerprint.of(
+                        item["error_type"], item["message"], item["trace"]
+                    )
+            Update._apply_failure_clusters(
+                current, completions, fingerprints, message_hashes
+            )
+
+            durations = []
+            for current_chunk in chunks(current):
+                values = []
+                params = {}
+                for index, row in enumerate(current_chunk):
+                    item = completions[row.id]
+                    row_params = {
+                        "id": row.id,
+                        "end_datetime": item["end_datetime"],
+                        "trace_hash": trace_hashes[row.id],
+                        "file": item["file"],
+                        "message_hash": message_hashes[row.id],
+                        "error_type": item["error_type"],
+                        "retries": item["retries"],
+                        "test_status_id": constants.Constants.test_status.get(
+                            item["test_status"]
+                        ),
+                        "fingerprint": fingerprints.get(row.id),
+                    }
+                    values.append(
+                        "("
+                        + ", ".join(
+                            "CAST(:{}_{} AS {})".format(column, index, sql_type)
+                            for column, sql_type in TEST_HISTORY_COMPLETION
+                        )
+                        + ")"
+                    )
+                    params.update(
+                        {
+                            "{}_{}".format(column, index): value
+                            for column, value in row_params.items()
+                        }
+                    )
+                # Dates come back parsed by the database, whatever the format
+                # the reporter sent
+                updated = db.session.execute(
+                    text(
+                        "UPDATE test_history SET {} FROM (VALUES {}) AS v ({}) "
+                        "WHERE test_history.id = v.id RETURNING test_history.id, "
+                        "test_history.test_id, test_history.start_datetime, "
+                        "test_history.end_datetime".format(
+                            ", ".join(
+                                "{0} = v.{0}".format(column)
+                                for column, _ in TEST_HISTORY_COMPLETION[1:]
+                            ),
+                            ", ".join(values),
+                            ", ".join(column for column, _ in TEST_HISTORY_COMPLETION),
+                        )
+                    ).columns(
+                        models.TestHistory.id,
+                        models.TestHistory.test_id,
+                        models.TestHistory.start_datetime,
+                        models.TestHistory.end_datetime,
+                    ),
+                    params,
+                )
+                durations.extend(
+                    (row.test_id, row.start_datetime, row.end_datetime)
+                    for row in updated
+                    if row.id in completed
+                )
+            DurationSketches.apply(durations)
+
+            invalidate_snapshots(*{row.test_run_id for row in current})
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            return None
+
+        if not session_commit():
+            return None
+
+        return [row.id for row in current]
+
+    @staticmethod
+    def _apply_failure_clusters(current, completions, fingerprints, message_hashes):
+        moved = [row for row in current if fingerprints.get(row.id) != row.fingerprint]
+        if not moved:
+            return
+
+        # Clusters are seen when their failures are recorded, end dates come
+        # from the reporters in whatever format they send
+        seen = datetime.datetime.now()
+        project_ids = dict(
+            db.session.query(models.TestRun.id, models.Launch.project_id)
+            .filter(models.TestRun.launch_id == models.Launch.id)
+            .filter(models.TestRun.id.in_({row.test_run_id for row in moved}))
+            .all()
+        )
+        FailureClusters.apply(
+            [
+                (
+                    project_ids[row.test_run_id],
+                    row.test_id,
+                    row.fingerprint,
+                    fingerprints.get(row.id),
+                    seen,
+                    completions[row.id]["error_type"],
+                    message_hashes[row.id],
+                )
+                for row in moved
+            ]
+        )
 
     @staticmethod
     def update_test_history_resolution(test_history_id, test_resolution):
+        # None when the test history does not exist, or has been archived
         test_history = db.session.query(models.TestHistory).get(test_history_id)
+        if test_history is None or (
+            db.session.query(models.ArchivedTestRun).get(test_history.test_run_id)
+        ):
+            return None
+
         test_history.test_resolution_id = constants.Constants.test_resolution.get(
             test_resolution
         )
 
+        touch_test_run(test_history.test_run_id, test_history.id)
         session_commit()
 
         return test_history.id
@@ -573,6 +1557,7 @@ class Update:
             test_suite_status
         )
 
+        touch_test_run(test_suite_history.test_run_id, test_suite_history.id)
         session_commit()
 
         return test_suite_history.id
@@ -586,6 +1571,7 @@ class Update:
             test_run_status
         )
 
+        touch_test_run(test_run_id, test_run_id)
         session_commit()
 
         return test_run.id
@@ -595,6 +1581,18 @@ class Update:
         launch = db.session.query(models.Launch).get(launch_id)
         launch.launch_status_id = constants.Constants.launch_status.get(launch_status)
 
+        bump_versions(models.Launch, launch_id)
+        Counters.touch_project(launch.project_id, launch_id)
         session_commit()
 
         return launch.id
+
+
+# Test history completions accepted while write-behind is enabled
+test_history_writer = WriteBehind(
+    app,
+    Update.update_test_histories,
+    app.config["WRITE_BEHIND_QUEUE_SIZE"],
+    app.config["WRITE_BEHIND_INTERVAL_MS"] / 1000,
+    app.config["WRITE_BEHIND_BATCH_SIZE"],
+)
@@ -0,0 +1,180 @@
+import datetime
+import itertools
+import models
+from app import db
+from data.flaky import FINAL_STATUSES
+from data.sketch import DDSketch
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.postgresql import insert
+
+# Quantiles stored next to each sketch, the p95 one is indexed to rank tests
+STORED_QUANTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+
+
+def duration_ms(start_datetime, end_datetime):
+    if start_datetime is None or end_datetime is None:
+        return None
+    if end_datetime < start_datetime:
+        return None
+
+    return (end_datetime - start_datetime).total_seconds() * 1000
+
+
+class DurationSketches:
+
+    # A duration sketch per test, in milliseconds, kept up to date by the
+    # writers. Suites are answered by merging the sketches of their tests, so
+    # writers of tests of the same suite never queue on a shared row.
+
+    @staticmethod
+    def _row(test_id, sketch, now):
+        row = {
+            "b_test_id": test_id,
+            "b_sketch": sketch.to_bytes(),
+            "b_count": sketch.count,
+            "b_updated_datetime": now,
+        }
+        for column, q in STORED_QUANTILES:
+            row["b_" + column] = sketch.quantile(q)
+
+        return row
+
+    @staticmethod
+    def _update(rows):
+        table = models.TestDurationSketch.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.test_id == bindparam("b_test_id"))
+            .values(
+                sketch=bindparam("b_sketch"),
+                count=bindparam("b_count"),
+                updated_datetime=bindparam("b_updated_datetime"),
+                **{column: bindparam("b_" + column) for column, _ in STORED_QUANTILES}
+            ),
+            rows,
+        )
+
+    @staticmethod
+    def _create_missing(test_ids):
+        db.session.execute(
+            insert(models.TestDurationSketch.__table__)
+            .from_select(
+                ["test_id", "test_suite_id", "project_id"],
+                db.session.query(
+                    models.Test.id,
+                    models.Test.test_suite_id,
+                    models.TestSuite.project_id,
+                )
+                .filter(models.Test.test_suite_id == models.TestSuite.id)
+                .filter(models.Test.id.in_(test_ids))
+                .order_by(models.Test.id)
+                .statement,
+            )
+            .on_conflict_do_nothing(index_elements=["test_id"])
+        )
+
+    @staticmethod
+    def apply(durations):
+        # Each duration is a tuple of (test_id, start_datetime, end_datetime)
+        # of a test history that has just completed
+        durations = [
+            (test_id, duration_ms(start_datetime, end_datetime))
+            for test_id, start_datetime, end_datetime in durations
+        ]
+        durations = [(test_id, ms) for test_id, ms in durations if ms is not None]
+        if not durations:
+            return
+
+        # Missing rows are created first, so concurrent writers then only
+        # queue on the row lock of the tests they share, taken in id order
+        test_ids = sorted({test_id for test_id, _ in durations})
+        DurationSketches._create_missing(test_ids)
+        sketches = {
+            test_id: DDSketch.from_bytes(sketch) if sketch else DDSketch()
+            for test_id, sketch in db.session.query(
+                models.TestDurationSketch.test_id, models.TestDurationSketch.sketch
+            )
+            .filter(models.TestDurationSketch.test_id.in_(test_ids))
+            .order_by(models.TestDurationSketch.test_id)
+            .with_for_update()
+        }
+
+        for test_id, ms in durations:
+            sketches[test_id].add(ms)
+
+        now = datetime.datetime.now()
+        DurationSketches._update(
+            [
+                DurationSketches._row(test_id, sketch, now)
+                for test_id, sketch in sorted(sketches.items())
+            ]
+        )
+
+    @staticmethod
+    def merged(sketches):
+        merged = DDSketch()
+        for sketch in sketches:
+            if sketch:
+                merged.merge(DDSketch.from_bytes(sketch))
+
+        return merged
+
+    @staticmethod
+    def rebuild(project_id=None):
+        # Writers are blocked on the sketches while they are recomputed so no
+        # duration is lost or counted twice. Like the writers, only passed and
+        # failed test histories are counted.
+        db.session.execute("LOCK TABLE test_duration_sketch IN EXCLUSIVE MODE")
+
+        test_ids = db.session.query(models.Test.id)
+        if project_id is not None:
+            test_ids = test_ids.filter(
+                models.Test.test_suite_id == models.TestSuite.id
+            ).filter(models.TestSuite.project_id == project_id)
+
+        stale_sketches = db.session.query(models.TestDurationSketch).filter(
+            models.TestDurationSketch.test_id.in_(test_ids)
+        )
+        stale_sketches.delete(synchronize_session=False)
+
+        rows = (
+            db.session.query(
+                models.TestHistory.test_id,
+                models.TestHistory.start_datetime,
+                models.TestHistory.end_datetime,
+            )
+            .filter(models.TestHistory.test_id.in_(test_ids))
+            .filter(models.TestHistory.test_status_id.in_(list(FINAL_STATUSES)))
+            .filter(models.TestHistory.end_datetime.isnot(None))
+            .order_by(models.TestHistory.test_id)
+            .yield_per(1000)
+        )
+
+        now = datetime.datetime.now()
+        batch = {}
+        for test_id, durations in itertools.groupby(rows, lambda row: row.test_id):
+            sketch = DDSketch()
+            for row in durations:
+                ms = duration_ms(row.start_datetime, row.end_datetime)
+                if ms is not None:
+                    sketch.add(ms)
+            if sketch.count:
+                batch[test_id] = sketch
+            if len(batch) >= 1000:
+                DurationSketches._store(batch, now)
+                batch = {}
+        if batch:
+            DurationSketches._store(batch, now)
+
+        db.session.commit()
+
+    @staticmethod
+    def _store(sketches, now):
+        test_ids = sorted(sketches)
+        DurationSketches._create_missing(test_ids)
+        DurationSketches._update(
+            [
+                DurationSketches._row(test_id, sketches[test_id], now)
+                for test_id in test_ids
+            ]
+        )
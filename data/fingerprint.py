@@ -0,0 +1,65 @@
+import hashlib
+import re
+
+# Trace frames a fingerprint is built from, the ones closest to the failure
+FINGERPRINT_FRAMES = 3
+
+# Parts of a message or a frame that change from one occurrence of the same
+# failure to the next, replaced before hashing
+NORMALIZERS = (
+    (
+        re.compile(
+            r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-"
+            r"[0-9a-fA-F]{12}\b"
+        ),
+        "<uuid>",
+    ),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b"), "<address>"),
+    (re.compile(r"(?:\b[A-Za-z]:)?(?:[\\/][\w.@~+-]+)+[\\/]?"), "<path>"),
+    (re.compile(r"\d+(?:\.\d+)*"), "<number>"),
+    (re.compile(r"\s+"), " "),
+)
+
+# Python ("File "x.py", line 3, in f"), Java and JavaScript ("at f (x.js:3)")
+FRAME = re.compile(r"^\s*(?:File \"|at )")
+
+
+class Fingerprint:
+
+    # Failures that differ only in ids, timings, addresses or file locations
+    # get the same fingerprint: a hash of the error type, the normalized
+    # message and the normalized frames nearest to where the failure happened
+
+    @staticmethod
+    def normalize(text):
+        if not text:
+            return ""
+
+        for pattern, replacement in NORMALIZERS:
+            text = pattern.sub(replacement, text)
+
+        return text.strip()
+
+    @staticmethod
+    def frames(trace):
+        if not trace:
+            return []
+
+        frames = [line for line in trace.splitlines() if FRAME.match(line)]
+        # Python prints the innermost frame last, most other runtimes first
+        if "most recent call last" in trace:
+            frames = frames[-FINGERPRINT_FRAMES:]
+        else:
+            frames = frames[:FINGERPRINT_FRAMES]
+
+        return [Fingerprint.normalize(frame) for frame in frames]
+
+    @staticmethod
+    def of(error_type, message, trace):
+        parts = [
+            (error_type or "").strip(),
+            Fingerprint.normalize(message),
+            *Fingerprint.frames(trace),
+        ]
+
+        return hashlib.md5("\n".join(parts).encode("utf-8")).hexdigest()
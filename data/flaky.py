@@ -0,0 +1,196 @@
+import datetime
+import itertools
+import models
+from app import db
+from data import constants
+from sqlalchemy import bindparam
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+
+# Latest final outcomes kept per test. Each is a bit of a BIGINT, so this
+# can be raised up to 63, followed by a rebuild.
+FLAKY_WINDOW = 32
+
+FINAL_STATUSES = {
+    constants.Constants.test_status["Failed"]: True,
+    constants.Constants.test_status["Passed"]: False,
+}
+
+
+class FlakyStats:
+
+    # Rolling statistics of the latest outcomes of each test, kept up to date
+    # by the writers. Bit i of outcomes is set when the i-th latest outcome
+    # was a failure and bit i of retried when it needed retries. A test is as
+    # flaky as the share of consecutive outcomes that flipped between passed
+    # and failed, which is stored so tests are ranked straight from an index.
+
+    @staticmethod
+    def push(stats, failed, retried):
+        # stats is a dict with the outcomes, retried and runs of a test
+        mask = (1 << FLAKY_WINDOW) - 1
+        stats["outcomes"] = ((stats["outcomes"] << 1) | int(failed)) & mask
+        stats["retried"] = ((stats["retried"] << 1) | int(retried)) & mask
+        stats["runs"] = min(stats["runs"] + 1, FLAKY_WINDOW)
+
+        pairs = (1 << (stats["runs"] - 1)) - 1
+        stats["flips"] = bin(
+            (stats["outcomes"] ^ (stats["outcomes"] >> 1)) & pairs
+        ).count("1")
+        stats["flakiness"] = (
+            stats["flips"] / (stats["runs"] - 1) if stats["runs"] > 1 else 0.0
+        )
+
+        return stats
+
+    @staticmethod
+    def apply(outcomes):
+        # Each outcome is a tuple of (test_id, test_status_id, retries) of a
+        # test history that has just reached a final status, in the order
+        # they were recorded. Other statuses are left out.
+        outcomes = [
+            (test_id, FINAL_STATUSES[test_status_id], bool(retries))
+            for test_id, test_status_id, retries in outcomes
+            if test_status_id in FINAL_STATUSES
+        ]
+        if not outcomes:
+            return
+
+        test_ids = sorted({test_id for test_id, _, _ in outcomes})
+        table = models.TestFlakyStats.__table__
+
+        # Missing rows are created first, so concurrent writers then only
+        # queue on the row lock of the tests they share, taken in id order
+        db.session.execute(
+            insert(table)
+            .from_select(
+                ["test_id", "project_id"],
+                db.session.query(models.Test.id, models.TestSuite.project_id)
+                .filter(models.Test.test_suite_id == models.TestSuite.id)
+                .filter(models.Test.id.in_(test_ids))
+                .order_by(models.Test.id)
+                .statement,
+            )
+            .on_conflict_do_nothing(index_elements=["test_id"])
+        )
+        current = {
+            row.test_id: {
+                "outcomes": row.outcomes,
+                "retried": row.retried,
+                "runs": row.runs,
+            }
+            for row in db.session.query(
+                models.TestFlakyStats.test_id,
+                models.TestFlakyStats.outcomes,
+                models.TestFlakyStats.retried,
+                models.TestFlakyStats.runs,
+            )
+            .filter(models.TestFlakyStats.test_id.in_(test_ids))
+            .order_by(models.TestFlakyStats.test_id)
+            .with_for_update()
+        }
+
+        for test_id, failed, retried in outcomes:
+            FlakyStats.push(current[test_id], failed, retried)
+
+        now = datetime.datetime.now()
+        db.session.execute(
+            table.update()
+            .where(table.c.test_id == bindparam("b_test_id"))
+            .values(
+                outcomes=bindparam("b_outcomes"),
+                retried=bindparam("b_retried"),
+                runs=bindparam("b_runs"),
+                flips=bindparam("b_flips"),
+                flakiness=bindparam("b_flakiness"),
+                updated_datetime=bindparam("b_updated_datetime"),
+            ),
+            [
+                {
+                    "b_test_id": test_id,
+                    "b_outcomes": stats["outcomes"],
+                    "b_retried": stats["retried"],
+                    "b_runs": stats["runs"],
+                    "b_flips": stats["flips"],
+                    "b_flakiness": stats["flakiness"],
+                    "b_updated_datetime": now,
+                }
+                for test_id, stats in sorted(current.items())
+            ],
+        )
+
+    @staticmethod
+    def rebuild(project_id=None):
+        # Writers are blocked on the statistics while they are recomputed so
+        # no outcome is lost or counted twice. Outcomes are replayed in the
+        # order test histories were created.
+        db.session.execute("LOCK TABLE test_flaky_stats IN EXCLUSIVE MODE")
+
+        stale_stats = db.session.query(models.TestFlakyStats)
+        if project_id is not None:
+            stale_stats = stale_stats.filter(
+                models.TestFlakyStats.project_id == project_id
+            )
+        stale_stats.delete(synchronize_session=False)
+
+        latest = db.session.query(
+            models.TestHistory.id,
+            models.TestHistory.test_id,
+            models.TestHistory.test_status_id,
+            models.TestHistory.retries,
+            func.row_number()
+            .over(
+                partition_by=models.TestHistory.test_id,
+                order_by=models.TestHistory.id.desc(),
+            )
+            .label("position"),
+        ).filter(models.TestHistory.test_status_id.in_(list(FINAL_STATUSES)))
+        if project_id is not None:
+            latest = latest.filter(
+                models.TestHistory.test_id.in_(
+                    db.session.query(models.Test.id)
+                    .filter(models.Test.test_suite_id == models.TestSuite.id)
+                    .filter(models.TestSuite.project_id == project_id)
+                )
+            )
+        latest = latest.subquery()
+
+        rows = (
+            db.session.query(
+                latest.c.test_id,
+                models.TestSuite.project_id,
+                latest.c.test_status_id,
+                latest.c.retries,
+            )
+            .filter(latest.c.test_id == models.Test.id)
+            .filter(models.Test.test_suite_id == models.TestSuite.id)
+            .filter(latest.c.position <= FLAKY_WINDOW)
+            .order_by(latest.c.test_id, latest.c.id)
+            .yield_per(1000)
+        )
+
+        now = datetime.datetime.now()
+        batch = []
+        for (test_id, test_project_id), outcomes in itertools.groupby(
+            rows, lambda row: (row.test_id, row.project_id)
+        ):
+            stats = {"outcomes": 0, "retried": 0, "runs": 0}
+            for row in outcomes:
+                FlakyStats.push(
+                    stats, FINAL_STATUSES[row.test_status_id], bool(row.retries)
+                )
+            batch.append(
+                {
+                    "test_id": test_id,
+                    "project_id": test_project_id,
+                    "updated_datetime": now,
+                    **stats,
+                }
+            )
+            if len(batch) >= 1000:
+                db.session.execute(models.TestFlakyStats.__table__.insert(), batch)
+                batch = []
+        if batch:
+            db.session.execute(models.TestFlakyStats.__table__.insert(), batch)
+
+        db.session.commit()
@@ -0,0 +1,49 @@
+import models
+from app import db
+from logzero import logger
+from sqlalchemy import exc
+
+LOOKUP_MODELS = {
+    "project_status": models.ProjectStatus,
+    "launch_status": models.LaunchStatus,
+    "test_run_status": models.TestRunStatus,
+    "test_suite_status": models.TestSuiteStatus,
+    "test_status": models.TestStatus,
+    "test_resolution": models.TestResolution,
+}
+
+
+class Lookups:
+
+    # Id to name maps of the status and resolution tables mirrored by
+    # constants.Constants, loaded once per process so serializers do not
+    # issue one SELECT per row for each status relationship
+
+    _names = {}
+
+    @staticmethod
+    def _load(lookup):
+        model = LOOKUP_MODELS[lookup]
+        try:
+            names = dict(db.session.query(model.id, model.name).all())
+        except exc.SQLAlchemyError as e:
+            logger.error(e)
+            db.session.rollback()
+            names = {}
+
+        # An empty table means initial_setup has not been run yet
+        if names:
+            Lookups._names[lookup] = names
+
+        return names
+
+    @staticmethod
+    def name(lookup, lookup_id):
+        if lookup_id is None:
+            return None
+
+        names = Lookups._names.get(lookup)
+        if names is None or lookup_id not in names:
+            names = Lookups._load(lookup)
+
+        return names.get(lookup_id)
@@ -0,0 +1,111 @@
+import datetime
+import re
+from app import db
+from logzero import logger
+
+PARTITIONED_TABLE = "test_history"
+
+# Monthly partitions are named after the table and their month, for example
+# test_history_2026_10
+PARTITION_NAME = re.compile(r"^{}_(\d{{4}})_(\d{{2}})$".format(PARTITIONED_TABLE))
+
+# Partition DDL gives up instead of queueing writers behind it while it waits
+# for long running readers to release the table
+PARTITION_LOCK_TIMEOUT = "5s"
+
+
+def month_start(day):
+    return datetime.date(day.year, day.month, 1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+class Partitions:
+
+    # Monthly range partitions of test history on start_datetime. Rows
+    # outside of every month land in the default partition.
+
+    @staticmethod
+    def name(month):
+        return "{}_{:%Y_%m}".format(PARTITIONED_TABLE, month)
+
+    @staticmethod
+    def months():
+        # Months of the partitions currently attached
+        rows = db.session.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = CAST(:table AS regclass)",
+            {"table": PARTITIONED_TABLE},
+        )
+        months = []
+        for (name,) in rows:
+            match = PARTITION_NAME.match(name)
+            if match:
+                months.append(datetime.date(int(match[1]), int(match[2]), 1))
+
+        return sorted(months)
+
+    @staticmethod
+    def create(ahead, today=None):
+        # Partitions from the current month to ahead months later. Each is
+        # created on its own and then attached, which unlike CREATE TABLE ...
+        # PARTITION OF does not lock readers and writers out of test history.
+        # Attaching fails if the default partition already has rows of the
+        # month.
+        first = month_start(today or datetime.date.today())
+        existing = set(Partitions.months())
+
+        created = []
+        for month in (add_months(first, offset) for offset in range(ahead + 1)):
+            if month in existing:
+                continue
+
+            name = Partitions.name(month)
+            db.session.execute(
+                "SET LOCAL lock_timeout = '{}'".format(PARTITION_LOCK_TIMEOUT)
+            )
+            db.session.execute(
+                "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)".format(
+                    name, PARTITIONED_TABLE
+                )
+            )
+            db.session.execute(
+                "ALTER TABLE {} ATTACH PARTITION {} "
+                "FOR VALUES FROM ('{}') TO ('{}')".format(
+                    PARTITIONED_TABLE, name, month, add_months(month, 1)
+                )
+            )
+            db.session.commit()
+            logger.info("Created partition %s", name)
+            created.append(name)
+
+        return created
+
+    @staticmethod
+    def detach(retain, today=None):
+        # Partitions of months older than the latest retain months are
+        # detached, their rows leave test history but are kept in a table of
+        # their own until it is dropped
+        cutoff = add_months(month_start(today or datetime.date.today()), -retain)
+
+        detached = []
+        for month in Partitions.months():
+            if month >= cutoff:
+                break
+
+            name = Partitions.name(month)
+            db.session.execute(
+                "SET LOCAL lock_timeout = '{}'".format(PARTITION_LOCK_TIMEOUT)
+            )
+            db.session.execute(
+                "ALTER TABLE {} DETACH PARTITION {}".format(PARTITIONED_TABLE, name)
+            )
+            db.session.commit()
+            logger.info("Detached partition %s", name)
+            detached.append(name)
+
+        return detached
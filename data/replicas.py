@@ -0,0 +1,171 @@
+import random
+import threading
+import time
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from logzero import logger
+from sqlalchemy import exc, orm, text
+from sqlalchemy.sql import Select
+
+# Where the primary is, read before its standbys
+PRIMARY_POSITION_SQL = text("SELECT pg_current_wal_lsn(), now()")
+
+# Whether a server is a standby, whether it has replayed everything the
+# primary had written, the status of its WAL receiver and how long ago, by
+# the clock of the primary, the last transaction it replayed was committed.
+# Receiver details are hidden to roles without pg_read_all_stats.
+REPLICA_LAG_SQL = text(
+    "SELECT pg_is_in_recovery(), "
+    "pg_last_wal_replay_lsn() >= CAST(:primary_lsn AS pg_lsn), "
+    "(SELECT coalesce(status, 'hidden') FROM pg_stat_wal_receiver), "
+    "EXTRACT(EPOCH FROM CAST(:primary_now AS timestamptz) "
+    "- pg_last_xact_replay_timestamp())"
+)
+
+# Receiver statuses of a standby that is still following its primary
+STREAMING_STATUSES = ("streaming", "hidden")
+
+
+class Replicas:
+
+    # The read replicas configured as the replica_<n> binds, each used while
+    # its lag is within REPLICA_MAX_LAG_SECONDS. Lag is checked at most once
+    # every REPLICA_LAG_CHECK_INTERVAL seconds per replica, a replica that
+    # cannot be reached counts as too far behind.
+
+    def __init__(self, db):
+        self.db = db
+        self._lags = {}
+        self._lock = threading.Lock()
+
+    def binds(self, app):
+        return sorted(
+            bind
+            for bind in app.config.get("SQLALCHEMY_BINDS") or {}
+            if bind.startswith("replica_")
+        )
+
+    def lag(self, app, bind):
+        with self._lock:
+            lag, checked_at = self._lags.get(bind, (None, None))
+        if (
+            checked_at is not None
+            and time.monotonic() - checked_at < app.config["REPLICA_LAG_CHECK_INTERVAL"]
+        ):
+            return lag
+
+        engine = self.db.get_engine(app, bind=bind)
+        try:
+            if engine.dialect.name == "postgresql":
+                lag = self._standby_lag(app, engine)
+            else:
+                lag = 0.0
+        except exc.SQLAlchemyError as e:
+            logger.warning("Replica %s is unavailable: %s", bind, e)
+            lag = float("inf")
+
+        with self._lock:
+            self._lags[bind] = (lag, time.monotonic())
+
+        return lag
+
+    def _standby_lag(self, app, engine):
+        # A standby that has replayed all the primary had written is not
+        # behind, however long ago its last transaction was, so an idle
+        # primary does not look like lag. Otherwise it is as far behind as
+        # its last replayed commit, and too far once its WAL receiver stops
+        # streaming. Servers that are not standbys are never behind.
+        with self.db.get_engine(app).connect() as connection:
+            primary_lsn, primary_now = connection.execute(PRIMARY_POSITION_SQL).first()
+        with engine.connect() as connection:
+            standby, caught_up, receiver, behind = connection.execute(
+                REPLICA_LAG_SQL, primary_lsn=primary_lsn, primary_now=primary_now
+            ).first()
+
+        if not standby or caught_up:
+            return 0.0
+        if receiver not in STREAMING_STATUSES or behind is None:
+            return float("inf")
+
+        return max(float(behind), 0.0)
+
+    def pick(self, app):
+        # A random replica among those close enough to the primary, None to
+        # read from the primary
+        binds = [
+            bind
+            for bind in self.binds(app)
+            if self.lag(app, bind) <= app.config["REPLICA_MAX_LAG_SECONDS"]
+        ]
+
+        return random.choice(binds) if binds else None
+
+    def reading(self):
+        # Whether the reads of the current request go to a replica
+        return (
+            has_request_context()
+            and g.get("replica_bind") is not None
+            and not g.get("replica_pinned")
+        )
+
+    def pin(self):
+        # Sends the rest of the reads of the current request to the primary
+        if has_request_context():
+            g.replica_pinned = True
+
+    def stats(self, app):
+        with self._lock:
+            lags = dict(self._lags)
+
+        return {
+            "max_lag_seconds": app.config["REPLICA_MAX_LAG_SECONDS"],
+            "replicas": [
+                {"bind": bind, "lag_seconds": lags.get(bind, (None, None))[0]}
+                for bind in self.binds(app)
+            ],
+        }
+
+
+class RoutingSession(SignallingSession):
+
+    # Reads of GET requests go to a replica picked once per request, until
+    # the request writes: from then on, and for SELECT ... FOR UPDATE, the
+    # primary is used so the request reads its own writes. Anything outside
+    # of a GET request, such as writes, migrations and commands, stays on the
+    # primary.
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def _replica(self, clause):
+        if not has_request_context() or request.method not in ("GET", "HEAD"):
+            return None
+
+        if (
+            self._flushing
+            or not isinstance(clause, Select)
+            or clause._for_update_arg is not None
+        ):
+            g.replica_pinned = True
+        if g.get("replica_pinned"):
+            return None
+
+        if "replica_bind" not in g:
+            g.replica_bind = self.db.replicas.pick(self.app)
+        if g.replica_bind is None:
+            return None
+
+        return self.db.get_engine(self.app, bind=g.replica_bind)
+
+    def get_bind(self, mapper=None, clause=None):
+        return self._replica(clause) or SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def __init__(self, *args, **kwargs):
+        self.replicas = Replicas(self)
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,128 @@
+import math
+import struct
+
+# Values returned for a quantile are within this relative error of an actual
+# value of the data
+SKETCH_RELATIVE_ACCURACY = 0.01
+
+# Upper bound of the bins kept per sketch. At 1% accuracy durations from a
+# millisecond to a day take about 900, past that the lowest bins are merged.
+SKETCH_MAX_BINS = 1024
+
+SKETCH_VERSION = 1
+
+# version, relative accuracy, count, zero count, min, max, number of bins
+HEADER = struct.Struct("<BdQQddI")
+# bin key, bin count
+BIN = struct.Struct("<iI")
+
+
+class DDSketch:
+
+    # Quantile sketch with relative error guarantees (DDSketch, Masson et al.
+    # 2019). Positive values are counted in logarithmically sized bins, so
+    # the size of a sketch depends on the range of the values and not on how
+    # many were added, and two sketches merge by adding up their bins.
+
+    def __init__(self, relative_accuracy=SKETCH_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.zero_count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.bins = {}
+
+    def _key(self, value):
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value, weight=1):
+        if value > 0:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + weight
+        else:
+            self.zero_count += weight
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self._collapse()
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Sketches with different accuracies cannot be merged")
+
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._collapse()
+
+    def _collapse(self):
+        # The lowest bins are folded together, which only loses accuracy on
+        # the fastest values
+        if len(self.bins) <= SKETCH_MAX_BINS:
+            return
+
+        keys = sorted(self.bins)
+        excess = keys[: len(keys) - SKETCH_MAX_BINS + 1]
+        self.bins[excess[-1]] += sum(self.bins.pop(key) for key in excess[:-1])
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return max(self.min, 0)
+
+        value = self.max
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                value = self._value(key)
+                break
+
+        return min(max(value, self.min), self.max)
+
+    def to_bytes(self):
+        return HEADER.pack(
+            SKETCH_VERSION,
+            self.relative_accuracy,
+            self.count,
+            self.zero_count,
+            self.min,
+            self.max,
+            len(self.bins),
+        ) + b"".join(BIN.pack(key, self.bins[key]) for key in sorted(self.bins))
+
+    @staticmethod
+    def from_bytes(data):
+        (
+            version,
+            relative_accuracy,
+            count,
+            zero_count,
+            min_,
+            max_,
+            size,
+        ) = HEADER.unpack_from(data)
+        if version != SKETCH_VERSION:
+            raise ValueError("Unknown sketch version {}".format(version))
+
+        sketch = DDSketch(relative_accuracy)
+        sketch.count = count
+        sketch.zero_count = zero_count
+        sketch.min = min_
+        sketch.max = max_
+        for index in range(size):
+            key, bin_count = BIN.unpack_from(data, HEADER.size + index * BIN.size)
+            sketch.bins[key] = bin_count
+
+        return sketch
@@ -1,125 +1,89 @@
 import models
 from app import db
-from sqlalchemy.sql import func
+from data import constants
+from sqlalchemy.sql import case, func
 
+COUNT_COLUMNS = (
+    "tests_count",
+    "failed_tests_count",
+    "passed_tests_count",
+    "running_tests_count",
+    "incomplete_tests_count",
+    "skipped_tests_count",
+)
 
-class TestCounts:
-
-    # Subqueries to return test amounts by test run id
-
-    total_tests_by_test_run_id = (
-        db.session.query(
-            models.TestHistory.test_run_id, func.count("*").label("tests_count")
-        )
-        .group_by(models.TestHistory.test_run_id)
-        .subquery()
-    )
-
-    failed_tests_by_test_run_id = (
-        db.session.query(
-            models.TestHistory.test_run_id, func.count("*").label("failed_tests_count"),
-        )
-        .filter(models.TestHistory.test_status_id == 1)
-        .group_by(models.TestHistory.test_run_id)
-        .subquery()
-    )
-
-    passed_tests_by_test_run_id = (
-        db.session.query(
-            models.TestHistory.test_run_id, func.count("*").label("passed_tests_count"),
-        )
-        .filter(models.TestHistory.test_status_id == 2)
-        .group_by(models.TestHistory.test_run_id)
-        .subquery()
-    )
 
-    running_tests_by_test_run_id = (
-        db.session.query(
-            models.TestHistory.test_run_id,
-            func.count("*").label("running_tests_count"),
-        )
-        .filter(models.TestHistory.test_status_id == 3)
-        .group_by(models.TestHistory.test_run_id)
-        .subquery()
-    )
-
-    incomplete_tests_by_test_run_id = (
-        db.session.query(
-            models.TestHistory.test_run_id,
-            func.count("*").label("incomplete_tests_count"),
-        )
-        .filter(models.TestHistory.test_status_id == 4)
-        .group_by(models.TestHistory.test_run_id)
-        .subquery()
-    )
-
-    skipped_tests_by_test_run_id = (
-        db.session.query(
-            models.TestHistory.test_run_id,
-            func.count("*").label("skipped_tests_count"),
-        )
-        .filter(models.TestHistory.test_status_id == 5)
-        .group_by(models.TestHistory.test_run_id)
-        .subquery()
-    )
-
-    # Subqueries to return test amounts by test suite history id
+class TestCounts:
 
-    total_tests_by_test_suite_history_id = (
-        db.session.query(
-            models.TestHistory.test_suite_history_id,
-            func.count("*").label("tests_count"),
+    # Test amounts are read from the counter tables kept up to date by the
+    # writers, one row per slot, so a read sums a handful of rows per run
+
+    @staticmethod
+    def _sum_counters(counters, key, *criterion):
+        return (
+            db.session.query(
+                key,
+                *[
+                    func.sum(getattr(counters, column)).label(column)
+                    for column in COUNT_COLUMNS
+                ]
+            )
+            .filter(*criterion)
+            .group_by(key)
+            .subquery()
         )
-        .group_by(models.TestHistory.test_suite_history_id)
-        .subquery()
-    )
 
-    failed_tests_by_test_suite_history_id = (
-        db.session.query(
-            models.TestHistory.test_suite_history_id,
-            func.count("*").label("failed_tests_count"),
+    @staticmethod
+    def by_test_run_id(test_run_ids):
+        return TestCounts._sum_counters(
+            models.TestRunCounts,
+            models.TestRunCounts.test_run_id,
+            models.TestRunCounts.test_run_id.in_(test_run_ids),
         )
-        .filter(models.TestHistory.test_status_id == 1)
-        .group_by(models.TestHistory.test_suite_history_id)
-        .subquery()
-    )
 
-    passed_tests_by_test_suite_history_id = (
-        db.session.query(
-            models.TestHistory.test_suite_history_id,
-            func.count("*").label("passed_tests_count"),
+    @staticmethod
+    def by_test_suite_history_id(test_run_id):
+        test_suite_history_ids = db.session.query(models.TestSuiteHistory.id).filter(
+            models.TestSuiteHistory.test_run_id == test_run_id
         )
-        .filter(models.TestHistory.test_status_id == 2)
-        .group_by(models.TestHistory.test_suite_history_id)
-        .subquery()
-    )
 
-    running_tests_by_test_suite_history_id = (
-        db.session.query(
-            models.TestHistory.test_suite_history_id,
-            func.count("*").label("running_tests_count"),
+        return TestCounts._sum_counters(
+            models.TestSuiteHistoryCounts,
+            models.TestSuiteHistoryCounts.test_suite_history_id,
+            models.TestSuiteHistoryCounts.test_suite_history_id.in_(
+                test_suite_history_ids
+            ),
         )
-        .filter(models.TestHistory.test_status_id == 3)
-        .group_by(models.TestHistory.test_suite_history_id)
-        .subquery()
-    )
 
-    incomplete_tests_by_test_suite_history_id = (
-        db.session.query(
-            models.TestHistory.test_suite_history_id,
-            func.count("*").label("incomplete_tests_count"),
+    @staticmethod
+    def columns(counts):
+        return tuple(getattr(counts.c, column) for column in COUNT_COLUMNS)
+
+    # Test amounts computed from test_history in a single conditional
+    # aggregation, used to rebuild the counter tables
+
+    @staticmethod
+    def _count_by_status(status):
+        return func.sum(
+            case(
+                [
+                    (
+                        models.TestHistory.test_status_id
+                        == constants.Constants.test_status[status],
+                        1,
+                    )
+                ],
+                else_=0,
+            )
         )
-        .filter(models.TestHistory.test_status_id == 4)
-        .group_by(models.TestHistory.test_suite_history_id)
-        .subquery()
-    )
 
-    skipped_tests_by_test_suite_history_id = (
-        db.session.query(
-            models.TestHistory.test_suite_history_id,
-            func.count("*").label("skipped_tests_count"),
+    @staticmethod
+    def history_columns():
+        return (
+            func.count(models.TestHistory.id).label("tests_count"),
+            TestCounts._count_by_status("Failed").label("failed_tests_count"),
+            TestCounts._count_by_status("Passed").label("passed_tests_count"),
+            TestCounts._count_by_status("Running").label("running_tests_count"),
+            TestCounts._count_by_status("Incomplete").label("incomplete_tests_count"),
+            TestCounts._count_by_status("Skipped").label("skipped_tests_count"),
         )
-        .filter(models.TestHistory.test_status_id == 5)
-        .group_by(models.TestHistory.test_suite_history_id)
-        .subquery()
-    )
@@ -0,0 +1,174 @@
+import datetime
+import models
+from app import app, db
+from sqlalchemy import BigInteger, Date, Float, Integer, String, cast
+from sqlalchemy.sql import exists, func, literal_column, null
+
+# Counter columns a trend is computed from, by the key they are sent as
+TREND_COUNTS = (
+    ("tests_total", "tests_count"),
+    ("tests_failed", "failed_tests_count"),
+    ("tests_passed", "passed_tests_count"),
+    ("tests_skipped", "skipped_tests_count"),
+)
+
+# Rates of a trend, by the count they are the share of
+TREND_RATES = (
+    ("pass_rate", "tests_passed"),
+    ("fail_rate", "tests_failed"),
+    ("skip_rate", "tests_skipped"),
+)
+
+
+class Trends:
+
+    # Pass, fail and skip rates of the launches of a project, and of the
+    # days they started on, read from the counter tables in one statement.
+    # Moving averages and deltas are computed by window functions.
+
+    @staticmethod
+    def _launch_counts(project_id, launches, start, end):
+        # A launch starts with its first test run, launches without any are
+        # left out
+        query = (
+            db.session.query(
+                models.Launch.id.label("launch_id"),
+                models.Launch.name.label("name"),
+                func.min(models.TestRun.start_datetime).label("start_datetime"),
+                *[
+                    func.coalesce(
+                        func.sum(getattr(models.TestRunCounts, column)), 0
+                    ).label(key)
+                    for key, column in TREND_COUNTS
+                ]
+            )
+            .join(models.TestRun, models.TestRun.launch_id == models.Launch.id)
+            .outerjoin(
+                models.TestRunCounts,
+                models.TestRunCounts.test_run_id == models.TestRun.id,
+            )
+            .filter(models.Launch.project_id == project_id)
+            .group_by(models.Launch.id, models.Launch.name)
+        )
+        if launches is not None:
+            # Launches before the latest ones are only read to fill the
+            # moving averages of the first of them
+            latest = (
+                db.session.query(models.Launch.id)
+                .filter(models.Launch.project_id == project_id)
+                .filter(exists().where(models.TestRun.launch_id == models.Launch.id))
+                .order_by(models.Launch.id.desc())
+                .limit(launches + app.config["TREND_WINDOW"] - 1)
+            )
+            query = query.filter(models.Launch.id.in_(latest.subquery()))
+        if start is not None:
+            query = query.having(func.min(models.TestRun.start_datetime) >= start)
+        if end is not None:
+            # The end date is included
+            query = query.having(
+                func.min(models.TestRun.start_datetime)
+                < end + datetime.timedelta(days=1)
+            )
+
+        return query.cte("launch_counts")
+
+    @staticmethod
+    def _windowed(counts, key, name, *columns):
+        # The rates of each row with their moving average over the trend
+        # window and their change since the previous row
+        window = app.config["TREND_WINDOW"]
+        windowed = [
+            *columns,
+            *[getattr(counts.c, count_key) for count_key, _ in TREND_COUNTS],
+        ]
+        for rate_key, count_key in TREND_RATES:
+            # The zero is inlined, positional drivers otherwise get the bound
+            # parameters of the windowed rates out of order
+            rate = cast(getattr(counts.c, count_key), Float) / func.nullif(
+                counts.c.tests_total, literal_column("0")
+            )
+            windowed += [
+                rate.label(rate_key),
+                func.avg(rate)
+                .over(order_by=key, rows=(-(window - 1), 0))
+                .label(rate_key + "_moving_avg"),
+                (rate - func.lag(rate).over(order_by=key)).label(rate_key + "_delta"),
+            ]
+        windowed.append(func.row_number().over(order_by=key.desc()).label("recency"))
+
+        return db.session.query(*windowed).cte(name)
+
+    @staticmethod
+    def of(project_id, launches=None, start=None, end=None):
+        # The latest launches of the project, or those started within the
+        # date range, as (launch rows, day rows), oldest first
+        counts = Trends._launch_counts(project_id, launches, start, end)
+        by_launch = Trends._windowed(
+            counts,
+            counts.c.launch_id,
+            "by_launch",
+            counts.c.launch_id,
+            counts.c.name,
+            counts.c.start_datetime,
+        )
+        shown = db.session.query(by_launch)
+        if launches is not None:
+            shown = shown.filter(by_launch.c.recency <= launches)
+        shown = shown.cte("shown")
+
+        # Days are summed over the launches shown. PostgreSQL sums bigints
+        # into numerics, cast back so the counts are not sent as Decimals.
+        day = func.date(shown.c.start_datetime)
+        day_counts = (
+            db.session.query(
+                day.label("day"),
+                *[
+                    cast(func.sum(getattr(shown.c, count_key)), BigInteger).label(
+                        count_key
+                    )
+                    for count_key, _ in TREND_COUNTS
+                ]
+            )
+            .filter(shown.c.start_datetime.isnot(None))
+            .group_by(day)
+            .cte("day_counts")
+        )
+        by_day = Trends._windowed(
+            day_counts, day_counts.c.day, "by_day", day_counts.c.day
+        )
+
+        # Both kinds of rows come back from one UNION ALL, told apart by kind
+        values = [count_key for count_key, _ in TREND_COUNTS] + [
+            rate_key + suffix
+            for rate_key, _ in TREND_RATES
+            for suffix in ("", "_moving_avg", "_delta")
+        ]
+        rows = (
+            db.session.query(
+                literal_column("'launch'").label("kind"),
+                shown.c.launch_id,
+                shown.c.name,
+                cast(null(), Date).label("day"),
+                *[getattr(shown.c, value) for value in values]
+            )
+            .union_all(
+                db.session.query(
+                    literal_column("'day'"),
+                    cast(null(), Integer),
+                    cast(null(), String),
+                    by_day.c.day,
+                    *[getattr(by_day.c, value) for value in values]
+                )
+            )
+            .all()
+        )
+
+        launch_rows = sorted(
+            (row for row in rows if row.kind == "launch"),
+            key=lambda row: row.launch_id,
+        )
+        day_rows = sorted(
+            (row for row in rows if row.kind == "day"), key=lambda row: str(row.day)
+        )
+
+        return launch_rows, day_rows
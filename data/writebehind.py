@@ -0,0 +1,143 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from logzero import logger
+
+
+class WriteBehind:
+
+    # Bounded in-process queue drained by a background thread, which hands the
+    # items to flush in batches of up to batch_size, at least every interval
+    # seconds. flush takes a list of items and returns None when it failed, in
+    # which case the items of the batch are retried one by one so a single bad
+    # item does not drop the rest.
+    #
+    # Items are only held in memory: they are flushed when the process exits
+    # normally but lost if it is killed or crashes before the next flush.
+
+    def __init__(self, app, flush, maxsize, interval, batch_size):
+        self.app = app
+        self.flush = flush
+        self.maxsize = maxsize
+        self.interval = interval
+        self.batch_size = batch_size
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_ms = None
+        self.max_flush_ms = 0
+        self._flush_ms_total = 0
+        self._queue = queue.Queue(maxsize)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, item):
+        # False means the queue is full and the caller has to write the item
+        # itself
+        self._start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+        with self._lock:
+            self.accepted += 1
+
+        return True
+
+    def _start(self):
+        # Threads do not survive a fork, so a worker forked from a process that
+        # already started one needs its own
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+
+            if self._thread is None:
+                atexit.register(self.close)
+            self._queue = queue.Queue(self.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="write-behind", daemon=True
+            )
+            self._thread.start()
+
+    def close(self, timeout=30):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+
+    def _take(self):
+        batch = []
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            stopping = self._stop.is_set()
+            batch = self._take()
+            if batch:
+                self._flush(batch)
+            elif stopping:
+                return
+
+    def _flush(self, batch):
+        started = time.monotonic()
+        failed = 0
+        with self.app.app_context():
+            if self._call(batch) is None:
+                for item in batch:
+                    if self._call([item]) is None:
+                        logger.error("Write-behind item dropped: %s", item)
+                        failed += 1
+        elapsed_ms = (time.monotonic() - started) * 1000
+
+        with self._lock:
+            self.batches += 1
+            self.flushed += len(batch) - failed
+            self.failed += failed
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._flush_ms_total += elapsed_ms
+
+    def _call(self, items):
+        try:
+            return self.flush(items)
+        except Exception as e:
+            logger.exception(e)
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "maxsize": self.maxsize,
+                "interval_ms": self.interval * 1000,
+                "batch_size": self.batch_size,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "flushed": self.flushed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "last_flush_ms": self.last_flush_ms,
+                "max_flush_ms": self.max_flush_ms,
+                "avg_flush_ms": self._flush_ms_total / self.batches
+                if self.batches
+                else None,
+            }
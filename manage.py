@@ -1,7 +1,14 @@
+import datetime
 import os
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 from app import app, db
+from data.archive import Archive
+from data.clusters import FailureClusters
+from data.counters import Counters
+from data.durations import DurationSketches
+from data.flaky import FlakyStats
+from data.partitions import Partitions
 
 app.config.from_object(os.environ["APP_SETTINGS"])
 
@@ -11,5 +18,45 @@ manager = Manager(app)
 manager.add_command("db", MigrateCommand)
 
 
+@manager.option("-r", "--test_run_id", dest="test_run_id", type=int, default=None)
+def rebuild_counts(test_run_id):
+    """Recompute the test counter tables from test history"""
+    Counters.rebuild(test_run_id)
+
+
+@manager.option("-p", "--project_id", dest="project_id", type=int, default=None)
+def rebuild_failure_clusters(project_id):
+    """Fingerprint recorded failures and recompute the failure cluster tables"""
+    FailureClusters.rebuild(project_id)
+
+
+@manager.option("-p", "--project_id", dest="project_id", type=int, default=None)
+def rebuild_flaky_stats(project_id):
+    """Recompute the rolling flaky test statistics from test history"""
+    FlakyStats.rebuild(project_id)
+
+
+@manager.option("-p", "--project_id", dest="project_id", type=int, default=None)
+def rebuild_duration_sketches(project_id):
+    """Recompute the test duration sketches from test history"""
+    DurationSketches.rebuild(project_id)
+
+
+@manager.option("-a", "--ahead", dest="ahead", type=int, default=3)
+@manager.option("-r", "--retain", dest="retain", type=int, default=None)
+def maintain_partitions(ahead, retain):
+    """Create the test history partitions of the coming months and detach the
+    partitions older than the retained months"""
+    Partitions.create(ahead)
+    if retain is not None:
+        Partitions.detach(retain)
+
+
+@manager.option("-d", "--days", dest="days", type=int, default=180)
+def archive_launches(days):
+    """Move the launches finished more than the given days ago to the archive"""
+    Archive.archive(datetime.datetime.now() - datetime.timedelta(days=days))
+
+
 if __name__ == "__main__":
     manager.run()
@@ -0,0 +1,47 @@
+"""rolling flaky test statistics
+
+Revision ID: 0b8e4f2a7c65
+Revises: f3a7c1d9e2b4
+Create Date: 2026-10-17 22:14:56.018337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0b8e4f2a7c65"
+down_revision = "f3a7c1d9e2b4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by the writers from now on, run "manage.py rebuild_flaky_stats"
+    # to backfill it from existing test history
+    op.create_table(
+        "test_flaky_stats",
+        sa.Column("test_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("project_id", sa.Integer(), nullable=False),
+        sa.Column("outcomes", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("retried", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("runs", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("flips", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("flakiness", sa.Float(), server_default="0", nullable=False),
+        sa.Column("updated_datetime", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["project_id"], ["project.id"]),
+        sa.ForeignKeyConstraint(["test_id"], ["test.id"]),
+        sa.PrimaryKeyConstraint("test_id"),
+    )
+    op.create_index(
+        "ix_test_flaky_stats_project_id_flakiness",
+        "test_flaky_stats",
+        ["project_id", "flakiness"],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_test_flaky_stats_project_id_flakiness", table_name="test_flaky_stats"
+    )
+    op.drop_table("test_flaky_stats")
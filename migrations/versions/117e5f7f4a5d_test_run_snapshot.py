@@ -0,0 +1,31 @@
+"""test run snapshots
+
+Revision ID: 117e5f7f4a5d
+Revises: 1ed01ccf1085
+Create Date: 2026-10-17 19:41:06.215533
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "117e5f7f4a5d"
+down_revision = "1ed01ccf1085"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "test_run_snapshot",
+        sa.Column("test_run_id", sa.Integer(), nullable=False),
+        sa.Column("payload", sa.LargeBinary(), nullable=False),
+        sa.Column("created_datetime", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["test_run_id"], ["test_run.id"],),
+        sa.PrimaryKeyConstraint("test_run_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("test_run_snapshot")
@@ -0,0 +1,99 @@
+"""indexes for crud lookups
+
+Revision ID: 1ed01ccf1085
+Revises: 65e85f668a7c
+Create Date: 2026-10-17 19:04:31.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "1ed01ccf1085"
+down_revision = "65e85f668a7c"
+branch_labels = None
+depends_on = None
+
+# (name, table, columns, partial index predicate)
+INDEXES = (
+    # Read.launch_by_project_id, newest launches first
+    ("ix_launch_project_id_id", "launch", ["project_id", "id"], None),
+    # Read.test_run_by_launch_id
+    ("ix_test_run_launch_id_id", "test_run", ["launch_id", "id"], None),
+    # Read.test_runs_failed_by_launch_id
+    (
+        "ix_test_run_launch_id_failed",
+        "test_run",
+        ["launch_id"],
+        "test_run_status_id = 1",
+    ),
+    # Read.test_suite_by_name_project_test_type
+    (
+        "ix_test_suite_name_project_id_test_type",
+        "test_suite",
+        ["name", "project_id", "test_type"],
+        None,
+    ),
+    # Read.test_suite_history_by_test_run and by test status and test run
+    (
+        "ix_test_suite_history_test_run_id_test_suite_status_id",
+        "test_suite_history",
+        ["test_run_id", "test_suite_status_id"],
+        None,
+    ),
+    # Read.test_by_name
+    ("ix_test_name", "test", ["name"], None),
+    # Read.test_history_by_test_suite_id
+    ("ix_test_test_suite_id", "test", ["test_suite_id"], None),
+    ("ix_test_history_test_id", "test_history", ["test_id"], None),
+    # Read.test_history_by_test_run
+    (
+        "ix_test_history_test_run_id_test_suite_history_id",
+        "test_history",
+        ["test_run_id", "test_suite_history_id"],
+        None,
+    ),
+    # Read.test_history_by_test_status_and_test_run_id
+    (
+        "ix_test_history_test_run_id_test_status_id",
+        "test_history",
+        ["test_run_id", "test_status_id"],
+        None,
+    ),
+    # Read.test_history_by_test_status_id
+    (
+        "ix_test_history_test_status_id_id",
+        "test_history",
+        ["test_status_id", "id"],
+        None,
+    ),
+    # Read.test_history_by_test_resolution_id, rows still "Not set" are the
+    # bulk of the table and are better read through the primary key
+    (
+        "ix_test_history_test_resolution_id_id",
+        "test_history",
+        ["test_resolution_id", "id"],
+        "test_resolution_id <> 1",
+    ),
+)
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY does not lock out writers but cannot run
+    # inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,31 @@
+"""archived test runs
+
+Revision ID: 4f6a0d3b8e21
+Revises: 9c4e2a6f1b83
+Create Date: 2026-10-17 23:38:02.671940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4f6a0d3b8e21"
+down_revision = "9c4e2a6f1b83"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "archived_test_run",
+        sa.Column("test_run_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("launch_id", sa.Integer(), nullable=False),
+        sa.Column("archived_datetime", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["launch_id"], ["launch.id"]),
+        sa.PrimaryKeyConstraint("test_run_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("archived_test_run")
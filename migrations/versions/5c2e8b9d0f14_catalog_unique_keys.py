@@ -0,0 +1,78 @@
+"""unique natural keys for test suites and tests
+
+Revision ID: 5c2e8b9d0f14
+Revises: a3c09d41e7b2
+Create Date: 2026-10-17 20:21:13.604482
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5c2e8b9d0f14"
+down_revision = "a3c09d41e7b2"
+branch_labels = None
+depends_on = None
+
+# (table, natural key, [(referencing table, referencing column)])
+NATURAL_KEYS = (
+    (
+        "test_suite",
+        ["name", "project_id", "test_type"],
+        [("test", "test_suite_id"), ("test_suite_history", "test_suite_id")],
+    ),
+    # After test suites, merging suites can turn tests into duplicates
+    ("test", ["name", "test_suite_id"], [("test_history", "test_id")]),
+)
+
+
+def merge_duplicates(table, key, references):
+    # Reporters racing on the former read then create path may have left
+    # duplicates behind. The oldest row of each is kept and references to
+    # the others are moved to it.
+    duplicates = (
+        "(SELECT id, min(id) OVER (PARTITION BY {}) AS keep_id FROM {}) "
+        "AS duplicate".format(", ".join(key), table)
+    )
+    for referencing_table, column in references:
+        op.execute(
+            "UPDATE {0} SET {1} = duplicate.keep_id FROM {2} "
+            "WHERE {0}.{1} = duplicate.id "
+            "AND duplicate.id <> duplicate.keep_id".format(
+                referencing_table, column, duplicates
+            )
+        )
+    op.execute(
+        "DELETE FROM {0} USING {1} WHERE {0}.id = duplicate.id "
+        "AND duplicate.id <> duplicate.keep_id".format(table, duplicates)
+    )
+
+
+def upgrade():
+    for table, key, references in NATURAL_KEYS:
+        merge_duplicates(table, key, references)
+
+    op.drop_index("ix_test_suite_name_project_id_test_type", table_name="test_suite")
+    op.create_unique_constraint(
+        "uq_test_suite_name_project_id_test_type",
+        "test_suite",
+        ["name", "project_id", "test_type"],
+    )
+    op.drop_index("ix_test_name", table_name="test")
+    op.create_unique_constraint(
+        "uq_test_name_test_suite_id", "test", ["name", "test_suite_id"]
+    )
+
+
+def downgrade():
+    op.drop_constraint("uq_test_name_test_suite_id", "test", type_="unique")
+    op.create_index("ix_test_name", "test", ["name"])
+    op.drop_constraint(
+        "uq_test_suite_name_project_id_test_type", "test_suite", type_="unique"
+    )
+    op.create_index(
+        "ix_test_suite_name_project_id_test_type",
+        "test_suite",
+        ["name", "project_id", "test_type"],
+    )
@@ -0,0 +1,76 @@
+"""test run and test suite history counters
+
+Revision ID: 65e85f668a7c
+Revises: 636c5796f80a
+Create Date: 2026-10-17 18:55:12.418304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "65e85f668a7c"
+down_revision = "636c5796f80a"
+branch_labels = None
+depends_on = None
+
+COUNT_COLUMNS = (
+    "tests_count",
+    "failed_tests_count",
+    "passed_tests_count",
+    "running_tests_count",
+    "incomplete_tests_count",
+    "skipped_tests_count",
+)
+
+
+def upgrade():
+    op.create_table(
+        "test_run_counts",
+        sa.Column("test_run_id", sa.Integer(), nullable=False),
+        sa.Column("slot", sa.SmallInteger(), nullable=False),
+        *[
+            sa.Column(column, sa.Integer(), server_default="0", nullable=False)
+            for column in COUNT_COLUMNS
+        ],
+        sa.ForeignKeyConstraint(["test_run_id"], ["test_run.id"],),
+        sa.PrimaryKeyConstraint("test_run_id", "slot"),
+    )
+    op.create_table(
+        "test_suite_history_counts",
+        sa.Column("test_suite_history_id", sa.Integer(), nullable=False),
+        sa.Column("slot", sa.SmallInteger(), nullable=False),
+        *[
+            sa.Column(column, sa.Integer(), server_default="0", nullable=False)
+            for column in COUNT_COLUMNS
+        ],
+        sa.ForeignKeyConstraint(["test_suite_history_id"], ["test_suite_history.id"],),
+        sa.PrimaryKeyConstraint("test_suite_history_id", "slot"),
+    )
+
+    # Existing history is counted into slot 0, new writes spread over slots
+    for table, key in (
+        ("test_run_counts", "test_run_id"),
+        ("test_suite_history_counts", "test_suite_history_id"),
+    ):
+        op.execute(
+            """
+            INSERT INTO {table} ({key}, slot, {columns})
+            SELECT {key}, 0, count(*),
+                   count(*) FILTER (WHERE test_status_id = 1),
+                   count(*) FILTER (WHERE test_status_id = 2),
+                   count(*) FILTER (WHERE test_status_id = 3),
+                   count(*) FILTER (WHERE test_status_id = 4),
+                   count(*) FILTER (WHERE test_status_id = 5)
+            FROM test_history
+            GROUP BY {key}
+            """.format(
+                table=table, key=key, columns=", ".join(COUNT_COLUMNS)
+            )
+        )
+
+
+def downgrade():
+    op.drop_table("test_suite_history_counts")
+    op.drop_table("test_run_counts")
@@ -0,0 +1,58 @@
+"""test duration sketches
+
+Revision ID: 7d1c5a9e3f28
+Revises: 0b8e4f2a7c65
+Create Date: 2026-10-17 22:41:09.553120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7d1c5a9e3f28"
+down_revision = "0b8e4f2a7c65"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by the writers from now on, run
+    # "manage.py rebuild_duration_sketches" to backfill it from existing
+    # test history
+    op.create_table(
+        "test_duration_sketch",
+        sa.Column("test_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("test_suite_id", sa.Integer(), nullable=False),
+        sa.Column("project_id", sa.Integer(), nullable=False),
+        sa.Column("sketch", sa.LargeBinary(), nullable=True),
+        sa.Column("count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("p50", sa.Float(), nullable=True),
+        sa.Column("p95", sa.Float(), nullable=True),
+        sa.Column("p99", sa.Float(), nullable=True),
+        sa.Column("updated_datetime", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["project_id"], ["project.id"]),
+        sa.ForeignKeyConstraint(["test_id"], ["test.id"]),
+        sa.ForeignKeyConstraint(["test_suite_id"], ["test_suite.id"]),
+        sa.PrimaryKeyConstraint("test_id"),
+    )
+    op.create_index(
+        "ix_test_duration_sketch_project_id_p95",
+        "test_duration_sketch",
+        ["project_id", "p95"],
+    )
+    op.create_index(
+        "ix_test_duration_sketch_test_suite_id",
+        "test_duration_sketch",
+        ["test_suite_id"],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_test_duration_sketch_test_suite_id", table_name="test_duration_sketch"
+    )
+    op.drop_index(
+        "ix_test_duration_sketch_project_id_p95", table_name="test_duration_sketch"
+    )
+    op.drop_table("test_duration_sketch")
@@ -0,0 +1,154 @@
+"""monthly test history partitions
+
+Revision ID: 9c4e2a6f1b83
+Revises: 7d1c5a9e3f28
+Create Date: 2026-10-17 23:12:47.208615
+
+Expect downtime: test_history is rewritten in one transaction, and neither
+readers nor writers get to it until the migration commits. Setting the
+partition key not null locks the table against reads too, then every row is
+copied and the primary key, foreign keys and indexes are rebuilt without
+CONCURRENTLY. The time taken grows with the size of test_history, so stop
+the service for it and time it on a copy of the database first. Downgrading
+takes as long.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9c4e2a6f1b83"
+down_revision = "7d1c5a9e3f28"
+branch_labels = None
+depends_on = None
+
+# Months after the current one given a partition up front, later ones are
+# created by the maintain_partitions command
+PARTITIONS_AHEAD = 3
+
+# (name, columns, partial index predicate) of the test history indexes
+INDEXES = (
+    ("ix_test_history_test_id", ["test_id"], None),
+    (
+        "ix_test_history_test_run_id_test_suite_history_id",
+        ["test_run_id", "test_suite_history_id"],
+        None,
+    ),
+    (
+        "ix_test_history_test_run_id_test_status_id",
+        ["test_run_id", "test_status_id"],
+        None,
+    ),
+    ("ix_test_history_test_status_id_id", ["test_status_id", "id"], None),
+    (
+        "ix_test_history_test_resolution_id_id",
+        ["test_resolution_id", "id"],
+        "test_resolution_id <> 1",
+    ),
+    (
+        "ix_test_history_test_run_id_fingerprint",
+        ["test_run_id", "fingerprint", "test_id"],
+        "fingerprint IS NOT NULL",
+    ),
+)
+
+# (column, referenced table, referenced column) of the test history foreign
+# keys, named test_history_<column>_fkey
+FOREIGN_KEYS = (
+    ("test_id", "test", "id"),
+    ("test_status_id", "test_status", "id"),
+    ("test_resolution_id", "test_resolution", "id"),
+    ("test_run_id", "test_run", "id"),
+    ("test_suite_history_id", "test_suite_history", "id"),
+    ("trace_hash", "blob", "hash"),
+    ("message_hash", "blob", "hash"),
+)
+
+
+def replace_test_history(partitioned):
+    # The rows are copied to a new table which then takes the place of
+    # test_history. Writers wait for the migration to finish, readers too
+    # once the old table is dropped, its indexes being rebuilt after that.
+    op.execute("LOCK TABLE test_history IN EXCLUSIVE MODE")
+    op.execute("ALTER SEQUENCE test_history_id_seq OWNED BY NONE")
+    op.execute(
+        "CREATE TABLE test_history_new (LIKE test_history INCLUDING DEFAULTS){}".format(
+            " PARTITION BY RANGE (start_datetime)" if partitioned else ""
+        )
+    )
+
+    if partitioned:
+        # A partition per month from the oldest test history on, rows out of
+        # every range go to the default partition
+        months = (
+            op.get_bind()
+            .execute(
+                "SELECT month::date, (month + interval '1 month')::date "
+                "FROM generate_series("
+                "(SELECT date_trunc('month', LEAST(min(start_datetime), now())) "
+                "FROM test_history), "
+                "now() + interval '{} months', interval '1 month') AS month".format(
+                    PARTITIONS_AHEAD
+                )
+            )
+            .fetchall()
+        )
+        for month, next_month in months:
+            op.execute(
+                "CREATE TABLE test_history_{:%Y_%m} PARTITION OF test_history_new "
+                "FOR VALUES FROM ('{}') TO ('{}')".format(month, month, next_month)
+            )
+        op.execute(
+            "CREATE TABLE test_history_default PARTITION OF test_history_new DEFAULT"
+        )
+
+    op.execute("INSERT INTO test_history_new SELECT * FROM test_history")
+    op.execute("DROP TABLE test_history")
+    op.rename_table("test_history_new", "test_history")
+    op.execute("ALTER SEQUENCE test_history_id_seq OWNED BY test_history.id")
+
+    # Unique constraints of a partitioned table have to include its
+    # partition key
+    op.create_primary_key(
+        "test_history_pkey",
+        "test_history",
+        ["id", "start_datetime"] if partitioned else ["id"],
+    )
+    for column, referred_table, referred_column in FOREIGN_KEYS:
+        op.create_foreign_key(
+            "test_history_{}_fkey".format(column),
+            "test_history",
+            referred_table,
+            [column],
+            [referred_column],
+        )
+    for name, columns, where in INDEXES:
+        op.create_index(
+            name,
+            "test_history",
+            columns,
+            postgresql_where=sa.text(where) if where else None,
+        )
+
+
+def upgrade():
+    # The partition key cannot be null. Tests reported without a start are
+    # given the start of their run.
+    op.execute(
+        "UPDATE test_history SET start_datetime = COALESCE("
+        "(SELECT test_run.start_datetime FROM test_run "
+        "WHERE test_run.id = test_history.test_run_id), "
+        "test_history.end_datetime, now()) "
+        "WHERE start_datetime IS NULL"
+    )
+    op.alter_column("test_history", "start_datetime", nullable=False)
+
+    replace_test_history(partitioned=True)
+
+
+def downgrade():
+    # Rows of detached partitions are not brought back
+    replace_test_history(partitioned=False)
+
+    op.alter_column("test_history", "start_datetime", nullable=True)
@@ -0,0 +1,32 @@
+"""launch and test run versions
+
+Revision ID: a3c09d41e7b2
+Revises: 117e5f7f4a5d
+Create Date: 2026-10-17 20:02:47.530916
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a3c09d41e7b2"
+down_revision = "117e5f7f4a5d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "launch",
+        sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "test_run",
+        sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_column("test_run", "version")
+    op.drop_column("launch", "version")
@@ -0,0 +1,55 @@
+"""slotted test run and project versions
+
+Revision ID: b5d2f8e1c93a
+Revises: 4f6a0d3b8e21
+Create Date: 2026-10-18 10:14:36.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b5d2f8e1c93a"
+down_revision = "4f6a0d3b8e21"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "test_run_counts",
+        sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.create_table(
+        "project_version",
+        sa.Column("project_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("slot", sa.SmallInteger(), autoincrement=False, nullable=False),
+        sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+        sa.ForeignKeyConstraint(["project_id"], ["project.id"]),
+        sa.PrimaryKeyConstraint("project_id", "slot"),
+    )
+
+    # Run versions move to the counter slots, carried over into slot 0 so
+    # they keep growing
+    op.execute(
+        "INSERT INTO test_run_counts (test_run_id, slot, version) "
+        "SELECT id, 0, version FROM test_run "
+        "ON CONFLICT (test_run_id, slot) DO UPDATE "
+        "SET version = test_run_counts.version + excluded.version"
+    )
+    op.drop_column("test_run", "version")
+
+
+def downgrade():
+    op.add_column(
+        "test_run",
+        sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.execute(
+        "UPDATE test_run SET version = counts.version FROM ("
+        "SELECT test_run_id, sum(version) AS version FROM test_run_counts "
+        "GROUP BY test_run_id) AS counts WHERE test_run.id = counts.test_run_id"
+    )
+    op.drop_table("project_version")
+    op.drop_column("test_run_counts", "version")
@@ -0,0 +1,40 @@
+"""test identity by suite and name hash
+
+Revision ID: d81f4a6c2b97
+Revises: 5c2e8b9d0f14
+Create Date: 2026-10-17 20:38:52.117408
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d81f4a6c2b97"
+down_revision = "5c2e8b9d0f14"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("test", sa.Column("name_hash", sa.String(length=32), nullable=True))
+    # Same value as crud.test_name_hash
+    op.execute("UPDATE test SET name_hash = md5(name)")
+    op.alter_column("test", "name_hash", nullable=False)
+
+    # The unique index leads with test_suite_id, so it also serves the
+    # lookups by suite
+    op.drop_constraint("uq_test_name_test_suite_id", "test", type_="unique")
+    op.drop_index("ix_test_test_suite_id", table_name="test")
+    op.create_unique_constraint(
+        "uq_test_test_suite_id_name_hash", "test", ["test_suite_id", "name_hash"]
+    )
+
+
+def downgrade():
+    op.drop_constraint("uq_test_test_suite_id_name_hash", "test", type_="unique")
+    op.create_index("ix_test_test_suite_id", "test", ["test_suite_id"])
+    op.create_unique_constraint(
+        "uq_test_name_test_suite_id", "test", ["name", "test_suite_id"]
+    )
+    op.drop_column("test", "name_hash")
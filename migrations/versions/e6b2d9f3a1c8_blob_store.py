@@ -0,0 +1,180 @@
+"""content addressed storage for traces and messages
+
+Revision ID: e6b2d9f3a1c8
+Revises: d81f4a6c2b97
+Create Date: 2026-10-17 21:02:37.845913
+
+"""
+import hashlib
+import zlib
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "e6b2d9f3a1c8"
+down_revision = "d81f4a6c2b97"
+branch_labels = None
+depends_on = None
+
+# Test history rows moved per statement
+BATCH_SIZE = 5000
+
+blob = sa.table(
+    "blob",
+    sa.column("hash", sa.String),
+    sa.column("payload", sa.LargeBinary),
+    sa.column("size", sa.Integer),
+)
+
+test_history = sa.table(
+    "test_history",
+    sa.column("id", sa.Integer),
+    sa.column("trace", sa.String),
+    sa.column("message", sa.String),
+    sa.column("trace_hash", sa.String),
+    sa.column("message_hash", sa.String),
+)
+
+
+def batches(connection, query):
+    # Walks test history by id so each batch is an index range scan
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            query.where(test_history.c.id > last_id)
+            .order_by(test_history.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    op.create_table(
+        "blob",
+        sa.Column("hash", sa.String(length=64), nullable=False),
+        sa.Column("payload", sa.LargeBinary(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("hash"),
+    )
+    op.add_column(
+        "test_history", sa.Column("trace_hash", sa.String(length=64), nullable=True)
+    )
+    op.add_column(
+        "test_history", sa.Column("message_hash", sa.String(length=64), nullable=True)
+    )
+
+    # Same encoding as data.blobs.Blobs.store
+    connection = op.get_bind()
+    query = sa.select(
+        [test_history.c.id, test_history.c.trace, test_history.c.message]
+    ).where(
+        sa.or_(test_history.c.trace.isnot(None), test_history.c.message.isnot(None))
+    )
+    for rows in batches(connection, query):
+        blobs = {}
+        updates = []
+        for test_history_id, trace, message in rows:
+            keys = []
+            for text in (trace, message):
+                if text is None:
+                    keys.append(None)
+                    continue
+                data = text.encode("utf-8")
+                keys.append(hashlib.sha256(data).hexdigest())
+                blobs[keys[-1]] = data
+            updates.append(
+                {"b_id": test_history_id, "b_trace": keys[0], "b_message": keys[1]}
+            )
+
+        connection.execute(
+            postgresql.insert(blob)
+            .values(
+                [
+                    {"hash": key, "payload": zlib.compress(data), "size": len(data)}
+                    for key, data in sorted(blobs.items())
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=["hash"])
+        )
+        connection.execute(
+            test_history.update()
+            .where(test_history.c.id == sa.bindparam("b_id"))
+            .values(
+                trace_hash=sa.bindparam("b_trace"),
+                message_hash=sa.bindparam("b_message"),
+            ),
+            updates,
+        )
+
+    op.create_foreign_key(
+        "test_history_trace_hash_fkey", "test_history", "blob", ["trace_hash"], ["hash"]
+    )
+    op.create_foreign_key(
+        "test_history_message_hash_fkey",
+        "test_history",
+        "blob",
+        ["message_hash"],
+        ["hash"],
+    )
+    op.drop_column("test_history", "trace")
+    op.drop_column("test_history", "message")
+
+
+def downgrade():
+    op.add_column("test_history", sa.Column("trace", sa.String(), nullable=True))
+    op.add_column(
+        "test_history", sa.Column("message", sa.String(length=2000), nullable=True)
+    )
+
+    connection = op.get_bind()
+    trace_blob = blob.alias("trace_blob")
+    message_blob = blob.alias("message_blob")
+    query = (
+        sa.select([test_history.c.id, trace_blob.c.payload, message_blob.c.payload])
+        .select_from(
+            test_history.outerjoin(
+                trace_blob, trace_blob.c.hash == test_history.c.trace_hash
+            ).outerjoin(
+                message_blob, message_blob.c.hash == test_history.c.message_hash
+            )
+        )
+        .where(
+            sa.or_(
+                test_history.c.trace_hash.isnot(None),
+                test_history.c.message_hash.isnot(None),
+            )
+        )
+    )
+    for rows in batches(connection, query):
+        connection.execute(
+            test_history.update()
+            .where(test_history.c.id == sa.bindparam("b_id"))
+            .values(trace=sa.bindparam("b_trace"), message=sa.bindparam("b_message")),
+            [
+                {
+                    "b_id": test_history_id,
+                    "b_trace": zlib.decompress(trace).decode("utf-8")
+                    if trace is not None
+                    else None,
+                    "b_message": zlib.decompress(message).decode("utf-8")
+                    if message is not None
+                    else None,
+                }
+                for test_history_id, trace, message in rows
+            ],
+        )
+
+    op.drop_constraint(
+        "test_history_message_hash_fkey", "test_history", type_="foreignkey"
+    )
+    op.drop_constraint(
+        "test_history_trace_hash_fkey", "test_history", type_="foreignkey"
+    )
+    op.drop_column("test_history", "message_hash")
+    op.drop_column("test_history", "trace_hash")
+    op.drop_table("blob")
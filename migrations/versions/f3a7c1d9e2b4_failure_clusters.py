@@ -0,0 +1,79 @@
+"""failure fingerprints and clusters
+
+Revision ID: f3a7c1d9e2b4
+Revises: e6b2d9f3a1c8
+Create Date: 2026-10-17 21:48:13.402751
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f3a7c1d9e2b4"
+down_revision = "e6b2d9f3a1c8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "test_history", sa.Column("fingerprint", sa.String(length=32), nullable=True)
+    )
+    op.create_table(
+        "failure_cluster",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("project_id", sa.Integer(), nullable=False),
+        sa.Column("fingerprint", sa.String(length=32), nullable=False),
+        sa.Column("error_type", sa.String(length=2000), nullable=True),
+        sa.Column("message_hash", sa.String(length=64), nullable=True),
+        sa.Column("failures", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("tests", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("first_seen", sa.DateTime(), nullable=False),
+        sa.Column("last_seen", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["project_id"], ["project.id"]),
+        sa.ForeignKeyConstraint(["message_hash"], ["blob.hash"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "project_id",
+            "fingerprint",
+            name="uq_failure_cluster_project_id_fingerprint",
+        ),
+    )
+    op.create_index(
+        "ix_failure_cluster_project_id_id", "failure_cluster", ["project_id", "id"]
+    )
+    op.create_table(
+        "failure_cluster_test",
+        sa.Column("failure_cluster_id", sa.Integer(), nullable=False),
+        sa.Column("test_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["failure_cluster_id"], ["failure_cluster.id"]),
+        sa.ForeignKeyConstraint(["test_id"], ["test.id"]),
+        sa.PrimaryKeyConstraint("failure_cluster_id", "test_id"),
+    )
+
+    # Only failures are fingerprinted, so the partial index stays a small
+    # part of test history. CREATE INDEX CONCURRENTLY does not lock out
+    # writers but cannot run inside a transaction.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_test_history_test_run_id_fingerprint",
+            "test_history",
+            ["test_run_id", "fingerprint", "test_id"],
+            postgresql_concurrently=True,
+            postgresql_where=sa.text("fingerprint IS NOT NULL"),
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_test_history_test_run_id_fingerprint",
+            table_name="test_history",
+            postgresql_concurrently=True,
+        )
+
+    op.drop_table("failure_cluster_test")
+    op.drop_index("ix_failure_cluster_project_id_id", table_name="failure_cluster")
+    op.drop_table("failure_cluster")
+    op.drop_column("test_history", "fingerprint")
@@ -34,6 +34,7 @@ class ProjectStatus(db.Model):
 
 class Launch(db.Model):
     __tablename__ = "launch"
+    __table_args__ = (db.Index("ix_launch_project_id_id", "project_id", "id"),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
@@ -46,6 +47,7 @@ class Launch(db.Model):
     )
     project_id = db.Column(db.Integer, db.ForeignKey("project.id"), nullable=False)
     project = db.relationship("Project", backref=db.backref("project", lazy=True))
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     def __repr__(self):
         return "<Launch {}>".format(self.name)
@@ -63,6 +65,14 @@ class LaunchStatus(db.Model):
 
 class TestRun(db.Model):
     __tablename__ = "test_run"
+    __table_args__ = (
+        db.Index("ix_test_run_launch_id_id", "launch_id", "id"),
+        db.Index(
+            "ix_test_run_launch_id_failed",
+            "launch_id",
+            postgresql_where=db.text("test_run_status_id = 1"),
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     data = db.Column(db.JSON)
@@ -94,6 +104,14 @@ class TestRunStatus(db.Model):
 
 class TestSuite(db.Model):
     __tablename__ = "test_suite"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "name",
+            "project_id",
+            "test_type",
+            name="uq_test_suite_name_project_id_test_type",
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -104,6 +122,13 @@ class TestSuite(db.Model):
 
 class TestSuiteHistory(db.Model):
     __tablename__ = "test_suite_history"
+    __table_args__ = (
+        db.Index(
+            "ix_test_suite_history_test_run_id_test_suite_status_id",
+            "test_run_id",
+            "test_suite_status_id",
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     data = db.Column(db.JSON)
@@ -137,9 +162,15 @@ class TestSuiteStatus(db.Model):
 
 class Test(db.Model):
     __tablename__ = "test"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "test_suite_id", "name_hash", name="uq_test_test_suite_id_name_hash"
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(300), nullable=False)
+    name_hash = db.Column(db.String(32), nullable=False)
     data = db.Column(db.JSON)
     test_suite_id = db.Column(
         db.Integer, db.ForeignKey("test_suite.id"), nullable=False
@@ -151,15 +182,48 @@ class Test(db.Model):
 
 class TestHistory(db.Model):
     __tablename__ = "test_history"
+    __table_args__ = (
+        db.Index("ix_test_history_test_id", "test_id"),
+        db.Index(
+            "ix_test_history_test_run_id_test_suite_history_id",
+            "test_run_id",
+            "test_suite_history_id",
+        ),
+        db.Index(
+            "ix_test_history_test_run_id_test_status_id",
+            "test_run_id",
+            "test_status_id",
+        ),
+        db.Index("ix_test_history_test_status_id_id", "test_status_id", "id"),
+        db.Index(
+            "ix_test_history_test_resolution_id_id",
+            "test_resolution_id",
+            "id",
+            postgresql_where=db.text("test_resolution_id <> 1"),
+        ),
+        db.Index(
+            "ix_test_history_test_run_id_fingerprint",
+            "test_run_id",
+            "fingerprint",
+            "test_id",
+            postgresql_where=db.text("fingerprint IS NOT NULL"),
+        ),
+        # Monthly partitions on start_datetime, maintained by the
+        # maintain_partitions command. The partition key has to be part of
+        # the primary key, while rows are still identified by id alone.
+        db.PrimaryKeyConstraint("id", "start_datetime"),
+        {"postgresql_partition_by": "RANGE (start_datetime)"},
+    )
 
-    id = db.Column(db.Integer, primary_key=True)
-    start_datetime = db.Column(db.DateTime)
+    id = db.Column(db.Integer, autoincrement=True)
+    start_datetime = db.Column(db.DateTime, nullable=False)
     end_datetime = db.Column(db.DateTime)
-    trace = db.Column(db.String)
+    trace_hash = db.Column(db.String(64), db.ForeignKey("blob.hash"))
     file = db.Column(db.String(2000))
-    message = db.Column(db.String(2000))
+    message_hash = db.Column(db.String(64), db.ForeignKey("blob.hash"))
     error_type = db.Column(db.String(2000))
     retries = db.Column(db.Integer)
+    fingerprint = db.Column(db.String(32))
     test_id = db.Column(db.Integer, db.ForeignKey("test.id"), nullable=False)
     test = db.relationship("Test", backref=db.backref("test", lazy=True))
     test_status_id = db.Column(
@@ -179,10 +243,197 @@ class TestHistory(db.Model):
         db.Integer, db.ForeignKey("test_suite_history.id"), nullable=False
     )
 
+    __mapper_args__ = {"primary_key": [id]}
+
     def __repr__(self):
         return "<TestHistory {}>".format(self.id)
 
 
+class TestRunCounts(db.Model):
+    __tablename__ = "test_run_counts"
+
+    test_run_id = db.Column(
+        db.Integer, db.ForeignKey("test_run.id"), primary_key=True, autoincrement=False
+    )
+    slot = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+    failed_tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+    passed_tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+    running_tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+    incomplete_tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+    skipped_tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+    # Writes to the run counted in this slot, summed into the run version
+    version = db.Column(db.Integer, nullable=False, server_default="0")
+
+    def __repr__(self):
+        return "<TestRunCounts {} {}>".format(self.test_run_id, self.slot)
+
+
+class TestSuiteHistoryCounts(db.Model):
+    __tablename__ = "test_suite_history_counts"
+
+    test_suite_history_id = db.Column(
+        db.Integer,
+        db.ForeignKey("test_suite_history.id"),
+        primary_key=True,
+        autoincrement=False,
+    )
+    slot = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+    failed_tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+    passed_tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+    running_tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+    incomplete_tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+    skipped_tests_count = db.Column(db.Integer, nullable=False, server_default="0")
+
+    def __repr__(self):
+        return "<TestSuiteHistoryCounts {} {}>".format(
+            self.test_suite_history_id, self.slot
+        )
+
+
+class ProjectVersion(db.Model):
+    __tablename__ = "project_version"
+
+    # Writes to the launches and test runs of a project, spread over the same
+    # slots as the test run counters and summed into the project version
+    project_id = db.Column(
+        db.Integer, db.ForeignKey("project.id"), primary_key=True, autoincrement=False
+    )
+    slot = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, server_default="0")
+
+    def __repr__(self):
+        return "<ProjectVersion {} {}>".format(self.project_id, self.slot)
+
+
+class TestRunSnapshot(db.Model):
+    __tablename__ = "test_run_snapshot"
+
+    test_run_id = db.Column(
+        db.Integer, db.ForeignKey("test_run.id"), primary_key=True, autoincrement=False
+    )
+    payload = db.Column(db.LargeBinary, nullable=False)
+    created_datetime = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return "<TestRunSnapshot {}>".format(self.test_run_id)
+
+
+class ArchivedTestRun(db.Model):
+    __tablename__ = "archived_test_run"
+
+    # Test runs moved out of the database into the archive file of their
+    # launch, the run itself is gone so there is no foreign key to it
+    test_run_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    launch_id = db.Column(db.Integer, db.ForeignKey("launch.id"), nullable=False)
+    archived_datetime = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return "<ArchivedTestRun {}>".format(self.test_run_id)
+
+
+class Blob(db.Model):
+    __tablename__ = "blob"
+
+    hash = db.Column(db.String(64), primary_key=True)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return "<Blob {}>".format(self.hash)
+
+
+class FailureCluster(db.Model):
+    __tablename__ = "failure_cluster"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "project_id",
+            "fingerprint",
+            name="uq_failure_cluster_project_id_fingerprint",
+        ),
+        db.Index("ix_failure_cluster_project_id_id", "project_id", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey("project.id"), nullable=False)
+    fingerprint = db.Column(db.String(32), nullable=False)
+    error_type = db.Column(db.String(2000))
+    message_hash = db.Column(db.String(64), db.ForeignKey("blob.hash"))
+    failures = db.Column(db.Integer, nullable=False, server_default="0")
+    tests = db.Column(db.Integer, nullable=False, server_default="0")
+    first_seen = db.Column(db.DateTime, nullable=False)
+    last_seen = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return "<FailureCluster {}>".format(self.fingerprint)
+
+
+class FailureClusterTest(db.Model):
+    __tablename__ = "failure_cluster_test"
+
+    failure_cluster_id = db.Column(
+        db.Integer,
+        db.ForeignKey("failure_cluster.id"),
+        primary_key=True,
+        autoincrement=False,
+    )
+    test_id = db.Column(
+        db.Integer, db.ForeignKey("test.id"), primary_key=True, autoincrement=False
+    )
+
+    def __repr__(self):
+        return "<FailureClusterTest {} {}>".format(
+            self.failure_cluster_id, self.test_id
+        )
+
+
+class TestFlakyStats(db.Model):
+    __tablename__ = "test_flaky_stats"
+    __table_args__ = (
+        db.Index("ix_test_flaky_stats_project_id_flakiness", "project_id", "flakiness"),
+    )
+
+    test_id = db.Column(
+        db.Integer, db.ForeignKey("test.id"), primary_key=True, autoincrement=False
+    )
+    project_id = db.Column(db.Integer, db.ForeignKey("project.id"), nullable=False)
+    outcomes = db.Column(db.BigInteger, nullable=False, server_default="0")
+    retried = db.Column(db.BigInteger, nullable=False, server_default="0")
+    runs = db.Column(db.Integer, nullable=False, server_default="0")
+    flips = db.Column(db.Integer, nullable=False, server_default="0")
+    flakiness = db.Column(db.Float, nullable=False, server_default="0")
+    updated_datetime = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return "<TestFlakyStats {}>".format(self.test_id)
+
+
+class TestDurationSketch(db.Model):
+    __tablename__ = "test_duration_sketch"
+    __table_args__ = (
+        db.Index("ix_test_duration_sketch_project_id_p95", "project_id", "p95"),
+        db.Index("ix_test_duration_sketch_test_suite_id", "test_suite_id"),
+    )
+
+    test_id = db.Column(
+        db.Integer, db.ForeignKey("test.id"), primary_key=True, autoincrement=False
+    )
+    test_suite_id = db.Column(
+        db.Integer, db.ForeignKey("test_suite.id"), nullable=False
+    )
+    project_id = db.Column(db.Integer, db.ForeignKey("project.id"), nullable=False)
+    sketch = db.Column(db.LargeBinary)
+    count = db.Column(db.Integer, nullable=False, server_default="0")
+    p50 = db.Column(db.Float)
+    p95 = db.Column(db.Float)
+    p99 = db.Column(db.Float)
+    updated_datetime = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return "<TestDurationSketch {}>".format(self.test_id)
+
+
 class TestStatus(db.Model):
     __tablename__ = "test_status"
 
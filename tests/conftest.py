@@ -0,0 +1,172 @@
+"""Tests run the app against the database of TEST_DATABASE_URL, which is
+dropped and recreated, so point it at a scratch PostgreSQL database:
+
+    TEST_DATABASE_URL=postgresql://localhost/delta_test python -m pytest tests
+"""
+import contextlib
+import datetime
+import os
+import sys
+import uuid
+import pytest
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+# The app needs a database URL to be imported, without TEST_DATABASE_URL the
+# tests are skipped before anything connects to it
+os.environ["APP_SETTINGS"] = "config.TestingConfig"
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL or "sqlite://"
+os.environ.pop("DATABASE_REPLICA_URLS", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db  # noqa: E402
+from data import crud  # noqa: E402
+from data.lookups import LOOKUP_MODELS  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        # The lookup tables get seeded on create with rows that do not match
+        # the ids of constants.Constants, initial_setup writes the right ones.
+        # Every other table is still empty, so truncating them along is safe.
+        if db.engine.dialect.name == "postgresql":
+            # Migrations create the monthly partitions, tests need only one
+            db.session.execute(
+                "CREATE TABLE test_history_default PARTITION OF test_history DEFAULT"
+            )
+            db.session.execute(
+                "TRUNCATE {} RESTART IDENTITY CASCADE".format(
+                    ", ".join(model.__tablename__ for model in LOOKUP_MODELS.values())
+                )
+            )
+        else:
+            for model in LOOKUP_MODELS.values():
+                model.query.delete()
+        db.session.commit()
+        crud.Create.initialise_status_tables()
+        db.session.remove()
+
+    yield db
+
+
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def statements():
+    # Counts the statements sent to the database within the block
+    @contextlib.contextmanager
+    def count():
+        counted = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            counted.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield counted
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+    return count
+
+
+def post(client, url, body, method="post"):
+    resp = getattr(client, method)(url, json=body)
+    assert resp.status_code == 200, resp.get_json()
+
+    return resp.get_json()
+
+
+def finish(client, ids):
+    # Closes a test run reported by the test_run fixture, and its launch
+    post(
+        client,
+        "/api/v1/test_run",
+        {
+            "test_run_id": ids["test_run_id"],
+            "end_datetime": datetime.datetime.now().isoformat(),
+            "test_run_status": "Failed",
+        },
+        method="put",
+    )
+    post(client, "/api/v1/finish_launch", {"launch_id": ids["launch_id"]}, "put")
+
+
+@pytest.fixture
+def test_run(client):
+    # Reports a test run of the given tests through the API, statuses by test
+    # index, tests without a status are left running
+    def report(tests, statuses=None, project=None):
+        now = datetime.datetime.now().isoformat()
+        name = uuid.uuid4().hex
+        project = project or name
+        launch_id = post(client, "/api/v1/launch", {"name": name, "project": project})[
+            "id"
+        ]
+        test_run_id = post(
+            client,
+            "/api/v1/test_run",
+            {"launch_id": launch_id, "test_type": "unit", "start_datetime": now},
+        )["id"]
+        suite = post(
+            client,
+            "/api/v1/test_suite_history",
+            {
+                "name": name,
+                "project": project,
+                "test_type": "unit",
+                "test_run_id": test_run_id,
+                "start_datetime": now,
+            },
+        )
+        test_histories = post(
+            client,
+            "/api/v1/test_history/bulk",
+            {
+                "test_run_id": test_run_id,
+                "test_suite_history_id": suite["test_suite_history_id"],
+                "test_suite_id": suite["test_suite_id"],
+                "tests": [
+                    {"name": "test {}".format(index), "start_datetime": now}
+                    for index in range(tests)
+                ],
+            },
+        )["test_histories"]
+        for index, status in (statuses or {}).items():
+            post(
+                client,
+                "/api/v1/test_history",
+                {
+                    "test_history_id": test_histories[index]["test_history_id"],
+                    "end_datetime": datetime.datetime.now().isoformat(),
+                    "trace": "trace {}".format(index),
+                    "file": "test.py",
+                    "message": "message {}".format(index),
+                    "error_type": "AssertionError",
+                    "retries": 0,
+                    "test_status": status,
+                },
+                method="put",
+            )
+
+        return {
+            "project_id": post(client, "/api/v1/project", {"name": project})["id"],
+            "launch_id": launch_id,
+            "test_run_id": test_run_id,
+            "test_suite_id": suite["test_suite_id"],
+            "test_suite_history_id": suite["test_suite_history_id"],
+            "test_histories": test_histories,
+        }
+
+    return report
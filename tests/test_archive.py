@@ -0,0 +1,94 @@
+import datetime
+import models
+import pytest
+from app import app
+from conftest import finish
+from data.archive import Archive
+from sqlalchemy import exc
+
+
+@pytest.fixture
+def finished(client, test_run, tmp_path, monkeypatch):
+    # A finished launch of one run of 3 tests, one of them failed
+    monkeypatch.setitem(app.config, "ARCHIVE_PATH", str(tmp_path))
+    ids = test_run(3, {0: "Passed", 1: "Failed", 2: "Passed"})
+    finish(client, ids)
+
+    return ids
+
+
+@pytest.fixture
+def archived(finished):
+    # The finished launch, moved to the archive
+    with app.app_context():
+        archived = Archive.archive(datetime.datetime.now() + datetime.timedelta(1))
+    assert finished["launch_id"] in archived
+
+    return finished
+
+
+def test_test_runs_of_archived_launch(client, archived):
+    resp = client.get("/api/v1/test_run/launch/{launch_id}".format(**archived))
+
+    assert resp.status_code == 200
+    (test_run,) = resp.get_json()
+    assert test_run["test_run_id"] == archived["test_run_id"]
+    assert test_run["tests_total"] == 3
+    assert test_run["tests_failed"] == 1
+    assert test_run["tests_passed"] == 2
+
+
+def test_archived_launch_stays_in_project_feed(client, archived):
+    resp = client.get("/api/v1/launch/project/{project_id}".format(**archived))
+
+    assert resp.status_code == 200
+    (launch,) = resp.get_json()
+    assert launch["launch_id"] == archived["launch_id"]
+    assert [stats["tests_total"] for stats in launch["test_run_stats"]] == [3]
+
+
+def test_resolution_of_archived_test_history(client, archived):
+    resp = client.put(
+        "/api/v1/test_history_resolution",
+        json={
+            "test_history_id": archived["test_histories"][1]["test_history_id"],
+            "test_resolution": "Test Issue",
+        },
+    )
+
+    assert resp.status_code == 404
+
+
+def test_archived_failures_leave_their_clusters(finished):
+    def failures():
+        return [
+            cluster.failures
+            for cluster in models.FailureCluster.query.filter_by(
+                project_id=finished["project_id"]
+            )
+        ]
+
+    with app.app_context():
+        assert failures() == [1]
+        Archive.archive(datetime.datetime.now() + datetime.timedelta(1))
+        assert failures() == []
+
+
+def test_interrupted_deletion_is_finished(client, finished, monkeypatch):
+    def interrupt(launch_id):
+        raise exc.OperationalError("DELETE", {}, Exception("interrupted"))
+
+    before = datetime.datetime.now() + datetime.timedelta(1)
+    with app.app_context():
+        with monkeypatch.context() as patched:
+            patched.setattr(Archive, "_delete_test_runs", interrupt)
+            assert Archive.archive(before) == [finished["launch_id"]]
+        assert models.TestRun.query.get(finished["test_run_id"]) is not None
+
+        # Already archived, its deletion is finished without archiving it again
+        assert Archive.archive(before) == []
+        assert models.TestRun.query.get(finished["test_run_id"]) is None
+
+    resp = client.get("/api/v1/test_run/launch/{launch_id}".format(**finished))
+    (test_run,) = resp.get_json()
+    assert test_run["tests_total"] == 3
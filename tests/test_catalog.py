@@ -0,0 +1,64 @@
+import models
+import uuid
+from app import app
+from conftest import post
+from data import crud
+
+
+def test_existing_project_is_recovered(client):
+    name = uuid.uuid4().hex
+
+    created = post(client, "/api/v1/project", {"name": name})
+    crud.catalog_cache.invalidate(("project", name))
+    recovered = post(client, "/api/v1/project", {"name": name})
+
+    assert created["message"] == "New project added successfully"
+    assert recovered["message"] == "Project recovered successfully"
+    assert recovered["id"] == created["id"]
+
+
+def test_bulk_reuses_existing_tests(client, test_run):
+    ids = test_run(2)
+    existing = [test_history["test_id"] for test_history in ids["test_histories"]]
+    crud.catalog_cache.clear()
+
+    test_histories = post(
+        client,
+        "/api/v1/test_history/bulk",
+        {
+            "test_run_id": ids["test_run_id"],
+            "test_suite_history_id": ids["test_suite_history_id"],
+            "test_suite_id": ids["test_suite_id"],
+            "tests": [{"name": "test 0"}, {"name": "test 1"}, {"name": "test 2"}],
+        },
+    )["test_histories"]
+
+    assert [test_history["test_id"] for test_history in test_histories[:2]] == existing
+    assert test_histories[2]["test_id"] not in existing
+
+
+def test_bulk_ids_match_their_tests(client, test_run):
+    ids = test_run(20)
+
+    with app.app_context():
+        for index, test_history in enumerate(ids["test_histories"]):
+            row = models.TestHistory.query.get(test_history["test_history_id"])
+            assert row.test_id == test_history["test_id"]
+            assert row.test.name == "test {}".format(index)
+            assert row.test_suite_history_id == ids["test_suite_history_id"]
+
+
+def test_existing_test_is_not_rewritten(client, test_run, statements):
+    ids = test_run(1)
+    crud.catalog_cache.clear()
+
+    with statements() as counted:
+        found = post(
+            client,
+            "/api/v1/test",
+            {"name": "test 0", "test_suite_id": ids["test_suite_id"]},
+        )
+
+    assert found["message"] == "Test is already present"
+    assert found["test_id"] == ids["test_histories"][0]["test_id"]
+    assert not any(statement.startswith("UPDATE") for statement in counted)
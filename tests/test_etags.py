@@ -0,0 +1,68 @@
+import datetime
+import pytest
+from conftest import post
+
+URLS = (
+    "/api/v1/launch/project/{project_id}",
+    "/api/v1/test_run/launch/{launch_id}",
+    "/api/v1/tests_history/test_run/{test_run_id}",
+)
+
+
+def etag(client, url):
+    resp = client.get(url)
+    assert resp.status_code == 200
+
+    return resp.headers["ETag"]
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_unchanged_report_is_not_modified(client, test_run, url):
+    url = url.format(**test_run(3))
+
+    resp = client.get(url, headers={"If-None-Match": etag(client, url)})
+
+    assert resp.status_code == 304
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_test_history_write_changes_etag(client, test_run, url):
+    ids = test_run(3)
+    url = url.format(**ids)
+    before = etag(client, url)
+
+    post(
+        client,
+        "/api/v1/test_history",
+        {
+            "test_history_id": ids["test_histories"][0]["test_history_id"],
+            "end_datetime": datetime.datetime.now().isoformat(),
+            "trace": None,
+            "file": None,
+            "message": None,
+            "error_type": None,
+            "retries": 0,
+            "test_status": "Passed",
+        },
+        method="put",
+    )
+
+    assert etag(client, url) != before
+
+
+def test_resolution_write_changes_etag(client, test_run):
+    ids = test_run(3, {0: "Failed"})
+    url = "/api/v1/tests_history/test_run/{test_run_id}".format(**ids)
+    before = etag(client, url)
+
+    post(
+        client,
+        "/api/v1/test_history_resolution",
+        {
+            "test_history_id": ids["test_histories"][0]["test_history_id"],
+            "test_resolution": "Test Issue",
+        },
+        method="put",
+    )
+
+    assert etag(client, url) != before
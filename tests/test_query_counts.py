@@ -0,0 +1,38 @@
+import pytest
+
+# Endpoints listing the rows of a run, each must send as many statements for a
+# large run as for a small one
+URLS = (
+    "/api/v1/launch/project/{project_id}",
+    "/api/v1/test_run/launch/{launch_id}",
+    "/api/v1/test_run/{test_run_id}",
+    "/api/v1/tests_suite_history/test_run/{test_run_id}",
+    "/api/v1/tests_history/test_run/{test_run_id}",
+    "/api/v1/tests_history/test_run/{test_run_id}?stream=true",
+    "/api/v1/tests_history/test_status/1/test_run/{test_run_id}",
+    "/api/v1/tests_history/test_suite/{test_suite_id}",
+)
+
+
+def statuses(tests):
+    return {
+        index: ("Failed", "Passed", "Skipped")[index % 3] for index in range(tests - 1)
+    }
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_statements_do_not_grow_with_rows(client, statements, test_run, url):
+    small = test_run(5, statuses(5))
+    large = test_run(50, statuses(50))
+
+    counts = []
+    for ids in (small, large):
+        # Lookup tables are loaded by the first request of the process
+        client.get(url.format(**ids))
+        with statements() as counted:
+            resp = client.get(url.format(**ids))
+            resp.get_data()
+        assert resp.status_code == 200
+        counts.append(len(counted))
+
+    assert counts[0] == counts[1]
@@ -0,0 +1,32 @@
+import pytest
+from app import app
+from conftest import finish
+from data import crud
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    # The test database doubles as a replica of itself, read through an
+    # engine of its own
+    monkeypatch.setitem(
+        app.config,
+        "SQLALCHEMY_BINDS",
+        {"replica_0": app.config["SQLALCHEMY_DATABASE_URI"]},
+    )
+
+
+def test_snapshot_is_built_from_the_primary(client, test_run, replica, statements):
+    ids = test_run(3, {0: "Passed", 1: "Failed", 2: "Passed"})
+    finish(client, ids)
+
+    with statements() as primary:
+        resp = client.get("/api/v1/tests_history/test_run/{test_run_id}".format(**ids))
+
+    assert resp.status_code == 200
+    # The run is read again from the primary before its snapshot is built
+    assert any(
+        statement.startswith("SELECT") and "test_history" in statement
+        for statement in primary
+    )
+    with app.app_context():
+        assert crud.Read.test_run_snapshot(ids["test_run_id"]) is not None
@@ -0,0 +1,83 @@
+import datetime
+import uuid
+from app import app
+from conftest import post
+
+
+def test_project_trend(client, test_run):
+    ids = test_run(4, {0: "Passed", 1: "Passed", 2: "Failed", 3: "Skipped"})
+
+    resp = client.get("/api/v1/analytics/project/{project_id}/trend".format(**ids))
+
+    assert resp.status_code == 200
+    trend = resp.get_json()
+    (launch,) = trend["launches"]
+    assert launch["launch_id"] == ids["launch_id"]
+    (day,) = trend["days"]
+    for row in (launch, day):
+        assert row["tests_total"] == 4
+        assert row["tests_passed"] == 2
+        assert row["tests_failed"] == 1
+        assert row["tests_skipped"] == 1
+        assert row["pass_rate"] == 0.5
+
+
+def test_project_trend_follows_writes(client, test_run):
+    ids = test_run(2, {0: "Passed"})
+    url = "/api/v1/analytics/project/{project_id}/trend".format(**ids)
+    assert client.get(url).get_json()["launches"][0]["tests_failed"] == 0
+
+    post(
+        client,
+        "/api/v1/test_history",
+        {
+            "test_history_id": ids["test_histories"][1]["test_history_id"],
+            "end_datetime": datetime.datetime.now().isoformat(),
+            "trace": None,
+            "file": "test.py",
+            "message": None,
+            "error_type": None,
+            "retries": 0,
+            "test_status": "Failed",
+        },
+        method="put",
+    )
+
+    assert client.get(url).get_json()["launches"][0]["tests_failed"] == 1
+
+
+def test_project_trend_is_one_statement(client, test_run, statements):
+    url = "/api/v1/analytics/project/{project_id}/trend".format(**test_run(2))
+
+    with statements() as counted:
+        assert client.get(url).status_code == 200
+
+    # The project version the trend is cached at, then the trend itself
+    assert len(counted) == 2
+
+
+def test_project_trend_skips_launches_without_runs(client, test_run, monkeypatch):
+    monkeypatch.setitem(app.config, "TREND_WINDOW", 1)
+    project = uuid.uuid4().hex
+    ids = test_run(2, {0: "Passed"}, project)
+    post(client, "/api/v1/launch", {"name": "empty", "project": project})
+
+    trend = client.get(
+        "/api/v1/analytics/project/{project_id}/trend?launches=1".format(**ids)
+    ).get_json()
+
+    assert [launch["launch_id"] for launch in trend["launches"]] == [ids["launch_id"]]
+
+
+def test_project_trend_range_includes_its_last_day(client, test_run):
+    ids = test_run(2, {0: "Passed"})
+    today = datetime.date.today().isoformat()
+
+    trend = client.get(
+        "/api/v1/analytics/project/{}/trend?from={}&to={}".format(
+            ids["project_id"], today, today
+        )
+    ).get_json()
+
+    assert [launch["launch_id"] for launch in trend["launches"]] == [ids["launch_id"]]
+    assert [day["date"] for day in trend["days"]] == [today]